@@ -0,0 +1,399 @@
+# archive.py
+"""
+Tiered storage: sessions idle for ARCHIVE_AFTER_DAYS leave chat_messages for
+one compressed blob per session in a separate archive database
+(ARCHIVE_DATABASE_URL, ./chat_archive.db by default), so the hot table, its
+indexes and the search index only hold sessions people still use.
+
+The session row stays behind as the sidebar stub (title, snippet, counters)
+with `archived` set. The first read (/api/history) or write (add_message,
+i.e. a new chat turn) of an archived session restores its messages with their
+original ids, so cursors and ETags held by clients stay valid, and sets
+`restored_at`: the archiver leaves a restored session alone for another
+ARCHIVE_AFTER_DAYS. Archived messages are found by /api/search once restored,
+and exported by bulk_transfer.py straight from the blob.
+
+A blob is orjson [[id, role, content, timestamp_ms, persona], ...] compressed
+with ARCHIVE_CODEC: zstd when the optional `zstandard` package is installed,
+zlib otherwise (lzma is also available); each blob records its codec.
+
+There is no transaction spanning the two databases. Archiving commits the
+blob before claiming the session and deleting its messages (so compression
+and the archive commit happen outside the shard's write lock), restoring
+inserts the messages before the blob is dropped, and otherwise blobs are only
+deleted by prune() once their session is gone, restored or was never claimed,
+so a crash at any point leaves at worst an extra blob.
+
+With sharded storage (database.py) each shard's idle sessions are archived in
+turn into the one archive database; blobs are keyed by session id, so they
+stay valid when shard_rebalance.py moves their session.
+
+    python archive.py run [--days 90] [--batch 200]    # one pass, e.g. from cron
+    python archive.py restore SESSION_ID
+    python archive.py stats
+"""
+import os
+import lzma
+import time
+import zlib
+import asyncio
+import argparse
+from datetime import timedelta
+from typing import Dict, List, Tuple
+
+import orjson
+from sqlalchemy import Column, Float, Integer, LargeBinary, String, create_engine, event, select, update, delete, \
+    func, column, table
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+
+from database import ChatSession, Shard, shards, shard_for, get_ist_now
+from metrics import report_error
+from search import merge_search_index
+
+try:
+    import zstandard  # optional: pip install zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_DATABASE_URL = os.getenv("ARCHIVE_DATABASE_URL", "sqlite:///./chat_archive.db")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "0"))  # idle days before archiving; 0 = no archiver
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))  # seconds between archiver passes
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "200"))  # sessions per transaction
+ARCHIVE_CODEC = os.getenv("ARCHIVE_CODEC", "zstd" if zstandard is not None else "zlib")
+ZSTD_LEVEL = 9
+PRUNE_GRACE_SECONDS = 3600  # never prune blobs younger than this (their archiving may not be committed yet)
+
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+if zstandard is not None:
+    # Compressor objects are not thread-safe; they are cheap to make per blob
+    CODECS["zstd"] = (lambda data: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data),
+                      lambda data: zstandard.ZstdDecompressor().decompress(data))
+if ARCHIVE_CODEC not in CODECS:
+    raise RuntimeError(f"Unknown or unavailable ARCHIVE_CODEC '{ARCHIVE_CODEC}' (use {', '.join(CODECS)})")
+
+# Message columns with their stored values (role/persona codes, epoch-ms timestamps):
+# blobs round-trip rows exactly, without the ORM conversions
+raw_messages = table(
+    "chat_messages", column("id"), column("session_key"), column("role"), column("content"),
+    column("timestamp"), column("persona"),
+)
+
+ArchiveBase = declarative_base()
+
+
+class SessionArchive(ArchiveBase):
+    """The archived messages of one session"""
+    __tablename__ = "session_archives"
+
+    session_id = Column(String, primary_key=True)
+    codec = Column(String, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)  # serialized size before compression
+    data = Column(LargeBinary, nullable=False)
+    archived_at = Column(Float, nullable=False)  # epoch seconds
+
+
+def _archive_engine():
+    if not ARCHIVE_DATABASE_URL.startswith("sqlite"):
+        return create_engine(ARCHIVE_DATABASE_URL, pool_pre_ping=True)
+    archive_engine = create_engine(ARCHIVE_DATABASE_URL, connect_args={"check_same_thread": False})
+
+    @event.listens_for(archive_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # Blobs are a few KB: on 4 KB pages most would fill a page alone (no-op once the file exists)
+        cursor.execute("PRAGMA page_size=16384")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+    return archive_engine
+
+
+archive_engine = _archive_engine()
+ArchiveSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=archive_engine)
+ArchiveBase.metadata.create_all(bind=archive_engine)
+
+
+def pack(rows: List[tuple], codec: str = ARCHIVE_CODEC) -> Tuple[bytes, int]:
+    """(compressed blob, serialized size) of raw message rows (id, role, content, timestamp, persona)"""
+    raw = orjson.dumps([list(row) for row in rows])
+    return CODECS[codec][0](raw), len(raw)
+
+
+def unpack(entry: SessionArchive) -> List[list]:
+    if entry.codec not in CODECS:
+        raise RuntimeError(f"Archive of {entry.session_id} uses codec '{entry.codec}', which is not installed")
+    return orjson.loads(CODECS[entry.codec][1](entry.data))
+
+
+def load_messages(session_id: str) -> List[list]:
+    """Archived [id, role, content, timestamp_ms, persona] rows of a session (empty if none)"""
+    with ArchiveSessionLocal() as adb:
+        entry = adb.get(SessionArchive, session_id)
+        return unpack(entry) if entry is not None else []
+
+
+# ---------- archiving ----------
+
+def archive_batch(shard: Shard, cutoff, batch: int = ARCHIVE_BATCH) -> Dict[str, int]:
+    """
+    Archive up to `batch` sessions of a shard whose last message and last restore are older than
+    `cutoff`. Candidates are read and their blobs compressed and committed without the shard's
+    write lock; the write transaction only claims the sessions that are unchanged since the read
+    and deletes their messages, so chat writes to the shard wait for that alone.
+    """
+    with shard.ReadSessionLocal() as db:
+        candidates = db.execute(
+            select(ChatSession.key, ChatSession.session_id, ChatSession.message_count)
+            .where(ChatSession.archived.is_(False), ChatSession.message_count > 0,
+                   ChatSession.last_message_time < cutoff,
+                   (ChatSession.restored_at.is_(None)) | (ChatSession.restored_at < cutoff))
+            .order_by(ChatSession.last_message_time)
+            .limit(batch)
+        ).all()
+        if not candidates:
+            return {"sessions": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+        rows_by_key = {candidate.key: [] for candidate in candidates}
+        for row in db.execute(
+            select(raw_messages.c.session_key, raw_messages.c.id, raw_messages.c.role, raw_messages.c.content,
+                   raw_messages.c.timestamp, raw_messages.c.persona)
+            .where(raw_messages.c.session_key.in_(list(rows_by_key)))
+            .order_by(raw_messages.c.session_key, raw_messages.c.id)
+        ):
+            rows_by_key[row[0]].append(row[1:])
+
+    sizes = {}  # key -> (raw bytes, stored bytes)
+    now = time.time()
+    with ArchiveSessionLocal() as adb:
+        for candidate in candidates:
+            rows = rows_by_key[candidate.key]
+            data, raw_bytes = pack(rows)
+            # merge: a blob left from an earlier archiving (since restored) is out of date
+            adb.merge(SessionArchive(session_id=candidate.session_id, codec=ARCHIVE_CODEC, message_count=len(rows),
+                                     raw_bytes=raw_bytes, data=data, archived_at=now))
+            sizes[candidate.key] = (raw_bytes, len(data))
+        adb.commit()
+
+    with shard.SessionLocal() as db:
+        # A session that got a message (or was cleared) since the read keeps its messages; its
+        # unused blob is removed by prune()
+        claimed = set()
+        for candidate in candidates:
+            if db.execute(
+                update(ChatSession)
+                .where(ChatSession.key == candidate.key, ChatSession.archived.is_(False),
+                       ChatSession.message_count == candidate.message_count)
+                .values(archived=True)
+            ).rowcount:
+                claimed.add(candidate.key)
+        if claimed:
+            db.execute(delete(raw_messages).where(raw_messages.c.session_key.in_(list(claimed))))
+        db.commit()
+
+    stats = {"sessions": len(claimed), "messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+    for key in claimed:
+        stats["messages"] += len(rows_by_key[key])
+        stats["raw_bytes"] += sizes[key][0]
+        stats["stored_bytes"] += sizes[key][1]
+    return stats
+
+
+def archive_idle(days: float = ARCHIVE_AFTER_DAYS, batch: int = ARCHIVE_BATCH, pause: float = 0.0,
+                 verbose: bool = False) -> Dict[str, int]:
+    """Archive every session idle for `days`, shard by shard, one short transaction per batch"""
+    cutoff = get_ist_now() - timedelta(days=days)
+    totals = {"sessions": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+    for shard in shards:
+        archived = 0
+        while True:
+            stats = archive_batch(shard, cutoff, batch)
+            for name, value in stats.items():
+                totals[name] += value
+            archived += stats["sessions"]
+            if verbose and stats["sessions"]:
+                print(f"  {totals['messages']} messages in {totals['sessions']} sessions")
+            if stats["sessions"] < batch:
+                break
+            if pause:
+                time.sleep(pause)  # leave the writer lock to live traffic between batches
+        if archived:
+            merge_search_index(engine=shard.engine)  # drop the archived messages' entries from the search index
+    return totals
+
+
+# ---------- restoring ----------
+
+def restore_session(db: Session, key: int, session_id: str, rows: List[list]) -> int:
+    """
+    Put a session's archived messages (`rows` from load_messages, read before the write
+    transaction so the blob's I/O and decompression do not hold the write lock) back into
+    chat_messages in the caller's write transaction (no-op unless it is archived).
+    Returns the number of messages restored.
+    """
+    claimed = db.execute(
+        update(ChatSession).where(ChatSession.key == key, ChatSession.archived.is_(True))
+        .values(archived=False, restored_at=get_ist_now())
+    ).rowcount
+    if not claimed:
+        return 0
+    if not rows:
+        print(f"⚠️ Session {session_id} was marked archived but has no archive entry")
+        return 0
+
+    ids = [row[0] for row in rows]
+    taken = any(
+        db.scalar(select(func.count()).select_from(raw_messages).where(raw_messages.c.id.in_(ids[i:i + 500])))
+        for i in range(0, len(ids), 500)
+    )
+    archived = [{"session_key": key, "role": role, "content": content, "timestamp": timestamp, "persona": persona}
+                for _, role, content, timestamp, persona in rows]
+    if not taken:
+        for values, message_id in zip(archived, ids):
+            values["id"] = message_id
+        db.execute(raw_messages.insert(), archived)
+        return len(rows)
+
+    # Some ids were reused after the archive was made (SQLite hands out max(id) + 1 again
+    # once the newest rows are deleted): give the archived messages new ids, and move the
+    # session's newer messages after them so the session stays in order
+    newer = [dict(row._mapping) for row in db.execute(
+        select(raw_messages.c.session_key, raw_messages.c.role, raw_messages.c.content,
+               raw_messages.c.timestamp, raw_messages.c.persona)
+        .where(raw_messages.c.session_key == key).order_by(raw_messages.c.id)
+    )]
+    db.execute(delete(raw_messages).where(raw_messages.c.session_key == key))
+    db.execute(raw_messages.insert(), archived + newer)
+    return len(rows)
+
+
+def restore(session_id: str) -> int:
+    """Restore an archived session in its own transaction; returns the number of messages restored"""
+    rows = load_messages(session_id)  # before the write transaction, like add_message's callers
+    with shard_for(session_id).SessionLocal() as db:
+        key = db.scalar(select(ChatSession.key).where(ChatSession.session_id == session_id,
+                                                      ChatSession.archived.is_(True)))
+        if key is None:
+            return 0
+        restored = restore_session(db, key, session_id, rows)
+        db.commit()
+    with ArchiveSessionLocal() as adb:
+        adb.execute(delete(SessionArchive).where(SessionArchive.session_id == session_id))
+        adb.commit()
+    return restored
+
+
+def prune(page: int = 500) -> int:
+    """Delete blobs of sessions that were deleted, restored or never claimed; returns how many were deleted"""
+    pruned = 0
+    after = ""
+    cutoff = time.time() - PRUNE_GRACE_SECONDS
+    while True:
+        with ArchiveSessionLocal() as adb:
+            session_ids = adb.scalars(
+                select(SessionArchive.session_id)
+                .where(SessionArchive.session_id > after, SessionArchive.archived_at < cutoff)
+                .order_by(SessionArchive.session_id).limit(page)
+            ).all()
+        if not session_ids:
+            return pruned
+        still_archived = set()
+        for shard in shards:
+            owned = [session_id for session_id in session_ids if shard_for(session_id) is shard]
+            if not owned:
+                continue
+            with shard.SessionLocal() as db:
+                still_archived.update(db.scalars(
+                    select(ChatSession.session_id)
+                    .where(ChatSession.session_id.in_(owned), ChatSession.archived.is_(True))
+                ))
+        stale = [session_id for session_id in session_ids if session_id not in still_archived]
+        if stale:
+            with ArchiveSessionLocal() as adb:
+                adb.execute(delete(SessionArchive).where(SessionArchive.session_id.in_(stale),
+                                                         SessionArchive.archived_at < cutoff))
+                adb.commit()
+            pruned += len(stale)
+        after = session_ids[-1]
+
+
+def stats() -> dict:
+    with ArchiveSessionLocal() as adb:
+        blobs, messages, raw_bytes, stored_bytes = adb.execute(select(
+            func.count(), func.coalesce(func.sum(SessionArchive.message_count), 0),
+            func.coalesce(func.sum(SessionArchive.raw_bytes), 0),
+            func.coalesce(func.sum(func.length(SessionArchive.data)), 0),
+        )).one()
+    archived = 0
+    for shard in shards:
+        with shard.SessionLocal() as db:
+            archived += db.scalar(select(func.count()).where(ChatSession.archived.is_(True)))
+    return {
+        "archived_sessions": archived,
+        "blobs": blobs,
+        "messages": messages,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "ratio": round(raw_bytes / stored_bytes, 2) if stored_bytes else None,
+    }
+
+
+class Archiver:
+    """Background archiving loop run by the API when ARCHIVE_AFTER_DAYS is set; safe in several processes"""
+
+    def __init__(self, days: float = ARCHIVE_AFTER_DAYS, interval: float = ARCHIVE_INTERVAL):
+        self.days = days
+        self.interval = interval
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    async def run(self):
+        while not self._stopping:
+            try:
+                # Short batches with a pause between them, so chat writes interleave
+                totals = await asyncio.to_thread(archive_idle, self.days, ARCHIVE_BATCH, 0.05)
+                pruned = await asyncio.to_thread(prune)
+                if totals["sessions"] or pruned:
+                    print(f"Archived {totals['sessions']} sessions ({totals['messages']} messages, "
+                          f"{totals['raw_bytes'] / 2**20:.1f} MB -> {totals['stored_bytes'] / 2**20:.1f} MB), "
+                          f"pruned {pruned} blobs")
+            except Exception:
+                report_error("archiver")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("run", help="archive idle sessions once and prune stale blobs")
+    p.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS or 90, help="idle days before archiving")
+    p.add_argument("--batch", type=int, default=ARCHIVE_BATCH, help="sessions per transaction")
+    p.add_argument("--pause", type=float, default=0.0, help="seconds between batches")
+    p = commands.add_parser("restore", help="restore one session now")
+    p.add_argument("session_id")
+    commands.add_parser("stats", help="archive size and compression ratio")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        start = time.perf_counter()
+        totals = archive_idle(args.days, args.batch, args.pause, verbose=True)
+        ratio = totals["raw_bytes"] / totals["stored_bytes"] if totals["stored_bytes"] else 0
+        print(f"Archived {totals['sessions']} sessions ({totals['messages']} messages, {ratio:.1f}x "
+              f"compression with {ARCHIVE_CODEC}) in {time.perf_counter() - start:.1f}s; pruned {prune()} blobs")
+    elif args.command == "restore":
+        print(f"Restored {restore(args.session_id)} messages")
+    else:
+        print(stats())
+
+
+if __name__ == "__main__":
+    main_cli()
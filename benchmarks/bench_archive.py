@@ -0,0 +1,146 @@
+# benchmarks/bench_archive.py
+"""
+Working set and latency before and after archiving cold sessions (archive.py).
+
+Seeds sessions with synthetic messages, of which a --hot fraction had a message
+today and the rest are months old, then measures with the whole history in
+chat_messages, archives the cold sessions and measures again:
+  - size of chat_messages, its index and the FTS5 search index, and of the
+    database file after VACUUM (the archive file is reported separately);
+  - p50/p99 of GET /api/history and POST /api/chat on hot sessions and of
+    GET /api/search (recent and ranked), in-process with the fake LLM;
+  - the first /api/history of an archived session (restore) vs a warm one.
+
+Usage:
+    python benchmarks/bench_archive.py --sessions 20000 --messages 40 --hot 0.05
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import importlib
+
+from loadtest import WORDS, insert_sessions, open_database, percentile
+
+
+def table_sizes(path):
+    """Bytes per group of tables/indexes (dbstat) and of the file, after VACUUM"""
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # in WAL mode the vacuumed pages land in the WAL first
+    sizes = {"messages": 0, "message index": 0, "search index": 0, "other": 0}
+    for name, size in conn.execute("SELECT name, sum(pgsize) FROM dbstat GROUP BY name"):
+        if name == "chat_messages":
+            sizes["messages"] += size
+        elif name.startswith("ix_chat_messages"):
+            sizes["message index"] += size
+        elif name.startswith("chat_messages_fts"):
+            sizes["search index"] += size
+        else:
+            sizes["other"] += size
+    conn.close()
+    sizes["file"] = os.path.getsize(path)
+    return sizes
+
+
+def timed(client, count, request):
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        response = request(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    return latencies
+
+
+def measure(client, hot, count, rng, label):
+    words = rng.sample(WORDS, 5)
+    results = {
+        "GET /api/history (hot)": timed(client, count, lambda i: client.get(
+            "/api/history", params={"session_id": rng.choice(hot), "limit": 50})),
+        "GET /api/search recent": timed(client, count, lambda i: client.get(
+            "/api/search", params={"q": words[i % 5], "sort": "recent"})),
+        "GET /api/search ranked": timed(client, count, lambda i: client.get(
+            "/api/search", params={"q": f"{words[i % 5]} {words[(i + 1) % 5]}"})),
+        "POST /api/chat (hot)": timed(client, count, lambda i: client.post(
+            "/api/chat", json={"session_id": rng.choice(hot), "message": f"{label} question {i}"})),
+    }
+    return {name: (percentile(values, 50), percentile(values, 99)) for name, values in results.items()}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--messages", type=int, default=40, help="messages per session")
+    parser.add_argument("--hot", type=float, default=0.05, help="fraction of sessions active today")
+    parser.add_argument("--requests", type=int, default=300, help="requests per endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = "0"
+    os.environ["FAKE_LLM_TOKENS_PER_SEC"] = str(10 ** 9)
+    os.environ["RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+    os.environ["SESSION_RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+    os.environ["SEARCH_RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+    os.environ["TITLE_WORKER"] = "external"
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    conn = open_database()
+    insert_sessions(conn, ((f"s-{key}", key % 4 + 1, args.messages) for key in range(1, args.sessions + 1)), rng)
+    every = max(1, round(1 / args.hot))
+    conn.execute("UPDATE chat_sessions SET last_message_time = ? WHERE key % ? = 0", (int(time.time() * 1000), every))
+    conn.commit()
+    conn.close()
+    hot = [f"s-{key}" for key in range(every, args.sessions + 1, every)]
+    cold = [f"s-{key}" for key in range(1, args.sessions + 1) if key % every]
+    print(f"Seeded {args.sessions} sessions x {args.messages} messages ({len(hot)} hot) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    main = importlib.import_module("main")
+    import archive
+    from fastapi.testclient import TestClient
+
+    with TestClient(main.app) as client:
+        measure(client, hot, 50, rng, "warmup")
+        sizes_before = table_sizes("chat_history.db")
+        before = measure(client, hot, args.requests, rng, "before")
+
+        start = time.perf_counter()
+        totals = archive.archive_idle(days=30, batch=500)
+        archived_in = time.perf_counter() - start
+        sizes_after = table_sizes("chat_history.db")
+        measure(client, hot, 50, rng, "warmup2")
+        after = measure(client, hot, args.requests, rng, "after")
+
+        sample = rng.sample(cold, min(args.requests, len(cold)))
+        restores = timed(client, len(sample), lambda i: client.get(
+            "/api/history", params={"session_id": sample[i], "limit": 50}))
+        warm = timed(client, len(sample), lambda i: client.get(
+            "/api/history", params={"session_id": sample[i], "limit": 50}))
+
+    conn = sqlite3.connect("chat_archive.db")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    print(f"\nArchived {totals['sessions']} sessions / {totals['messages']} messages in {archived_in:.1f}s "
+          f"with {archive.ARCHIVE_CODEC}: {totals['raw_bytes'] / 2**20:.1f} MB -> "
+          f"{totals['stored_bytes'] / 2**20:.1f} MB ({totals['raw_bytes'] / max(1, totals['stored_bytes']):.1f}x); "
+          f"archive file {os.path.getsize('chat_archive.db') / 2**20:.1f} MB")
+    print(f"\n{'MB':<26}{'before':>10}{'after':>10}")
+    for name in sizes_before:
+        print(f"{name:<26}{sizes_before[name] / 2**20:>10.1f}{sizes_after[name] / 2**20:>10.1f}")
+    print(f"\n{'p50 / p99 ms':<26}{'before':>16}{'after':>16}")
+    for name in before:
+        print(f"{name:<26}{before[name][0]:>8.2f}/{before[name][1]:<7.2f}{after[name][0]:>8.2f}/{after[name][1]:<7.2f}")
+    print(f"\nGET /api/history of an archived session: first (restore) p50 {percentile(restores, 50):.2f} ms, "
+          f"p99 {percentile(restores, 99):.2f} ms; next p50 {percentile(warm, 50):.2f} ms")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main_cli()
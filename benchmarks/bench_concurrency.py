@@ -0,0 +1,92 @@
+# benchmarks/bench_concurrency.py
+"""
+Concurrency benchmark for /api/chat.
+
+Runs the app in-process against the fake LLM (LLM_BACKEND=fake) in a scratch
+directory, then measures /api/personas latency on its own and while a burst
+of chats is waiting on the upstream model. With a non-blocking chat path the
+p99 of the cheap endpoint should stay flat.
+
+Usage:
+    python benchmarks/bench_concurrency.py --chats 200 --latency 2.0
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def probe(client, count, interval):
+    """Hit /api/personas `count` times and return latencies in ms"""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        res = await client.get("/api/personas")
+        res.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def send_chat(client, i):
+    res = await client.post("/api/chat", json={
+        "session_id": f"bench-{i}",
+        "message": "hi",
+        "persona": "travel",
+    })
+    return res.status_code
+
+
+async def run(args):
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        idle = await probe(client, args.probes, args.interval)
+
+        started = time.perf_counter()
+        chats = asyncio.gather(*(send_chat(client, i) for i in range(args.chats)))
+        await asyncio.sleep(0.05)  # let the burst reach the upstream call
+        busy = await probe(client, args.probes, args.interval)
+        statuses = await chats
+        chat_wall = time.perf_counter() - started
+
+    ok = sum(1 for s in statuses if s == 200)
+    print(f"chats: {ok}/{args.chats} ok in {chat_wall:.2f}s (fake latency {args.latency}s)")
+    print(f"{'phase':<10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, lat in (("idle", idle), ("in-flight", busy)):
+        print(f"{name:<10}{percentile(lat, 50):>10.2f}{percentile(lat, 99):>10.2f}{max(lat):>10.2f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=200, help="concurrent chats in flight")
+    parser.add_argument("--latency", type=float, default=2.0, help="fake LLM latency in seconds")
+    parser.add_argument("--probes", type=int, default=100, help="probe requests per phase")
+    parser.add_argument("--interval", type=float, default=0.01, help="pause between probes")
+    args = parser.parse_args()
+
+    # Isolated environment: fake LLM and a throwaway chat_history.db
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(args.latency)
+    # The benchmark drives far more traffic than the per-client limit allows
+    os.environ["RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
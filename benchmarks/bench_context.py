@@ -0,0 +1,86 @@
+# benchmarks/bench_context.py
+"""
+Prompt size and chat latency versus conversation length: the legacy context
+(last 200 rows, whatever their size) against the token-budgeted window plus
+rolling summary.
+
+The fake LLM charges prompt processing time per history token
+(FAKE_LLM_PREFILL_TOKENS_PER_SEC) so prompt size shows up as latency.
+
+Usage:
+    python benchmarks/bench_context.py --lengths 10 50 200 1000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+
+USER_TEXT = "We are two adults on a mid-range budget, what should we do next in Goa? " * 2
+BOT_TEXT = ("Here are three ideas with timings, costs and an insider tip for each one, "
+            "plus a follow-up question about your travel style. ") * 8
+
+
+async def seed(database, session_id, length):
+    async with database.AsyncSessionLocal() as db:
+        for i in range(length):
+            role = "user" if i % 2 == 0 else "bot"
+            await db.run_sync(database.add_message, session_id, role, USER_TEXT if role == "user" else BOT_TEXT, "travel")
+        await db.commit()
+
+
+async def measure(database, main, context, session_id):
+    """Prompt tokens and upstream latency for one turn"""
+    async with database.AsyncReadSessionLocal() as db:
+        turn = await main.prepare_chat_turn(db, session_id, USER_TEXT, "travel")
+        # Let a summary update triggered by this turn finish before the next one
+        await asyncio.gather(*context._tasks)
+    tokens = context.history_tokens(turn["history"])
+    chat = main.get_model_for_persona("travel").start_chat(history=turn["history"])
+    start = time.perf_counter()
+    await chat.send_message_async(USER_TEXT)
+    return tokens, (time.perf_counter() - start) * 1000
+
+
+async def run(args):
+    import database
+    import context
+    import main
+
+    legacy_build_context = lambda db, session_id, history, total, budget: asyncio.sleep(0, history)
+    budgeted_build_context = main.build_context
+
+    print(f"{'messages':>9}{'legacy tok':>12}{'legacy ms':>11}{'budget tok':>12}{'budget ms':>11}")
+    for length in args.lengths:
+        results = []
+        for mode, builder in (("legacy", legacy_build_context), ("budget", budgeted_build_context)):
+            main.build_context = builder
+            main.history_cache.max_sessions = 0  # measure the DB path
+            session_id = f"{mode}-{length}"
+            await seed(database, session_id, length)
+            await measure(database, main, context, session_id)  # warm-up turn (triggers summarization)
+            results.append(await measure(database, main, context, session_id))
+        (lt, lms), (bt, bms) = results
+        print(f"{length:>9}{lt:>12}{lms:>11.0f}{bt:>12}{bms:>11.0f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument("--prefill", type=float, default=20000, help="fake prompt tokens processed per second")
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = "0.2"
+    os.environ["FAKE_LLM_TOKENS_PER_SEC"] = "1000"
+    os.environ["FAKE_LLM_PREFILL_TOKENS_PER_SEC"] = str(args.prefill)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,79 @@
+# benchmarks/bench_http_cache.py
+"""
+Polling cost of the read endpoints: full responses vs 304 Not Modified,
+identity vs compressed bodies, json vs orjson rendering.
+
+Seeds a throwaway database with one long conversation and N other
+sessions, then times repeated GET /api/history and /api/sessions through
+the ASGI app (in-process), first unconditionally and then revalidating
+with the ETag from the previous response, as a browser does.
+
+Usage:
+    python benchmarks/bench_http_cache.py --messages 2000 --sessions 10000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import importlib
+import statistics
+
+from bench_session_events import seed_sessions
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, result
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="messages in the polled conversation")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    database = importlib.import_module("database")  # creates the schema
+    seed_sessions("chat_history.db", args.sessions)
+    with database.SessionLocal() as db:
+        for i in range(args.messages):
+            role = "user" if i % 2 == 0 else "bot"
+            text = f"Message {i}: what are the best beaches, hostels and street food stalls near Panaji? " * 4
+            database.add_message(db, "bench-long", role, text, "travel")
+        db.commit()
+
+    main = importlib.import_module("main")
+    from fastapi.testclient import TestClient
+    from fastapi.encoders import jsonable_encoder
+    import orjson
+    client = TestClient(main.app)
+
+    history = {"session_id": "bench-long", "limit": 2000}
+    print(f"{'request':<44}{'ms':>8}{'bytes':>10}")
+    for name, path, params in [("history", "/api/history", history), ("sessions", "/api/sessions", None)]:
+        for encoding in ("identity", "gzip"):
+            headers = {"Accept-Encoding": encoding}
+            ms, response = timed(lambda: client.get(path, params=params, headers=headers), args.repeat)
+            print(f"{name + ' 200, ' + encoding:<44}{ms:>8.2f}{int(response.headers['content-length']):>10}")
+        headers = {"If-None-Match": response.headers["etag"]}
+        ms, response = timed(lambda: client.get(path, params=params, headers=headers), args.repeat)
+        print(f"{name + ' 304 (If-None-Match)':<44}{ms:>8.2f}{len(response.content):>10}")
+
+    # Rendering alone, for the same history payload
+    payload = client.get("/api/history", params=history).json()
+    std_ms, _ = timed(lambda: json.dumps(jsonable_encoder(payload)).encode(), args.repeat)
+    fast_ms, _ = timed(lambda: orjson.dumps(payload), args.repeat)
+    print(f"render {args.messages} messages: json {std_ms:.2f} ms, orjson {fast_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main_cli()
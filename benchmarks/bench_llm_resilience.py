@@ -0,0 +1,111 @@
+# benchmarks/bench_llm_resilience.py
+"""
+Tail latency and failures of LLM calls with and without the resilience layer.
+
+The fake provider answers in --latency seconds, but --stall-rate of calls
+hang for --stall seconds and --error-rate fail with a 503. --calls calls
+run --concurrency at a time, sent straight to the provider (as before),
+through ResilientLLM with deadlines and retries, and with hedging as well.
+A last run makes every call fail and times calls before and after the
+circuit breaker opens.
+
+Usage:
+    python benchmarks/bench_llm_resilience.py --calls 600 --stall-rate 0.03 --error-rate 0.05
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run_calls(call, calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                failures += 1
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return latencies, failures
+
+
+def report(name, latencies, failures, extra=""):
+    print(f"{name:<28} ok {len(latencies):>5}  failed {failures:>4}  p50 {percentile(latencies, 0.5) * 1000:>7.0f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:>7.0f} ms  max {max(latencies) * 1000:>7.0f} ms  {extra}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    parser.add_argument("--stall", type=float, default=5.0, help="seconds a stalled call hangs")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-attempt deadline")
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(args.latency)
+    os.environ["FAKE_LLM_TOKENS_PER_SEC"] = "1000"
+    os.environ["FAKE_LLM_STALL_RATE"] = str(args.stall_rate)
+    os.environ["FAKE_LLM_STALL_SECONDS"] = str(args.stall)
+    os.environ["FAKE_LLM_ERROR_RATE"] = str(args.error_rate)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import fake_llm
+    from llm_scheduler import LLMScheduler
+    from llm_resilience import ResilientLLM, CircuitBreaker
+
+    model = fake_llm.FakeGenerativeModel()
+    request = lambda: model.generate_content_async("Plan a weekend in Goa")  # noqa: E731
+
+    def resilient(hedge):
+        scheduler = LLMScheduler(initial_concurrency=64, max_concurrency=64)
+        # Breaker effectively off here: the injected errors are random, not an outage
+        return ResilientLLM(scheduler, call_timeout=args.timeout, total_timeout=args.timeout * 4, hedge=hedge,
+                            breaker=CircuitBreaker(failure_threshold=10 ** 6))
+
+    async def scenarios():
+        report("direct (no timeout)", *await run_calls(request, args.calls, args.concurrency))
+        for name, hedge in (("deadline + retries", False), ("deadline + retries + hedge", True)):
+            llm = resilient(hedge)
+            latencies, failures = await run_calls(lambda: llm.call(request), args.calls, args.concurrency)
+            stats = llm.stats()
+            report(name, latencies, failures, f"retries {stats['retries']} timeouts {stats['timeouts']} "
+                                              f"hedges {stats['hedges']} won {stats['hedges_won']}")
+
+        # Outage: every call fails; the breaker opens after 5 failures and later calls fail fast
+        fake_llm.FAKE_LLM_ERROR_RATE = 1.0
+        fake_llm.FAKE_LLM_STALL_RATE = 0.0
+        llm = ResilientLLM(LLMScheduler(), retries=0, breaker=CircuitBreaker(failure_threshold=5, reset_timeout=30))
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            try:
+                await llm.call(request)
+            except Exception:
+                pass
+            timings.append(time.perf_counter() - start)
+        print(f"outage: first 5 calls {sum(timings[:5]) / 5 * 1000:.0f} ms each, then "
+              f"{sum(timings[5:]) / 15 * 1000:.2f} ms each with the breaker {llm.breaker.state}")
+
+    asyncio.run(scenarios())
+
+
+if __name__ == "__main__":
+    main_cli()
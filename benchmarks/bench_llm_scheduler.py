@@ -0,0 +1,100 @@
+# benchmarks/bench_llm_scheduler.py
+"""
+Upstream admission control under a burst, against a throttling fake LLM.
+
+The fake provider serves at most --capacity calls at once and answers 429
+beyond that (FAKE_LLM_CAPACITY). A burst of interactive chat calls and
+background title calls arrives over --spread seconds, and is sent either
+straight to the provider (no limit, as before) or through LLMScheduler
+starting at --initial concurrency. Reports per priority: completed, 429s,
+503s (queue full / deadline), latency p50/p99, plus the scheduler's final
+adaptive limit.
+
+Usage:
+    python benchmarks/bench_llm_scheduler.py --capacity 8 --chats 300 --titles 100 --spread 3
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def burst(model, scheduler, chats, titles, spread, seed):
+    from llm_scheduler import LLMOverloaded, INTERACTIVE, BACKGROUND, is_throttled
+    rng = random.Random(seed)
+    results = {INTERACTIVE: [], BACKGROUND: []}  # (outcome, seconds)
+
+    async def call(priority, delay):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        try:
+            if scheduler is None:
+                await model.generate_content_async("Plan a weekend in Goa")
+            else:
+                async with scheduler.slot(priority):
+                    await model.generate_content_async("Plan a weekend in Goa")
+            outcome = "ok"
+        except LLMOverloaded:
+            outcome = "503"
+        except Exception as e:
+            outcome = "429" if is_throttled(e) else "error"
+        results[priority].append((outcome, time.perf_counter() - start))
+
+    calls = [call(INTERACTIVE, rng.uniform(0, spread)) for _ in range(chats)]
+    calls += [call(BACKGROUND, rng.uniform(0, spread)) for _ in range(titles)]
+    start = time.perf_counter()
+    await asyncio.gather(*calls)
+    return results, time.perf_counter() - start
+
+
+def report(name, results, elapsed):
+    from llm_scheduler import INTERACTIVE
+    print(f"{name} ({elapsed:.1f}s)")
+    for priority, rows in results.items():
+        label = "chat" if priority == INTERACTIVE else "titles"
+        counts = {outcome: sum(1 for o, _ in rows if o == outcome) for outcome in ("ok", "429", "503", "error")}
+        ok = [seconds for outcome, seconds in rows if outcome == "ok"]
+        print(f"  {label:<7} ok {counts['ok']:>4}  429 {counts['429']:>4}  503 {counts['503']:>4}  "
+              f"p50 {percentile(ok, 0.5) * 1000:>6.0f} ms  p99 {percentile(ok, 0.99) * 1000:>6.0f} ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capacity", type=int, default=8, help="provider concurrency before 429s")
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--titles", type=int, default=100)
+    parser.add_argument("--spread", type=float, default=3.0, help="seconds over which the burst arrives")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--initial", type=int, default=32, help="scheduler's starting limit")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_CAPACITY"] = str(args.capacity)
+    os.environ["FAKE_LLM_LATENCY"] = str(args.latency)
+    os.environ["FAKE_LLM_TOKENS_PER_SEC"] = "200"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from fake_llm import FakeGenerativeModel
+    from llm_scheduler import LLMScheduler
+
+    model = FakeGenerativeModel()
+    results, elapsed = asyncio.run(burst(model, None, args.chats, args.titles, args.spread, args.seed))
+    report("no limit", results, elapsed)
+
+    scheduler = LLMScheduler(initial_concurrency=args.initial)
+    results, elapsed = asyncio.run(burst(model, scheduler, args.chats, args.titles, args.spread, args.seed))
+    report(f"scheduler (start {args.initial})", results, elapsed)
+    print(f"  {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    main_cli()
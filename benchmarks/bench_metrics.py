@@ -0,0 +1,124 @@
+# benchmarks/bench_metrics.py
+"""
+Overhead of the request instrumentation (metrics.py) and the sampling profiler.
+
+Runs GET /api/personas, GET /api/history and POST /api/chat (fake LLM with
+no latency, so the app's own work dominates) in-process with metrics off,
+on, and on with the sampling profiler running. Rounds alternate between the
+modes to spread out noise; the best round of each mode is reported with the
+difference to "off". Whole requests vary by more than the instrumentation
+costs, so the middleware itself is also timed around a no-op ASGI app, along
+with a bare stage() block and a /metrics render.
+
+Usage:
+    python benchmarks/bench_metrics.py --requests 300 --rounds 5
+"""
+import os
+import asyncio
+import sys
+import time
+import argparse
+import tempfile
+import itertools
+import importlib
+
+
+MESSAGE_IDS = itertools.count()  # a new session per chat, so later modes do not get longer histories
+
+
+def time_requests(client, method, path, count, body=None):
+    start = time.perf_counter()
+    for _ in range(count):
+        if body is None:
+            response = client.request(method, path)
+        else:
+            response = client.request(method, path, json=dict(body, session_id=f"bench-chat-{next(MESSAGE_IDS)}"))
+        assert response.status_code == 200, response.text
+    return (time.perf_counter() - start) / count
+
+
+def middleware_cost(metrics, count=20000):
+    """Seconds per request added by MetricsMiddleware (with one stage) around an app that does nothing"""
+    async def app(scope, receive, send):
+        with metrics.stage("bench"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    async def run(handler):
+        scope = {"type": "http", "method": "GET", "path": "/bench"}
+        start = time.perf_counter()
+        for _ in range(count):
+            await handler(dict(scope), None, send)
+        return (time.perf_counter() - start) / count
+
+    middleware = metrics.MetricsMiddleware(app)
+    return min(asyncio.run(run(middleware)) - asyncio.run(run(app)) for _ in range(5))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="requests per endpoint per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = "0"
+    os.environ["FAKE_LLM_TOKENS_PER_SEC"] = str(10 ** 9)
+    os.environ["RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+    os.environ["SESSION_RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+    os.environ["TITLE_WORKER"] = "external"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    main = importlib.import_module("main")
+    import metrics
+    from profiling import SamplingProfiler
+    from fastapi.testclient import TestClient
+
+    endpoints = [
+        ("GET /api/personas", "GET", "/api/personas", None),
+        ("GET /api/history", "GET", "/api/history?session_id=bench-history&limit=50", None),
+        ("POST /api/chat", "POST", "/api/chat", {"message": "Plan a day in Goa"}),
+    ]
+    modes = ("off", "on", "on + profiler")
+    results = {(name, mode): [] for name, *_ in endpoints for mode in modes}
+    with TestClient(main.app) as client:
+        for i in range(60):  # history to read; also warms up imports and caches
+            client.post("/api/chat", json={"session_id": "bench-history", "message": f"Warm up {i}"})
+        for _ in range(args.rounds):
+            for mode in modes:
+                metrics.METRICS_ENABLED = mode != "off"
+                profiler = SamplingProfiler() if mode == "on + profiler" else None
+                if profiler:
+                    profiler.start()
+                for name, method, path, body in endpoints:
+                    results[(name, mode)].append(time_requests(client, method, path, args.requests, body))
+                if profiler:
+                    profiler.stop()
+        metrics.METRICS_ENABLED = True
+
+        for name, *_ in endpoints:
+            base = min(results[(name, "off")])
+            line = f"{name:<20} off {base * 1e6:>7.0f} us"
+            for mode in modes[1:]:
+                value = min(results[(name, mode)])
+                line += f"   {mode} {value * 1e6:>7.0f} us ({(value - base) * 1e6:+.0f} us, {(value / base - 1):+.1%})"
+            print(line)
+
+        print(f"MetricsMiddleware: {middleware_cost(metrics) * 1e6:.1f} us per request")
+        count = 100000
+        start = time.perf_counter()
+        for _ in range(count):
+            with metrics.stage("bench"):
+                pass
+        print(f"stage() block: {(time.perf_counter() - start) / count * 1e6:.2f} us")
+        start = time.perf_counter()
+        text = client.get("/metrics").text
+        print(f"GET /metrics: {(time.perf_counter() - start) * 1000:.1f} ms, {len(text.splitlines())} lines")
+
+
+if __name__ == "__main__":
+    main_cli()
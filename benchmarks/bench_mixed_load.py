@@ -0,0 +1,121 @@
+# benchmarks/bench_mixed_load.py
+"""
+Mixed read/write load benchmark for the SQLite storage profiles.
+
+Writer processes save chat messages the way the chat path does (message
+insert + session summary update, one commit each) while reader processes
+run the /api/sessions and /api/history queries in a loop, like several
+uvicorn workers sharing one database file. Each SQLITE_PROFILE gets a fresh
+scratch directory. Under the legacy rollback journal readers queue behind
+every write; under WAL with the read/write split they should not.
+
+Usage:
+    python benchmarks/bench_mixed_load.py --writers 4 --readers 4 --duration 10
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def write_loop(i, start, duration, results):
+    import database
+    writes = errors = 0
+    results.put(("ready",))
+    start.wait()
+    stop_at = time.time() + duration
+    while time.time() < stop_at:
+        try:
+            with database.SessionLocal() as db:
+                database.add_message(db, f"mixed-{i}-{writes % 50}", "user", "What should we see next in Goa? " * 4, "travel")
+                db.commit()
+            writes += 1
+        except Exception:
+            errors += 1  # e.g. "database is locked" once busy_timeout runs out
+    results.put(("write", writes, errors))
+
+
+def read_loop(i, start, duration, results):
+    import database
+    latencies = []
+    errors = 0
+    results.put(("ready",))
+    start.wait()
+    stop_at = time.time() + duration
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        try:
+            with database.ReadSessionLocal() as db:
+                if i % 2 == 0:
+                    # /api/sessions
+                    db.query(database.ChatSession).order_by(database.ChatSession.last_message_time.desc()).all()
+                else:
+                    # /api/history
+                    db.query(database.ChatMessage).filter(
+                        database.ChatMessage.session_key == database.session_key_of(f"mixed-0-{len(latencies) % 50}")
+                    ).order_by(database.ChatMessage.id.desc()).limit(50).all()
+        except Exception:
+            errors += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    results.put(("read", latencies, errors))
+
+
+def run_profile(args):
+    """Run one profile in a scratch directory; called in a fresh process with SQLITE_PROFILE set"""
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    import database  # creates the schema before the workers start
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    start = ctx.Event()
+    procs = [ctx.Process(target=write_loop, args=(i, start, args.duration, results)) for i in range(args.writers)]
+    procs += [ctx.Process(target=read_loop, args=(i, start, args.duration, results)) for i in range(args.readers)]
+    for p in procs:
+        p.start()
+    # Start the clock once every process has finished importing
+    for _ in procs:
+        results.get()
+    start.set()
+    outcomes = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    writes = sum(o[1] for o in outcomes if o[0] == "write")
+    latencies = [ms for o in outcomes if o[0] == "read" for ms in o[1]]
+    errors = sum(o[2] for o in outcomes)
+    print(f"{database.SQLITE_PROFILE:<9}{writes / args.duration:>9.1f}{len(latencies) / args.duration:>9.1f}"
+          f"{percentile(latencies, 50):>10.2f}{percentile(latencies, 99):>10.2f}{max(latencies or [0]):>10.2f}{errors:>8}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4, help="writer processes")
+    parser.add_argument("--readers", type=int, default=4, help="reader processes")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per profile")
+    parser.add_argument("--profiles", nargs="+", default=["legacy", "wal"])
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.duration:.0f}s per profile")
+    print(f"{'profile':<9}{'writes/s':>9}{'reads/s':>9}{'read p50':>10}{'read p99':>10}{'read max':>10}{'errors':>8}")
+    for profile in args.profiles:
+        # The profile is read at import time, so each one runs in its own process
+        os.environ["SQLITE_PROFILE"] = profile
+        proc = multiprocessing.get_context("spawn").Process(target=run_profile, args=(args,))
+        proc.start()
+        proc.join()
+
+
+if __name__ == "__main__":
+    main_cli()
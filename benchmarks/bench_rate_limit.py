@@ -0,0 +1,100 @@
+# benchmarks/bench_rate_limit.py
+"""
+Rate limiter overhead per check and memory footprint.
+
+Compares the old per-IP timestamp lists against the token-bucket backends
+across many distinct clients. The Redis backend is included when
+--redis-url points at a Redis-protocol server.
+
+Usage:
+    python benchmarks/bench_rate_limit.py --clients 10000 --checks 200000
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+
+
+class LegacyLimiter:
+    """The previous implementation: a growing list of timestamps per IP, never evicted"""
+
+    def __init__(self, requests, window):
+        self.requests = requests
+        self.window = window
+        self.store = defaultdict(list)
+
+    def check(self, key, now):
+        self.store[key] = [t for t in self.store[key] if now - t < self.window]
+        if len(self.store[key]) >= self.requests:
+            return False
+        self.store[key].append(now)
+        return True
+
+
+def run_sync(name, check, keys, checks):
+    start = time.perf_counter()
+    allowed = 0
+    for i in range(checks):
+        allowed += bool(check(keys[i % len(keys)]))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10}{elapsed / checks * 1e6:>12.2f}{checks / elapsed:>14.0f}{allowed / checks:>10.1%}")
+
+
+async def run_async(name, acquire, keys, checks):
+    start = time.perf_counter()
+    allowed = 0
+    for i in range(checks):
+        ok, _ = await acquire(keys[i % len(keys)])
+        allowed += ok
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10}{elapsed / checks * 1e6:>12.2f}{checks / elapsed:>14.0f}{allowed / checks:>10.1%}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--checks", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--window", type=float, default=60)
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from rate_limit import RateLimit, MemoryBackend, SQLiteBackend, RedisBackend
+
+    keys = [f"chat:ip:10.0.{i // 256}.{i % 256}" for i in range(args.clients)]
+    random.shuffle(keys)
+    limit = RateLimit(args.requests, args.window)
+
+    print(f"{'backend':<10}{'us/check':>12}{'checks/s':>14}{'allowed':>10}")
+    legacy = LegacyLimiter(args.requests, args.window)
+    run_sync("legacy", lambda k: legacy.check(k, time.time()), keys, args.checks)
+
+    memory = MemoryBackend()
+    run_sync("memory", lambda k: memory.acquire_sync(k, limit)[0], keys, args.checks)
+
+    sqlite_backend = SQLiteBackend(os.path.join(tempfile.mkdtemp(prefix="chatbot-bench-"), "rate_limits.db"))
+    run_sync("sqlite", lambda k: sqlite_backend.acquire_sync(k, limit)[0], keys, min(args.checks, 50000))
+
+    if args.redis_url:
+        redis_backend = RedisBackend(args.redis_url)
+        asyncio.run(run_async("redis", lambda k: redis_backend.acquire(k, limit), keys, min(args.checks, 50000)))
+
+    # Memory held after a burst from clients that then go idle
+    print(f"\nkeys kept after {args.clients} clients went idle past the window:")
+    later = time.time() + args.window + 1
+    for key in keys:
+        legacy.check(key, later)
+    memory.acquire_sync("probe", limit, now=later)
+    for _ in range(args.clients):
+        memory.acquire_sync("probe", limit, now=later)
+    print(f"  legacy: {len(legacy.store)} (never shrinks)")
+    print(f"  memory: {len(memory)}")
+
+
+if __name__ == "__main__":
+    main_cli()
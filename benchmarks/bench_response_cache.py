@@ -0,0 +1,145 @@
+# benchmarks/bench_response_cache.py
+"""
+Response cache on a repeated-question workload.
+
+Generates first messages from a few hundred (destination, month) topics with
+skewed popularity, several phrasings each, typos and greetings, and feeds
+them through ResponseCache as /api/chat does. Each cached reply records the
+topic it answered, so hits for a different topic are counted as wrong.
+Reports hit rate by kind, wrong hits, upstream seconds saved at the given
+LLM latency, lookup cost with --entries cached questions, and end-to-end
+/api/chat latency for a miss vs a hit (in-process, fake LLM).
+
+Usage:
+    python benchmarks/bench_response_cache.py --questions 2000 --entries 5000 --latency 1.5
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import importlib
+import statistics
+
+DESTINATIONS = ["goa", "ladakh", "kerala", "sikkim", "manali", "jaipur", "rishikesh", "coorg", "hampi",
+                "andaman", "varanasi", "udaipur", "shimla", "darjeeling", "pondicherry", "ooty", "munnar",
+                "spiti", "meghalaya", "kashmir", "bali", "dubai", "singapore", "bangkok", "paris"]
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september",
+          "october", "november", "december"]
+PHRASINGS = [
+    "Best places to visit in {d} in {m}?",
+    "What are the top places in {d} during {m}",
+    "suggest some good places in {d} in {m}",
+    "Is {d} worth visiting in {m}?",
+    "{d} in {m} - what should I see?",
+    "Top things to do in {d} in {m}!",
+]
+GREETINGS = ["hi", "hello", "hey there", "good morning", "namaste"]
+
+
+def typo(text, rng):
+    words = text.split()
+    i = rng.randrange(len(words))
+    if len(words[i]) > 5:
+        j = rng.randrange(1, len(words[i]) - 1)
+        words[i] = words[i][:j] + words[i][j + 1:]
+    return " ".join(words)
+
+
+def workload(count, rng, greeting_share=0.1, typo_share=0.1):
+    topics = [(d, m) for d in DESTINATIONS for m in MONTHS]
+    weights = [1 / (rank + 1) for rank in range(len(topics))]  # Zipf-like popularity
+    rng.shuffle(topics)
+    questions = []
+    for _ in range(count):
+        if rng.random() < greeting_share:
+            questions.append((rng.choice(GREETINGS), None))
+            continue
+        d, m = rng.choices(topics, weights)[0]
+        text = rng.choice(PHRASINGS).format(d=d.title(), m=m.title())
+        if rng.random() < typo_share:
+            text = typo(text, rng)
+        questions.append((text, f"{d}|{m}"))
+    return questions
+
+
+def run_workload(cache, is_greeting, questions):
+    wrong = 0
+    for text, topic in questions:
+        greeting = is_greeting(text)
+        reply, kind = cache.get("travel", text, greeting)
+        if reply is None:
+            cache.put("travel", text, topic or "greeting", greeting)
+        elif reply != (topic or "greeting"):
+            wrong += 1
+    return wrong
+
+
+def lookup_cost(cache, questions, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text, _ in questions:
+            cache.get("travel", text)
+        timings.append((time.perf_counter() - start) / len(questions))
+    return statistics.median(timings) * 1e6
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--entries", type=int, default=5000, help="cached questions for the lookup-cost run")
+    parser.add_argument("--latency", type=float, default=1.5, help="upstream seconds saved per hit")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = "0.2"
+    os.environ["RESPONSE_CACHE_PERSONAS"] = "travel"
+    os.environ["RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    from response_cache import ResponseCache
+    from title_worker import is_greeting
+
+    rng = random.Random(args.seed)
+    cache = ResponseCache(personas={"travel"})
+    wrong = run_workload(cache, is_greeting, workload(args.questions, rng))
+    stats = cache.stats()
+    hits = sum(stats["hits"].values())
+    print(f"{args.questions} first messages: hit rate {stats['hit_rate']:.1%} {stats['hits']}, "
+          f"{stats['misses']} misses, {wrong} wrong hits, {stats['entries']} entries / {stats['bytes'] / 1024:.0f} KB")
+    print(f"upstream time saved at {args.latency}s per reply: {hits * args.latency:.0f} s "
+          f"of {args.questions * args.latency:.0f} s")
+
+    # Lookup cost with a large cache: distinct synthetic questions, then misses and near-duplicates
+    big = ResponseCache(personas={"travel"}, max_entries=args.entries)
+    stored = [f"{rng.choice(PHRASINGS).format(d=d, m=m)} with {rng.choice(['kids', 'friends', 'parents'])} "
+              f"trip {i}" for i, (d, m) in enumerate(rng.choices([(d, m) for d in DESTINATIONS for m in MONTHS],
+                                                                   k=args.entries))]
+    for text in stored:
+        big.put("travel", text, "reply")
+    near = [(typo(text, rng), None) for text in rng.sample(stored, 500)]
+    unseen = [(f"visa rules for {rng.choice(DESTINATIONS)} tourists number {i}", None) for i in range(500)]
+    print(f"lookup with {len(big._entries)} entries: near-duplicate {lookup_cost(big, near):.0f} us, "
+          f"unseen {lookup_cost(big, unseen):.0f} us")
+
+    # End to end: the same first message in a new session, uncached then cached
+    main = importlib.import_module("main")
+    from fastapi.testclient import TestClient
+    client = TestClient(main.app)
+    timings = {"miss": [], "hit": []}
+    for i in range(10):
+        for kind in ("miss", "hit"):
+            start = time.perf_counter()
+            response = client.post("/api/chat", json={"session_id": f"bench-{kind}-{i}",
+                                                      "message": f"Best places in Spiti {i} in May?"})
+            timings[kind].append(time.perf_counter() - start)
+            assert (response.json()["cached"] is None) == (kind == "miss"), response.json()
+    print("POST /api/chat (fake LLM, 0.2s): " + ", ".join(
+        f"{kind} {statistics.median(t) * 1000:.1f} ms" for kind, t in timings.items()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,141 @@
+# benchmarks/bench_schema.py
+"""
+Storage size and query latency: original `messages` schema vs the normalized
+chat_sessions / chat_messages schema.
+
+Seeds a throwaway database in the original schema (UUID session ids, persona
+strings and `[title]` system rows on every session), times the hot per-session
+queries, runs the schema migration, VACUUMs away the legacy table and times
+the same queries on the new schema.
+
+Usage:
+    python benchmarks/bench_schema.py --messages 1000000 --per-session 20
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import sqlite3
+import argparse
+import tempfile
+import importlib
+from datetime import datetime, timedelta
+
+PERSONAS = ["travel", "career", "fitness", "movie"]
+WORDS = ("beach trip budget itinerary museum train hotel food market sunset "
+         "resume interview salary workout protein movie thriller comedy").split()
+
+
+def seed_legacy(path, ddl, messages, per_session):
+    """Bulk-insert `messages` rows into the original schema with plain sqlite3"""
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    for statement in ddl:
+        conn.execute(statement)
+    start = datetime(2025, 1, 1)
+    session_ids = []
+    batch = []
+    sessions = messages // per_session
+    for s in range(sessions):
+        sid = str(uuid.UUID(int=rng.getrandbits(128)))
+        session_ids.append(sid)
+        persona = PERSONAS[s % len(PERSONAS)]
+        base = start + timedelta(minutes=s)
+        batch.append((sid, "system", f"[title]Session {s}", str(base), persona))
+        for j in range(per_session - 1):
+            role = "user" if j % 2 == 0 else "bot"
+            words = rng.randint(8, 40) if role == "user" else rng.randint(40, 120)
+            content = " ".join(rng.choice(WORDS) for _ in range(words))
+            batch.append((sid, role, content, str(base + timedelta(seconds=j, microseconds=rng.randint(0, 999999))), persona))
+        if len(batch) >= 50000:
+            conn.executemany("INSERT INTO messages (session_id, role, content, timestamp, persona) VALUES (?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO messages (session_id, role, content, timestamp, persona) VALUES (?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+    return session_ids
+
+
+def time_queries(conn, queries, sample, repeat=3):
+    """Median ms per query over the sampled session ids"""
+    results = {}
+    for name, sql in queries.items():
+        timings = []
+        for sid in sample:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(sql, (sid,)).fetchall()
+            timings.append((time.perf_counter() - start) * 1000 / repeat)
+        timings.sort()
+        results[name] = timings[len(timings) // 2]
+    return results
+
+
+LEGACY_QUERIES = {
+    "history page (50)": "SELECT id, role, content, timestamp FROM messages WHERE session_id = ? "
+                         "AND role IN ('user', 'bot') ORDER BY id DESC LIMIT 50",
+    "title lookup": "SELECT content FROM messages WHERE session_id = ? AND role = 'system' "
+                    "AND content LIKE '[title]%' LIMIT 1",
+    "message count": "SELECT count(*) FROM messages WHERE session_id = ? AND role IN ('user', 'bot')",
+}
+NEW_QUERIES = {
+    "history page (50)": "SELECT id, role, content, timestamp FROM chat_messages WHERE session_key = "
+                         "(SELECT key FROM chat_sessions WHERE session_id = ?) ORDER BY id DESC LIMIT 50",
+    "title lookup": "SELECT title FROM chat_sessions WHERE session_id = ?",
+    "message count": "SELECT count(*) FROM chat_messages WHERE session_key = "
+                     "(SELECT key FROM chat_sessions WHERE session_id = ?)",
+}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000, help="legacy rows to seed")
+    parser.add_argument("--per-session", type=int, default=20, help="rows per session (incl. the title row)")
+    parser.add_argument("--sample", type=int, default=200, help="sessions sampled per query")
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    path = "chat_history.db"
+
+    # The legacy DDL lives in schema_migration, which imports database (creating the new,
+    # empty tables); seed the legacy table before anything touches the new ones
+    schema_migration = importlib.import_module("schema_migration")
+    database = sys.modules["database"]
+    database.engine.dispose()
+    started = time.perf_counter()
+    session_ids = seed_legacy(path, schema_migration.LEGACY_MESSAGES_DDL, args.messages, args.per_session)
+    print(f"seeded {args.messages} legacy rows ({len(session_ids)} sessions) in {time.perf_counter() - started:.0f}s")
+    sample = random.Random(7).sample(session_ids, min(args.sample, len(session_ids)))
+
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    legacy_size = os.path.getsize(path)
+    legacy = time_queries(conn, LEGACY_QUERIES, sample)
+    conn.close()
+
+    started = time.perf_counter()
+    schema_migration.migrate_if_needed()
+    migrate = time.perf_counter() - started
+    database.engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute(f"DROP TABLE {schema_migration.LEGACY_RENAMED}")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    new_size = os.path.getsize(path)
+    new = time_queries(conn, NEW_QUERIES, sample)
+    conn.close()
+
+    print(f"migration: {migrate:.1f}s")
+    print(f"{'':<20}{'legacy':>12}{'normalized':>12}")
+    print(f"{'file size MB':<20}{legacy_size / 2**20:>12.1f}{new_size / 2**20:>12.1f}")
+    for name in LEGACY_QUERIES:
+        print(f"{name + ' ms':<20}{legacy[name]:>12.3f}{new[name]:>12.3f}")
+
+
+if __name__ == "__main__":
+    main_cli()
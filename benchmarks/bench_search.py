@@ -0,0 +1,128 @@
+# benchmarks/bench_search.py
+"""
+/api/search latency: FTS5 index vs LIKE '%...%' scans.
+
+Seeds a throwaway database with N messages (plain sqlite3 bulk insert into
+chat_sessions / chat_messages), builds the search index and times global,
+per-session and persona-filtered searches for rare words, common words and
+a stop word against the equivalent LIKE queries. Also reports the insert cost of the
+sync triggers.
+
+Usage:
+    python benchmarks/bench_search.py --messages 1000000
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+import tempfile
+import importlib
+
+# Zipf-distributed vocabulary, like natural text: the first word is in nearly every
+# message (a stop word), the tenth in ~1 in 5 and most of the tail in very few
+WORDS = ("the trip budget itinerary museum train hotel food market sunset resume interview "
+         "salary workout protein movie thriller comedy monsoon trek visa hostel ferry spice").split()
+WORDS += [f"word{i}" for i in range(5000 - len(WORDS))]
+CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+RARE_WORD = "zanzibar"
+
+
+def seed(path, messages, per_session, offset=0):
+    """Bulk-insert `messages` rows (and their sessions); ~1 in 10k messages mentions RARE_WORD"""
+    rng = random.Random(42 + offset)
+    conn = sqlite3.connect(path)
+    sessions = max(1, messages // per_session)
+    first_key = offset // per_session + 1
+    conn.executemany(
+        "INSERT INTO chat_sessions (key, session_id, snippet, persona, message_count, user_message_count, summary_count) "
+        "VALUES (?, ?, '', ?, 0, 0, 0)",
+        [(first_key + s, f"bench-{first_key + s}", s % 4 + 1) for s in range(sessions)],
+    )
+    batch = []
+    base_ms = 1_735_689_600_000
+    for i in range(messages):
+        words = rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=rng.randint(10, 60))
+        if rng.random() < 0.0001:
+            words[rng.randrange(len(words))] = RARE_WORD
+        key = first_key + i // per_session
+        batch.append((key, i % 2 + 1, " ".join(words), base_ms + offset + i, (key - 1) % 4 + 1))
+        if len(batch) >= 50000:
+            conn.executemany("INSERT INTO chat_messages (session_key, role, content, timestamp, persona) VALUES (?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO chat_messages (session_key, role, content, timestamp, persona) VALUES (?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--per-session", type=int, default=40)
+    parser.add_argument("--skip-like", action="store_true", help="don't time the LIKE scans")
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    database = importlib.import_module("database")  # creates the schema
+    search = importlib.import_module("search")
+
+    started = time.perf_counter()
+    seed("chat_history.db", args.messages, args.per_session)
+    print(f"seeded {args.messages} messages in {time.perf_counter() - started:.0f}s")
+
+    started = time.perf_counter()
+    search.ensure_search_index()
+    print(f"index build: {time.perf_counter() - started:.1f}s")
+
+    # Trigger overhead: the same bulk insert with the index in place
+    extra = 20000
+    started = time.perf_counter()
+    seed("chat_history.db", extra, args.per_session, offset=args.messages)
+    print(f"insert {extra} messages with sync triggers: {(time.perf_counter() - started) * 1000 / extra:.3f} ms/message")
+
+    session_id = f"bench-{args.messages // args.per_session // 2}"
+    cases = [
+        ("global, rare word", RARE_WORD, {}),
+        ("global, no match", "xylophone", {}),
+        ("global, common word", "resume", {}),
+        ("global, two words", "hotel spice", {}),
+        ("global, prefix", "itiner*", {}),
+        ("global, stop word", "the", {}),
+        ("persona filter", "resume", {"persona": "career"}),
+        ("one session", "resume", {"session_id": session_id}),
+        ("recent sort", "resume", {"sort": "recent"}),
+        ("recent, stop word", "the", {"sort": "recent"}),
+    ]
+    print(f"{'query':<22}{'fts ms':>10}{'like ms':>12}")
+    conn = sqlite3.connect("chat_history.db")
+    with database.ReadSessionLocal() as db:
+        for name, query, filters in cases:
+            fts = timed(lambda: search.search_messages(db, query, limit=20, **filters))
+            like = float("nan")
+            if not args.skip_like:
+                where = " AND ".join(f"content LIKE '%{word.rstrip('*')}%'" for word in query.split())
+                if "persona" in filters:
+                    where += f" AND persona = {database.PERSONA_CODES[filters['persona']]}"
+                if "session_id" in filters:
+                    where += f" AND session_key = (SELECT key FROM chat_sessions WHERE session_id = '{session_id}')"
+                like = timed(lambda: conn.execute(
+                    f"SELECT id, content FROM chat_messages WHERE {where} ORDER BY id DESC LIMIT 21").fetchall(), 1)
+            print(f"{name:<22}{fts:>10.2f}{like:>12.2f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,103 @@
+# benchmarks/bench_session_events.py
+"""
+Session sidebar refresh: 20-second polling vs pushed session events.
+
+Seeds a throwaway database with N sessions and measures what one
+GET /api/sessions costs, i.e. what every open tab paid every 20 seconds.
+Then attaches T subscribers to the session event fan-out (as
+/api/sessions/events streams do) and measures publish cost and
+publish-to-delivery latency per event.
+
+Usage:
+    python benchmarks/bench_session_events.py --sessions 10000 --tabs 1000 --events 2000
+"""
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import importlib
+import statistics
+from contextlib import AsyncExitStack
+
+POLL_INTERVAL = 20  # seconds, the sidebar's old refresh timer
+
+
+def seed_sessions(path, sessions):
+    conn = sqlite3.connect(path)
+    base_ms = 1_735_689_600_000
+    conn.executemany(
+        "INSERT INTO chat_sessions (session_id, title, snippet, persona, last_message_time, message_count, "
+        "user_message_count, summary_count) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+        [(f"bench-{i}", f"Session {i}", "Plan a trip to the mountains", i % 4 + 1, base_ms + i * 1000, 12, 6)
+         for i in range(sessions)],
+    )
+    conn.commit()
+    conn.close()
+
+
+async def fan_out(session_events, tabs, events):
+    latencies = []
+
+    async def tab(subscription):
+        for _ in range(events):
+            data = await subscription.get()
+            latencies.append(time.perf_counter() - float(data))
+
+    async with AsyncExitStack() as stack:
+        subscriptions = [await stack.enter_async_context(session_events.subscribe()) for _ in range(tabs)]
+        readers = [asyncio.create_task(tab(s)) for s in subscriptions]
+        start = time.perf_counter()
+        for _ in range(events):
+            # The payload is the send time, so each reader can compute its delivery latency
+            await session_events.broker.publish(repr(time.perf_counter()))
+            await asyncio.sleep(0)
+        publish_elapsed = time.perf_counter() - start
+        await asyncio.gather(*readers)
+    return publish_elapsed, latencies
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--tabs", type=int, default=1000, help="open sidebars")
+    parser.add_argument("--events", type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    importlib.import_module("database")  # creates the schema
+    seed_sessions("chat_history.db", args.sessions)
+    main = importlib.import_module("main")
+    from database import ReadSessionLocal
+    from session_events import SessionEvents, MemoryBroker
+
+    timings = []
+    with ReadSessionLocal() as db:
+        for _ in range(20):
+            start = time.perf_counter()
+            main.session_list(db)
+            timings.append(time.perf_counter() - start)
+    poll_ms = statistics.median(timings) * 1000
+    print(f"GET /api/sessions over {args.sessions} sessions: {poll_ms:.1f} ms")
+    print(f"polling: {args.tabs} tabs every {POLL_INTERVAL}s = {args.tabs / POLL_INTERVAL:.0f} list queries/s, "
+          f"{args.tabs / POLL_INTERVAL * poll_ms / 1000:.2f} CPU-seconds/s, whether or not anything changed")
+
+    async def run():
+        session_events = SessionEvents(MemoryBroker())
+        await session_events.start()
+        return await fan_out(session_events, args.tabs, args.events)
+
+    publish_elapsed, latencies = asyncio.run(run())
+    latencies.sort()
+    print(f"events: {args.tabs} subscribers, {args.events} events: "
+          f"{publish_elapsed / args.events * 1e6:.0f} us to publish one, delivery p50 "
+          f"{latencies[len(latencies) // 2] * 1000:.2f} ms / p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms; "
+          f"one {poll_ms:.1f} ms snapshot per connect")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,117 @@
+# benchmarks/bench_sessions.py
+"""
+/api/sessions list latency: per-session queries over the original `messages`
+table (the old implementation, reproduced below) versus the session rows of
+the normalized schema.
+
+Seeds a throwaway database in the original schema with N sessions of a few
+messages each, times the old implementation, runs the schema migration and
+times the current endpoint.
+
+Usage:
+    python benchmarks/bench_sessions.py --sizes 10000 100000
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+from datetime import timedelta
+
+
+def legacy_list_sessions(db, messages):
+    """The pre-summary-table implementation: 1 + 3 queries per session"""
+    from sqlalchemy import select
+    c = messages.c
+    sessions = []
+    for (sid,) in db.execute(select(c.session_id).distinct()).all():
+        title_msg = db.execute(select(c.content).where(
+            c.session_id == sid, c.role == "system", c.content.like("[title]%")
+        ).order_by(c.timestamp.desc()).limit(1)).first()
+        last_msg = db.execute(select(c.timestamp).where(
+            c.session_id == sid, c.role.in_(["user", "bot"])
+        ).order_by(c.timestamp.desc()).limit(1)).first()
+        first_user_msg = db.execute(select(c.content).where(
+            c.session_id == sid, c.role == "user"
+        ).order_by(c.timestamp.asc()).limit(1)).first()
+        sessions.append({
+            "session_id": sid,
+            "title": title_msg.content.replace("[title]", "").strip() if title_msg else None,
+            "last_message_time": last_msg.timestamp if last_msg else None,
+            "snippet": first_user_msg.content[:60] if first_user_msg else "",
+        })
+    sessions.sort(key=lambda x: x["last_message_time"] or "", reverse=True)
+    return sessions
+
+
+def seed(database, schema_migration, count, messages_per_session=4):
+    """Insert `count` sessions (title row + alternating user/bot messages) into the original schema"""
+    now = database.get_ist_now().replace(tzinfo=None)
+    rows = []
+    insert = schema_migration.legacy_messages.insert()
+    with database.engine.begin() as conn:
+        for statement in schema_migration.LEGACY_MESSAGES_DDL:
+            conn.exec_driver_sql(statement)
+        for i in range(count):
+            sid = str(uuid.uuid4())
+            base = now - timedelta(minutes=count - i)
+            rows.append({"session_id": sid, "role": "system", "content": f"[title]Session {i}", "timestamp": str(base), "persona": "travel"})
+            for j in range(messages_per_session):
+                role = "user" if j % 2 == 0 else "bot"
+                rows.append({
+                    "session_id": sid, "role": role, "persona": "travel",
+                    "content": f"message {j} of session {i} about beaches in Goa",
+                    "timestamp": str(base + timedelta(seconds=j)),
+                })
+            if len(rows) >= 50000:
+                conn.execute(insert, rows)
+                rows = []
+        if rows:
+            conn.execute(insert, rows)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3, help="best-of runs for the current endpoint")
+    parser.add_argument("--skip-legacy", action="store_true", help="only time the current endpoint")
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "fake"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import importlib
+
+    print(f"{'sessions':>10}{'legacy ms':>14}{'current ms':>14}{'migrate s':>12}")
+    for size in args.sizes:
+        os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+        for name in ("database", "schema_migration", "context", "title_worker", "group_commit", "main"):
+            sys.modules.pop(name, None)
+        database = importlib.import_module("database")
+        schema_migration = importlib.import_module("schema_migration")
+        seed(database, schema_migration, size)
+
+        with database.SessionLocal() as db:
+            legacy = float("nan") if args.skip_legacy else timed(
+                lambda: legacy_list_sessions(db, schema_migration.legacy_messages), 1)
+
+        start = time.perf_counter()
+        schema_migration.migrate_if_needed()
+        migrate = time.perf_counter() - start
+
+        main = importlib.import_module("main")
+        with database.SessionLocal() as db:
+            current = timed(lambda: main.session_list(db), args.repeat)
+        print(f"{size:>10}{legacy:>14.1f}{current:>14.1f}{migrate:>12.2f}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,138 @@
+# benchmarks/bench_sharding.py
+"""
+Chat-turn write throughput by shard count (SHARD_COUNT, database.py).
+
+For each shard count, starts --workers processes on one scratch directory,
+as uvicorn --workers would, each running the app in-process against an
+instant fake LLM with --clients concurrent clients (one session each)
+driving /api/chat turns. Every turn is two writes (the user message and the
+reply); processes compete for each shard's SQLite write lock. Reports turns
+per second over all workers, latency and writes per commit.
+
+SQLite's cost per commit is mostly the WAL fsync under
+--synchronous FULL; with the default NORMAL, commits only sync at
+checkpoints and the run is bound by CPU rather than by the write lock, so
+shards help little on a machine with few cores.
+
+Usage:
+    python benchmarks/bench_sharding.py --shards 1,2,4,8 --workers 4 --clients 16 --turns 20
+    python benchmarks/bench_sharding.py --synchronous FULL
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from loadtest import percentile
+
+
+async def client_turns(client, session_id, turns, latencies):
+    for i in range(turns):
+        start = time.perf_counter()
+        res = await client.post("/api/chat", json={
+            "session_id": session_id,
+            "message": f"question {i} about somewhere to visit",
+            "persona": "travel",
+        })
+        res.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def worker(args):
+    """One app process: wait for the common start time, run the clients, print a JSON summary"""
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client_turns(client, f"warmup-{args.worker}", 2, [])
+        if args.setup:
+            return
+        for writer in main.group_writers:
+            writer.batches = writer.operations = 0
+        time.sleep(max(0.0, args.start_at - time.time()))
+        latencies = []
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            client_turns(client, f"w{args.worker}-c{c}", args.turns, latencies) for c in range(args.clients)
+        ))
+        wall = time.perf_counter() - started
+    print(json.dumps({
+        "turns": len(latencies),
+        "wall": wall,
+        "latencies": latencies,
+        "batches": sum(writer.batches for writer in main.group_writers),
+        "operations": sum(writer.operations for writer in main.group_writers),
+    }))
+
+
+def run_count(shards, args):
+    """Start --workers processes with SHARD_COUNT=shards on a fresh directory; aggregate their results"""
+    workdir = tempfile.mkdtemp(prefix=f"chatbot-shards{shards}-")
+    env = dict(os.environ, SHARD_COUNT=str(shards), SQLITE_SYNCHRONOUS=args.synchronous)
+    command = [sys.executable, os.path.abspath(__file__), "--clients", str(args.clients), "--turns", str(args.turns)]
+    # Create the databases once, before the workers race to
+    subprocess.run(command + ["--worker", "0", "--setup"], cwd=workdir, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    start_at = time.time() + 3 + args.workers  # after every worker has imported the app
+    workers = [
+        subprocess.Popen(command + ["--worker", str(w), "--start-at", str(start_at)],
+                         cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for w in range(args.workers)
+    ]
+    results = []
+    for process in workers:
+        out, _ = process.communicate()
+        if process.returncode:
+            raise SystemExit(f"worker failed with {shards} shards (exit {process.returncode})")
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    wall = max(r["wall"] for r in results)
+    latencies = [value for r in results for value in r["latencies"]]
+    batches = sum(r["batches"] for r in results)
+    return {
+        "turns_per_sec": sum(r["turns"] for r in results) / wall,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "per_commit": sum(r["operations"] for r in results) / batches if batches else 0,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", default="1,2,4,8", help="shard counts to compare")
+    parser.add_argument("--workers", type=int, default=4, help="app processes sharing the databases")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients per worker")
+    parser.add_argument("--turns", type=int, default=20, help="chat turns per client")
+    parser.add_argument("--synchronous", default="NORMAL", choices=("NORMAL", "FULL"), help="SQLite synchronous")
+    # Internal: run as one worker process
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    parser.add_argument("--setup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        os.environ["LLM_BACKEND"] = "fake"
+        os.environ["FAKE_LLM_LATENCY"] = "0"
+        os.environ["FAKE_LLM_TOKENS_PER_SEC"] = str(10 ** 9)
+        os.environ["RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+        os.environ["SESSION_RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+        os.environ["TITLE_WORKER"] = "external"
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        asyncio.run(worker(args))
+        return
+
+    print(f"{args.workers} workers x {args.clients} clients x {args.turns} turns, synchronous={args.synchronous}")
+    print(f"{'shards':<8}{'turns/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'writes/commit':>15}")
+    for shards in [int(n) for n in args.shards.split(",")]:
+        r = run_count(shards, args)
+        print(f"{shards:<8}{r['turns_per_sec']:>10.1f}{r['p50']:>10.2f}{r['p99']:>10.2f}"
+              f"{r['per_commit']:>15.1f}")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main_cli()
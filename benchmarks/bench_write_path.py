@@ -0,0 +1,92 @@
+# benchmarks/bench_write_path.py
+"""
+Write-path benchmark for chat turns.
+
+Runs the app in-process against an instant fake LLM in a scratch directory
+and drives concurrent clients, each holding its own session, through
+/api/chat turns. The same load is run with group commit disabled
+(max batch 1: every write commits alone) and enabled, reporting turns per
+second, latency and how many writes shared each commit.
+
+Usage:
+    python benchmarks/bench_write_path.py --clients 64 --turns 10
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def client_turns(client, session_id, turns, latencies):
+    for i in range(turns):
+        start = time.perf_counter()
+        res = await client.post("/api/chat", json={
+            "session_id": session_id,
+            "message": f"question {i} about somewhere to visit",
+            "persona": "travel",
+        })
+        res.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run_mode(client, writers, label, max_batch, args):
+    for writer in writers:
+        writer.max_batch = max_batch
+        writer.batches = writer.operations = 0
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client_turns(client, f"bench-{label}-{c}", args.turns, latencies) for c in range(args.clients)
+    ))
+    wall = time.perf_counter() - started
+    batches = sum(writer.batches for writer in writers)
+    per_commit = sum(writer.operations for writer in writers) / batches if batches else 0
+    print(f"{label:<10}{len(latencies) / wall:>10.1f}{percentile(latencies, 50):>10.2f}"
+          f"{percentile(latencies, 99):>10.2f}{per_commit:>14.1f}")
+
+
+async def run(args):
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Warm up so both modes start with open connections
+        await client_turns(client, "bench-warmup", 3, [])
+        print(f"{args.clients} clients x {args.turns} turns")
+        print(f"{'mode':<10}{'turns/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'writes/commit':>14}")
+        await run_mode(client, main.group_writers, "per-write", 1, args)
+        await run_mode(client, main.group_writers, "grouped", args.max_batch, args)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64, help="concurrent clients (one session each)")
+    parser.add_argument("--turns", type=int, default=10, help="chat turns per client")
+    parser.add_argument("--max-batch", type=int, default=256, help="group commit batch size")
+    args = parser.parse_args()
+
+    # Isolated environment: instant fake LLM and a throwaway chat_history.db
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = "0"
+    os.environ["FAKE_LLM_TOKENS_PER_SEC"] = str(10 ** 9)
+    os.environ["RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+    os.environ["SESSION_RATE_LIMIT_REQUESTS"] = str(10 ** 9)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="chatbot-bench-"))
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
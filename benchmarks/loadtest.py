@@ -0,0 +1,360 @@
+# benchmarks/loadtest.py
+"""
+Load test of the whole API against the fake LLM, at several database sizes.
+
+For each scale in --scales (number of seeded sessions) it:
+  1. seeds a fresh SQLite database in a scratch directory with that many
+     sessions of --messages messages each (deterministic for a --seed),
+  2. starts the app with uvicorn on a free port, with LLM_BACKEND=fake and
+     the fake model's latency, token rate, 503 and 429 injection from the
+     command line,
+  3. runs --users closed-loop clients for --duration seconds; each picks an
+     operation by --mix weight: chat (POST /api/chat in a seeded session),
+     history (GET /api/history), sessions (GET /api/sessions revalidated
+     with If-None-Match, as a polling sidebar does) and stats (GET /api/stats).
+
+It prints throughput, error counts and p50/p95/p99 per endpoint and writes
+everything (with the git commit and settings) to --output. Compare two runs
+with the `compare` command; it exits with status 1 when a p95/p99 or the
+throughput regressed by more than --threshold.
+
+Usage:
+    python benchmarks/loadtest.py run --scales 100 1000 10000 --duration 30 --output before.json
+    python benchmarks/loadtest.py run --latency 1.0 --error-rate 0.02 --capacity 16 --output after.json
+    python benchmarks/loadtest.py compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("chat", "history", "sessions", "stats")
+DEFAULT_MIX = "chat=1,history=4,sessions=4,stats=1"
+WORDS = ("trip budget itinerary museum train hotel food market sunset resume interview salary workout "
+         "protein movie thriller comedy monsoon trek visa hostel ferry spice beach temple").split()
+BASE_MS = 1_735_689_600_000
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name!r} in --mix; choose from {', '.join(ENDPOINTS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+# ---------- seeding ----------
+
+def insert_sessions(conn, sessions, rng):
+    """Bulk-insert (session_id, persona code, message count) sessions with synthetic messages"""
+    session_rows, message_rows = [], []
+    for key, (session_id, persona, messages) in enumerate(sessions, 1):
+        first = " ".join(rng.choices(WORDS, k=rng.randint(4, 12)))
+        last_ms = BASE_MS + key * 60_000 + messages * 1000
+        session_rows.append((key, session_id, f"Session {key}", first[:30], first[:50], persona,
+                             last_ms if messages else None, messages, (messages + 1) // 2))
+        for i in range(messages):
+            content = first if i == 0 else " ".join(rng.choices(WORDS, k=rng.randint(8, 60)))
+            message_rows.append((key, i % 2 + 1, content, BASE_MS + key * 60_000 + i * 1000, persona))
+        if len(message_rows) >= 50000:
+            conn.executemany("INSERT INTO chat_messages (session_key, role, content, timestamp, persona) "
+                             "VALUES (?, ?, ?, ?, ?)", message_rows)
+            message_rows = []
+    conn.executemany(
+        "INSERT INTO chat_sessions (key, session_id, title, fallback_title, snippet, persona, last_message_time, "
+        "message_count, user_message_count, summary_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)", session_rows)
+    conn.executemany("INSERT INTO chat_messages (session_key, role, content, timestamp, persona) "
+                     "VALUES (?, ?, ?, ?, ?)", message_rows)
+    conn.commit()
+
+
+def open_database():
+    """Create the schema (by importing database.py) in the current directory and connect to it"""
+    sys.path.insert(0, REPO)
+    import sqlite3
+    import database  # noqa: F401 (creates the tables)
+    return sqlite3.connect("chat_history.db")
+
+
+def seed(sessions, messages, rng_seed):
+    conn = open_database()
+    insert_sessions(conn, ((f"load-{key}", key % 4 + 1, messages) for key in range(1, sessions + 1)),
+                    random.Random(rng_seed))
+    conn.close()
+
+
+# ---------- server ----------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, port, args):
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO,
+        LLM_BACKEND="fake",
+        FAKE_LLM_LATENCY=str(args.latency),
+        FAKE_LLM_TOKENS_PER_SEC=str(args.tokens_per_sec),
+        FAKE_LLM_ERROR_RATE=str(args.error_rate),
+        FAKE_LLM_THROTTLE_RATE=str(args.throttle_rate),
+        FAKE_LLM_CAPACITY=str(args.capacity),
+        # Many clients share one address and a few sessions; the limits would measure themselves
+        RATE_LIMIT_REQUESTS=str(10 ** 9),
+        SESSION_RATE_LIMIT_REQUESTS=str(10 ** 9),
+        SEARCH_RATE_LIMIT_REQUESTS=str(10 ** 9),
+        SESSION_WRITE_RATE_LIMIT_REQUESTS=str(10 ** 9),
+    )
+    log = open(os.path.join(workdir, "server.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(args.workers),
+         "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(client, server, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("The server exited during startup; see server.log in the scratch directory")
+        try:
+            if (await client.get("/api/personas")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("The server did not start in time")
+
+
+# ---------- workload ----------
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.statuses = {name: {} for name in ENDPOINTS}
+
+    def record(self, name, status, seconds):
+        self.statuses[name][status] = self.statuses[name].get(status, 0) + 1
+        if status in (200, 304):
+            self.latencies[name].append(seconds * 1000)
+
+
+async def user(client, rng, sessions, mix, deadline, think, recorder):
+    names, weights = list(mix), list(mix.values())
+    etag = None
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        session_id = f"load-{rng.randint(1, sessions)}"
+        start = time.perf_counter()
+        try:
+            if name == "chat":
+                response = await client.post("/api/chat", json={
+                    "session_id": session_id, "persona": "travel",
+                    "message": " ".join(rng.choices(WORDS, k=rng.randint(4, 16))),
+                })
+            elif name == "history":
+                response = await client.get("/api/history", params={"session_id": session_id, "limit": 100})
+            elif name == "sessions":
+                response = await client.get("/api/sessions", headers={"If-None-Match": etag} if etag else {})
+                etag = response.headers.get("etag", etag)
+            else:
+                response = await client.get("/api/stats", params={"session_id": session_id})
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        recorder.record(name, status, time.perf_counter() - start)
+        if think:
+            await asyncio.sleep(rng.expovariate(1 / think))
+
+
+def summarize(recorder, elapsed):
+    results = {}
+    for name in ENDPOINTS:
+        latencies = recorder.latencies[name]
+        total = sum(recorder.statuses[name].values())
+        if not total:
+            continue
+        results[name] = {
+            "requests": total,
+            "ok": len(latencies),
+            "errors": total - len(latencies),
+            "throughput": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "statuses": {str(status): count for status, count in sorted(recorder.statuses[name].items(), key=str)},
+        }
+    return results
+
+
+async def run_scale(scale, args):
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix=f"chatbot-load-{scale}-")
+    started = time.perf_counter()
+    subprocess.run([sys.executable, os.path.abspath(__file__), "seed", "--sessions", str(scale),
+                    "--messages", str(args.messages), "--seed", str(args.seed)], cwd=workdir, check=True)
+    seed_seconds = time.perf_counter() - started
+
+    port = free_port()
+    server = start_server(workdir, port, args)
+    try:
+        limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout,
+                                     limits=limits) as client:
+            await wait_ready(client, server)
+            recorder = Recorder()
+            rng = random.Random(args.seed)
+            mix = parse_mix(args.mix)
+            start = time.monotonic()
+            deadline = start + args.duration
+            await asyncio.gather(*(
+                user(client, random.Random(rng.random()), scale, mix, deadline, args.think, recorder)
+                for _ in range(args.users)
+            ))
+            elapsed = time.monotonic() - start
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "sessions": scale,
+        "messages": scale * args.messages,
+        "seed_seconds": round(seed_seconds, 2),
+        "elapsed": round(elapsed, 2),
+        "endpoints": summarize(recorder, elapsed),
+    }
+
+
+def print_scale(result):
+    print(f"\n{result['sessions']} sessions / {result['messages']} messages "
+          f"(seeded in {result['seed_seconds']}s, ran {result['elapsed']}s)")
+    print(f"{'endpoint':<10}{'req/s':>9}{'ok':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in result["endpoints"].items():
+        print(f"{name:<10}{r['throughput']:>9.1f}{r['ok']:>8}{r['errors']:>8}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    parse_mix(args.mix)  # fail before seeding anything
+    report = {
+        "commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("command", "func", "output")},
+        "scales": [],
+    }
+    for scale in args.scales:
+        result = asyncio.run(run_scale(scale, args))
+        print_scale(result)
+        report["scales"].append(result)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+
+# ---------- comparison ----------
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"before: {args.before} ({before.get('commit')}, {before.get('started_at')})")
+    print(f"after:  {args.after} ({after.get('commit')}, {after.get('started_at')})")
+    old_scales = {s["sessions"]: s for s in before["scales"]}
+    regressions = 0
+    for scale in after["scales"]:
+        old = old_scales.get(scale["sessions"])
+        if old is None:
+            continue
+        print(f"\n{scale['sessions']} sessions")
+        width = max([10] + [len(name) + 2 for name in scale["endpoints"]])
+        print(f"{'endpoint':<{width}}{'metric':<12}{'before':>10}{'after':>10}{'change':>9}")
+        for name, new in scale["endpoints"].items():
+            previous = old["endpoints"].get(name)
+            if previous is None:
+                continue
+            # Higher is worse for latencies, lower is worse for throughput
+            for metric, higher_is_worse in (("throughput", False), ("p50_ms", True), ("p95_ms", True),
+                                            ("p99_ms", True)):
+                a, b = previous[metric], new[metric]
+                change = (b - a) / a if a else 0.0
+                worse = change > args.threshold if higher_is_worse else change < -args.threshold
+                flag = "  REGRESSED" if worse and metric != "p50_ms" else ""
+                regressions += bool(flag)
+                print(f"{name:<{width}}{metric:<12}{a:>10.1f}{b:>10.1f}{change:>+9.1%}{flag}")
+            if new["errors"] > previous["errors"]:
+                print(f"{name:<{width}}{'errors':<12}{previous['errors']:>10}{new['errors']:>10}")
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("run", help="seed, start the app and drive the mixed workload")
+    p.add_argument("--scales", type=int, nargs="+", default=[100, 1000, 10000], help="sessions to seed per run")
+    p.add_argument("--messages", type=int, default=20, help="messages per seeded session")
+    p.add_argument("--users", type=int, default=32, help="concurrent closed-loop clients")
+    p.add_argument("--duration", type=float, default=30, help="seconds of load per scale")
+    p.add_argument("--think", type=float, default=0.0, help="mean pause between a client's requests (s)")
+    p.add_argument("--mix", default=DEFAULT_MIX, help=f"endpoint weights (default {DEFAULT_MIX})")
+    p.add_argument("--latency", type=float, default=0.5, help="fake LLM time to first token (s)")
+    p.add_argument("--tokens-per-sec", type=float, default=200, help="fake LLM generation speed")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of LLM calls failing with 503")
+    p.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of LLM calls answered with 429")
+    p.add_argument("--capacity", type=int, default=0, help="concurrent LLM calls before 429s (0 = unlimited)")
+    p.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    p.add_argument("--timeout", type=float, default=60, help="client timeout per request (s)")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--output", default="loadtest-results.json")
+    p.set_defaults(func=run)
+
+    p = commands.add_parser("compare", help="compare two saved runs")
+    p.add_argument("before")
+    p.add_argument("after")
+    p.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    p.set_defaults(func=compare)
+
+    p = commands.add_parser("seed", help="seed ./chat_history.db only (used by run)")
+    p.add_argument("--sessions", type=int, required=True)
+    p.add_argument("--messages", type=int, default=20)
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=lambda a: seed(a.sessions, a.messages, a.seed))
+
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,268 @@
+# benchmarks/replay.py
+"""
+Replay a captured traffic trace (TRAFFIC_CAPTURE, see traffic_capture.py)
+against a local instance with the fake LLM.
+
+Requests are sent open-loop at their captured arrival times, divided by
+--speed (2 = twice as fast, so twice the load), whatever the server's
+response times; the shapes come from the trace:
+  - chats carry a message of the captured length in the same (hashed)
+    session and persona, with a fake-LLM directive reproducing the captured
+    upstream time and reply length (cached replies get no upstream time);
+  - history/stats/search/session requests use the same sessions, query
+    word counts and revalidation (304s send the last ETag seen);
+  - sessions that already had messages when capture started are seeded
+    with that many synthetic messages first.
+Streams of /api/sessions/events are skipped. The trace and the seed fix
+every request, so two replays send the same traffic.
+
+By default it seeds a scratch database and starts uvicorn with --workers
+workers, which makes it a way to size worker counts offline. With --url it
+drives an instance you started yourself (use LLM_BACKEND=fake so the
+directives apply; nothing is seeded).
+
+It prints, per endpoint, replayed vs captured p50/p95/p99 and how late the
+client sent requests (if it could not keep up, raise the server's
+resources, not --speed), and saves results in loadtest.py's format, so
+`python benchmarks/loadtest.py compare` works on two replays.
+
+Usage:
+    TRAFFIC_CAPTURE=traffic.jsonl TRAFFIC_CAPTURE_SALT=... uvicorn main:app   # in production
+    python benchmarks/replay.py traffic.jsonl --speed 1 --workers 2 --output replay-2w.json
+    python benchmarks/replay.py traffic.jsonl --speed 4 --workers 4 --output replay-4w.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from loadtest import (WORDS, percentile, insert_sessions, open_database, free_port, start_server, wait_ready,
+                      git_commit)
+
+SKIPPED_ENDPOINTS = {"/api/sessions/events", "unmatched"}
+
+
+def load_trace(path, limit=None):
+    records = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # a line cut short by a crash
+    records.sort(key=lambda r: r["t"])
+    return records[:limit] if limit else records
+
+
+def replay_session_id(record):
+    return f"replay-{record['s']}" if "s" in record else None
+
+
+def seeded_sessions(records):
+    """(session_id, persona, messages before the trace) for sessions that started before capture"""
+    first = {}
+    for record in records:
+        if "s" in record and "d" in record and record["s"] not in first:
+            first[record["s"]] = record
+    sessions = []
+    for record in first.values():
+        depth = record["d"] - 1 if record["ep"].startswith("/api/chat") else record["d"]
+        if depth > 0:
+            sessions.append((replay_session_id(record), record.get("p") or "travel", depth))
+    return sessions
+
+
+def message_for(record, index):
+    """A message of the captured length; the directive sets the fake LLM's time and reply length"""
+    rng = random.Random(f"{record.get('s')}:{index}")
+    directive = ""
+    if "llm" in record or record.get("c"):
+        upstream = 0.0 if record.get("c") else record["llm"] / 1000
+        directive = f" [fake latency={upstream:.3f} reply={record.get('out', 200)}]"
+    target = max(1, record.get("len", 40) - len(directive))
+    words = []
+    while sum(len(w) + 1 for w in words) < target:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)[:target] + directive
+
+
+class Replayer:
+    def __init__(self, client, seed):
+        self.client = client
+        self.seed = seed
+        self.etags = {}  # (endpoint, session) -> last ETag, for requests captured as 304s
+        self.latencies = {}
+        self.captured = {}
+        self.statuses = {}
+        self.lateness = []
+        self.skipped = 0
+
+    async def send(self, index, record):
+        ep, method = record["ep"], record["m"]
+        name = f"{method} {ep}"
+        session_id = replay_session_id(record)
+        rng = random.Random(f"{self.seed}:{index}")
+        etag_key = (ep, session_id)
+        headers = {"If-None-Match": self.etags[etag_key]} if record.get("st") == 304 and etag_key in self.etags else {}
+        start = time.perf_counter()
+        try:
+            if ep in ("/api/chat", "/api/chat/stream"):
+                body = {"session_id": session_id or f"replay-anon-{index}", "persona": record.get("p", "travel"),
+                        "message": message_for(record, index)}
+                response = await self.client.post(ep, json=body)
+                await response.aread()
+            elif ep in ("/api/history", "/api/stats"):
+                params = {"session_id": session_id} if session_id else {}
+                response = await self.client.get(ep, params=params, headers=headers)
+            elif ep == "/api/search":
+                params = {"q": " ".join(rng.choices(WORDS, k=max(1, record.get("w", 1))))}
+                if session_id:
+                    params["session_id"] = session_id
+                response = await self.client.get(ep, params=params)
+            elif ep == "/api/sessions" and method == "DELETE" or ep == "/api/clear":
+                response = await self.client.request("DELETE", ep, json={"session_id": session_id or ""})
+            elif ep == "/api/sessions/rename":
+                response = await self.client.post(ep, json={"session_id": session_id or "", "title": "Renamed"})
+            elif ep == "/api/sessions" and method == "POST":
+                response = await self.client.post(ep, json={})
+            elif method == "GET" and "{" not in ep:
+                response = await self.client.get(ep, headers=headers)
+            else:
+                self.skipped += 1
+                return
+            status = response.status_code
+            if "etag" in response.headers:
+                self.etags[etag_key] = response.headers["etag"]
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = (time.perf_counter() - start) * 1000
+        statuses = self.statuses.setdefault(name, {})
+        statuses[status] = statuses.get(status, 0) + 1
+        if status in (200, 304):
+            self.latencies.setdefault(name, []).append(elapsed)
+        self.captured.setdefault(name, []).append(record["ms"])
+
+    async def run(self, records, speed):
+        records = [r for r in records if r["ep"] not in SKIPPED_ENDPOINTS]
+        origin = records[0]["t"]
+        started = time.monotonic()
+        tasks = []
+        for index, record in enumerate(records):
+            due = started + (record["t"] - origin) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.lateness.append(max(0.0, time.monotonic() - due) * 1000)
+            tasks.append(asyncio.create_task(self.send(index, record)))
+        await asyncio.gather(*tasks)
+        return time.monotonic() - started
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for name, statuses in sorted(self.statuses.items()):
+            latencies = self.latencies.get(name, [])
+            total = sum(statuses.values())
+            captured = self.captured[name]
+            endpoints[name] = {
+                "requests": total,
+                "ok": len(latencies),
+                "errors": total - len(latencies),
+                "throughput": round(len(latencies) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+                "captured_p50_ms": round(percentile(captured, 50), 2),
+                "captured_p95_ms": round(percentile(captured, 95), 2),
+                "captured_p99_ms": round(percentile(captured, 99), 2),
+                "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            }
+        return endpoints
+
+
+async def replay(records, args):
+    import httpx
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        workdir = tempfile.mkdtemp(prefix="chatbot-replay-")
+        subprocess.run([sys.executable, os.path.abspath(__file__), os.path.abspath(args.trace), "--seed-only",
+                        *(["--limit", str(args.limit)] if args.limit else [])], cwd=workdir, check=True)
+        port = free_port()
+        server = start_server(workdir, port, args)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            if server is not None:
+                await wait_ready(client, server)
+            replayer = Replayer(client, args.seed)
+            elapsed = await replayer.run(records, args.speed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return replayer, elapsed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="capture file written with TRAFFIC_CAPTURE")
+    parser.add_argument("--speed", type=float, default=1.0, help="arrival-time speed-up (1 = as captured)")
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N requests")
+    parser.add_argument("--url", default=None, help="existing instance to drive instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the started instance")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM latency for chats without a captured one")
+    parser.add_argument("--tokens-per-sec", type=float, default=200, help="fake LLM generation speed")
+    parser.add_argument("--capacity", type=int, default=0, help="fake provider concurrency before 429s (0 = unlimited)")
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="replay-results.json")
+    parser.add_argument("--seed-only", action="store_true", help=argparse.SUPPRESS)  # used by the scratch instance
+    args = parser.parse_args()
+    args.error_rate = args.throttle_rate = 0.0  # the captured statuses already include upstream failures
+
+    records = load_trace(args.trace, args.limit)
+    if args.seed_only:
+        conn = open_database()
+        from database import PERSONA_CODES  # the schema's codes; imported here, in the scratch directory
+        sessions = [(session_id, PERSONA_CODES.get(persona, PERSONA_CODES["travel"]), depth)
+                    for session_id, persona, depth in seeded_sessions(records)]
+        insert_sessions(conn, sessions, random.Random(args.seed))
+        conn.close()
+        return
+    if not records:
+        raise SystemExit(f"No requests in {args.trace}")
+    span = records[-1]["t"] - records[0]["t"]
+    print(f"Replaying {len(records)} requests spanning {span:.0f}s at {args.speed}x "
+          f"({len(seeded_sessions(records))} sessions seeded)")
+
+    replayer, elapsed = asyncio.run(replay(records, args))
+    endpoints = replayer.summary(elapsed)
+    print(f"\nran {elapsed:.1f}s, skipped {replayer.skipped}, client lateness p99 "
+          f"{percentile(replayer.lateness, 99):.1f} ms")
+    print(f"{'endpoint':<28}{'req':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}   captured p50/p95/p99")
+    for name, r in endpoints.items():
+        print(f"{name:<28}{r['requests']:>7}{r['errors']:>8}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+              f"   {r['captured_p50_ms']:.1f}/{r['captured_p95_ms']:.1f}/{r['captured_p99_ms']:.1f}")
+
+    report = {
+        "commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "seed_only")},
+        "scales": [{"sessions": len({r["s"] for r in records if "s" in r}), "messages": None,
+                    "elapsed": round(elapsed, 2), "endpoints": endpoints}],
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
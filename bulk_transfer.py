@@ -0,0 +1,425 @@
+# bulk_transfer.py
+"""
+Streaming NDJSON export and import of sessions, for moving data between
+environments (GET /api/export, POST /api/import, or this file as a CLI).
+
+One JSON object per line; each session's line comes before its messages:
+
+    {"type": "session", "session_id": "...", "title": "...", "persona": "travel", "summary": null, "summary_count": 0}
+    {"type": "message", "session_id": "...", "role": "user", "content": "...", "timestamp": "2025-01-01T10:00:00", "persona": "travel"}
+
+Export walks sessions and messages in key order with keyset pages
+(EXPORT_BATCH rows), each read in its own short query, so memory stays
+constant and no transaction stays open for the whole export (a long SQLite
+read would stop WAL checkpoints). Sessions can be filtered by persona and
+by last message time. Rows written while an export runs may or may not be
+included; export from a stopped instance or a copy for an exact snapshot.
+Archived sessions are read from their archive blobs without being restored.
+
+Import inserts IMPORT_BATCH lines per transaction, so the write lock is held
+for milliseconds at a time and live chats interleave with a long import.
+Counters, snippets and fallback titles are maintained as for normal writes;
+message ids are assigned by the target. A session that already exists is
+skipped (default), replaced, or appended to. An interrupted import can be
+re-run with existing=replace: every session it touched is imported whole again.
+With sharded storage, export walks the shards one after another and each
+import batch is split by shard, one transaction per shard.
+
+    python bulk_transfer.py export [--persona travel] [--since 2025-01-01] [--until 2025-07-01] [-o out.ndjson.gz]
+    python bulk_transfer.py import in.ndjson.gz [--existing skip|replace|append] [--batch 5000]
+"""
+import os
+import sys
+import gzip
+import time
+import zlib
+import argparse
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional
+
+import orjson
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from database import (
+    IST, PERSONA_CODES, ROLE_CODES, ChatMessage, ChatSession, Shard, shards, shard_for,
+    forget_session, bump_sessions_version, title_from_first_message, get_ist_now,
+)
+from archive import load_messages
+
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "2000"))  # messages per export query
+EXPORT_SESSIONS_PER_PAGE = 500
+EXPORT_CHUNK_BYTES = 64 * 1024  # lines are sent in chunks of about this size
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "5000"))  # lines per import transaction
+EXISTING_MODES = ("skip", "replace", "append")
+
+SESSION_EXPORT_COLUMNS = (
+    ChatSession.key, ChatSession.session_id, ChatSession.title, ChatSession.persona,
+    ChatSession.summary, ChatSession.summary_count, ChatSession.archived,
+)
+ROLE_NAMES = {code: name for name, code in ROLE_CODES.items()}
+PERSONA_NAMES = {code: name for name, code in PERSONA_CODES.items()}
+
+
+class BadRecord(ValueError):
+    """An input line that cannot be imported; `line` is its 1-based number"""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+# ---------- export ----------
+
+def _session_filters(persona: Optional[str], since: Optional[datetime], until: Optional[datetime]) -> list:
+    filters = []
+    if persona:
+        filters.append(ChatSession.persona == persona)
+    if since:
+        filters.append(ChatSession.last_message_time >= since)
+    if until:
+        filters.append(ChatSession.last_message_time < until)
+    return filters
+
+
+def _messages_of(shard: Shard, keys: List[int], batch: int) -> Iterator:
+    """Messages of the given sessions in (session_key, id) order, one short query per page"""
+    position = (keys[0] - 1, 0)
+    while True:
+        with shard.ReadSessionLocal() as db:
+            rows = db.execute(
+                select(ChatMessage.session_key, ChatMessage.id, ChatMessage.role, ChatMessage.content,
+                       ChatMessage.timestamp, ChatMessage.persona)
+                .where(ChatMessage.session_key.in_(keys),
+                       tuple_(ChatMessage.session_key, ChatMessage.id) > position)
+                .order_by(ChatMessage.session_key, ChatMessage.id)
+                .limit(batch)
+            ).all()
+        yield from rows
+        if len(rows) < batch:
+            return
+        position = (rows[-1].session_key, rows[-1].id)
+
+
+def export_records(persona: Optional[str] = None, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None, batch: int = EXPORT_BATCH) -> Iterator[dict]:
+    """Session and message records of the matching sessions, shard by shard in session key order"""
+    for shard in shards:
+        yield from _shard_records(shard, _session_filters(persona, since, until), batch)
+
+
+def _shard_records(shard: Shard, filters: list, batch: int) -> Iterator[dict]:
+    after_key = 0
+    while True:
+        with shard.ReadSessionLocal() as db:
+            sessions = db.execute(
+                select(*SESSION_EXPORT_COLUMNS).where(ChatSession.key > after_key, *filters)
+                .order_by(ChatSession.key).limit(EXPORT_SESSIONS_PER_PAGE)
+            ).all()
+        if not sessions:
+            return
+        messages = _messages_of(shard, [s.key for s in sessions], batch)
+        row = next(messages, None)
+        for session in sessions:
+            yield {"type": "session", "session_id": session.session_id, "title": session.title,
+                   "persona": session.persona, "summary": session.summary, "summary_count": session.summary_count}
+            if session.archived:
+                yield from _archived_records(session.session_id)
+            while row is not None and row.session_key == session.key:
+                yield {"type": "message", "session_id": session.session_id, "role": row.role, "content": row.content,
+                       "timestamp": row.timestamp.isoformat() if row.timestamp else None, "persona": row.persona}
+                row = next(messages, None)
+        after_key = sessions[-1].key
+
+
+def _archived_records(session_id: str) -> Iterator[dict]:
+    """Message records of an archived session, from its blob (see archive.py)"""
+    for _, role, content, timestamp, persona in load_messages(session_id):
+        yield {"type": "message", "session_id": session_id, "role": ROLE_NAMES[role], "content": content,
+               "timestamp": datetime.fromtimestamp(timestamp / 1000, IST).replace(tzinfo=None).isoformat(),
+               "persona": PERSONA_NAMES.get(persona)}
+
+
+def export_chunks(records: Iterable[dict], chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """NDJSON bytes in chunks of about `chunk_bytes` (one write/thread hop per chunk, not per line)"""
+    lines, size = [], 0
+    for record in records:
+        line = orjson.dumps(record) + b"\n"
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield b"".join(lines)
+            lines, size = [], 0
+    if lines:
+        yield b"".join(lines)
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Stream-compress chunks into one gzip member"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# ---------- import ----------
+
+def parse_line(line: bytes, number: int) -> Optional[dict]:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = orjson.loads(line)
+    except orjson.JSONDecodeError as e:
+        raise BadRecord(number, f"invalid JSON ({e})") from None
+    if not isinstance(record, dict) or not record.get("session_id"):
+        raise BadRecord(number, "expected an object with a session_id")
+    record["_line"] = number
+    return record
+
+
+class Importer:
+    """
+    Writes parsed records batch by batch; remembers only the current session (per
+    shard), so memory does not grow with the input (lines of a session must be contiguous).
+    """
+
+    def __init__(self, existing: str = "skip"):
+        if existing not in EXISTING_MODES:
+            raise ValueError(f"existing must be one of {', '.join(EXISTING_MODES)}")
+        self.existing = existing
+        self._session_id = None
+        self._key = None  # None while skipping the current session
+        self._current = {}  # shard index -> (session_id, key) carried over to the shard's next batch
+        self.sessions = 0
+        self.messages = 0
+        self.skipped_sessions = 0
+        self.skipped_messages = 0
+
+    def stats(self) -> dict:
+        return {"sessions": self.sessions, "messages": self.messages,
+                "skipped_sessions": self.skipped_sessions, "skipped_messages": self.skipped_messages}
+
+    def write(self, db: Session, records: List[dict], shard: int = 0) -> List[str]:
+        """Import `records` (all on shard `shard`) in the caller's transaction; returns the session ids written to"""
+        self._session_id, self._key = self._current.get(shard, (None, None))
+        rows, touched = [], {}
+        for record in records:
+            kind = record.get("type", "message")
+            if kind == "session":
+                if record["session_id"] != self._session_id:
+                    self._start(db, record)
+            elif kind == "message":
+                if record["session_id"] != self._session_id:
+                    self._start(db, {"session_id": record["session_id"], "_line": record["_line"]})
+                if self._key is None:
+                    self.skipped_messages += 1
+                    continue
+                rows.append(self._message_row(record))
+                self._fold(touched, record, rows[-1])
+            else:
+                raise BadRecord(record["_line"], f"unknown type {kind!r}")
+        if rows:
+            db.execute(ChatMessage.__table__.insert(), rows)
+            self.messages += len(rows)
+        for key, fold in touched.items():
+            self._update_session(db, key, fold)
+        db.execute(bump_sessions_version())
+        self._current[shard] = (self._session_id, self._key)
+        return [fold["session_id"] for fold in touched.values()]
+
+    def _start(self, db: Session, header: dict):
+        session_id = header["session_id"]
+        self._session_id = session_id
+        key = db.scalar(select(ChatSession.key).where(ChatSession.session_id == session_id))
+        if key is not None and self.existing == "skip":
+            self._key = None
+            self.skipped_sessions += 1
+            return
+        if key is not None and self.existing == "replace":
+            forget_session(db, session_id)
+            key = None
+        if key is None:
+            if header.get("persona") is not None and header["persona"] not in PERSONA_CODES:
+                raise BadRecord(header["_line"], f"unknown persona {header['persona']!r}")
+            session = ChatSession(
+                session_id=session_id, title=header.get("title"), persona=header.get("persona"),
+                summary=header.get("summary"), summary_count=header.get("summary_count") or 0,
+                snippet="", message_count=0, user_message_count=0,
+            )
+            db.add(session)
+            db.flush()
+            key = session.key
+        self._key = key
+        self.sessions += 1
+
+    def _message_row(self, record: dict) -> dict:
+        if record.get("role") not in ROLE_CODES:
+            raise BadRecord(record["_line"], f"role must be one of {', '.join(ROLE_CODES)}")
+        if record.get("persona") is not None and record["persona"] not in PERSONA_CODES:
+            raise BadRecord(record["_line"], f"unknown persona {record['persona']!r}")
+        if not isinstance(record.get("content"), str):
+            raise BadRecord(record["_line"], "content must be a string")
+        try:
+            timestamp = datetime.fromisoformat(record["timestamp"]) if record.get("timestamp") else get_ist_now()
+        except (TypeError, ValueError):
+            raise BadRecord(record["_line"], f"bad timestamp {record['timestamp']!r}") from None
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(IST).replace(tzinfo=None)  # naive IST, like the rest of the app
+        return {"session_key": self._key, "role": record["role"], "content": record["content"],
+                "timestamp": timestamp, "persona": record.get("persona")}
+
+    def _fold(self, touched: dict, record: dict, row: dict):
+        fold = touched.get(self._key)
+        if fold is None:
+            fold = touched[self._key] = {"session_id": self._session_id, "count": 0, "user_count": 0,
+                                         "first_user": None, "last_time": None, "persona": None}
+        fold["count"] += 1
+        if row["role"] == "user":
+            fold["user_count"] += 1
+            if fold["first_user"] is None:
+                fold["first_user"] = row["content"]
+        if fold["last_time"] is None or row["timestamp"] >= fold["last_time"]:
+            fold["last_time"] = row["timestamp"]
+            fold["persona"] = row["persona"] or fold["persona"]
+
+    @staticmethod
+    def _update_session(db: Session, key: int, fold: dict):
+        """Fold a batch's messages into the session row, as add_message does for one"""
+        session = db.get(ChatSession, key)
+        if session.user_message_count == 0 and fold["first_user"] is not None:
+            session.snippet = fold["first_user"][:60]
+            session.fallback_title = title_from_first_message(fold["first_user"])
+        session.message_count += fold["count"]
+        session.user_message_count += fold["user_count"]
+        if session.last_message_time is None or fold["last_time"] > session.last_message_time:
+            session.last_message_time = fold["last_time"]
+            session.persona = fold["persona"] or session.persona
+
+
+def import_lines(lines: Iterable[bytes], existing: str = "skip", batch: int = IMPORT_BATCH,
+                 pause: float = 0.0, verbose: bool = False) -> dict:
+    """Import NDJSON lines in `batch`-line transactions (CLI path); returns the importer's counts"""
+    importer = Importer(existing)
+    records = []
+    for number, line in enumerate(lines, 1):
+        record = parse_line(line, number)
+        if record is not None:
+            records.append(record)
+        if len(records) >= batch:
+            _commit_batch(importer, records)
+            records = []
+            if verbose:
+                print(f"  {importer.messages} messages in {importer.sessions} sessions")
+            if pause:
+                time.sleep(pause)  # leave the writer lock to live traffic between batches
+    if records:
+        _commit_batch(importer, records)
+    return importer.stats()
+
+
+def by_shard(records: List[dict]) -> dict:
+    """Records grouped by the shard of their session, in input order"""
+    if len(shards) == 1:
+        return {shards[0]: records}
+    groups = {}
+    for record in records:
+        groups.setdefault(shard_for(record["session_id"]), []).append(record)
+    return groups
+
+
+def _commit_batch(importer: Importer, records: List[dict]):
+    for shard, group in by_shard(records).items():
+        with shard.SessionLocal() as db:
+            importer.write(db, group, shard.index)
+            db.commit()
+
+
+async def _lines(chunks: AsyncIterator[bytes], gzipped: bool) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj(47) if gzipped else None  # 47: gzip or zlib header
+    pending = b""
+    async for chunk in chunks:
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+async def import_stream(chunks: AsyncIterator[bytes], importer: Importer, gzipped: bool = False,
+                        batch: int = IMPORT_BATCH, on_batch: Optional[Callable[[List[str]], None]] = None):
+    """Import an NDJSON request body as it arrives (API path); `on_batch` gets each batch's session ids"""
+    async def commit(records):
+        for shard, group in by_shard(records).items():
+            async with shard.AsyncSessionLocal() as db:
+                session_ids = await db.run_sync(lambda session: importer.write(session, group, shard.index))
+                await db.commit()
+            if on_batch:
+                on_batch(session_ids)
+
+    records = []
+    number = 0
+    async for line in _lines(chunks, gzipped):
+        number += 1
+        record = parse_line(line, number)
+        if record is not None:
+            records.append(record)
+        if len(records) >= batch:
+            await commit(records)
+            records = []
+    if records:
+        await commit(records)
+
+
+# ---------- CLI ----------
+
+def _open(path: str, mode: str):
+    if path == "-":
+        return sys.stdout.buffer if "w" in mode else sys.stdin.buffer
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def _date(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import sessions as NDJSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("export", help="write sessions and messages as NDJSON")
+    p.add_argument("-o", "--output", default="-", help="file (.gz to compress) or - for stdout")
+    p.add_argument("--persona", default=None)
+    p.add_argument("--since", type=_date, default=None, help="last message at or after (ISO date/time, IST)")
+    p.add_argument("--until", type=_date, default=None, help="last message before (ISO date/time, IST)")
+    p.add_argument("--batch", type=int, default=EXPORT_BATCH, help="messages per query")
+    p = commands.add_parser("import", help="read NDJSON written by export")
+    p.add_argument("input", help="file (.gz is decompressed) or - for stdin")
+    p.add_argument("--existing", choices=EXISTING_MODES, default="skip", help="sessions already present")
+    p.add_argument("--batch", type=int, default=IMPORT_BATCH, help="lines per transaction")
+    p.add_argument("--pause", type=float, default=0.0, help="seconds between batches")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "export":
+        out = _open(args.output, "wb")
+        written = 0
+        for chunk in export_chunks(export_records(args.persona, args.since, args.until, args.batch)):
+            out.write(chunk)
+            written += len(chunk)
+        out.flush()
+        if out is not sys.stdout.buffer:
+            out.close()
+        print(f"Exported {written / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    else:
+        with _open(args.input, "rb") as f:
+            try:
+                stats = import_lines(f, args.existing, args.batch, args.pause, verbose=True)
+            except BadRecord as e:
+                sys.exit(f"Import stopped at {e}; earlier batches are committed "
+                         "(re-run with --existing replace to redo the sessions involved)")
+        print(f"Imported {stats} in {time.perf_counter() - started:.1f}s")
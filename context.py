@@ -0,0 +1,168 @@
+# context.py
+"""
+Token-budgeted conversation context for Gemini.
+
+Instead of always sending the last N rows, each turn keeps the newest messages
+that fit the persona's token budget. Older turns are folded into a rolling
+summary stored on the session row (`summary`, plus `summary_count`: how many
+messages, oldest first, it covers). The summary is extended in the background
+a batch at a time, never recomputed from scratch.
+"""
+import os
+import asyncio
+from typing import Callable, List, Optional
+
+from sqlalchemy import select, update
+
+from database import ChatMessage, ChatSession, session_key_of, shard_for
+from llm import model_registry
+from llm_scheduler import SUMMARY
+from llm_resilience import resilient_llm
+from metrics import stage, report_error
+
+DEFAULT_CONTEXT_BUDGET = 4000  # tokens, for personas without "context_budget"
+SUMMARY_BATCH_MESSAGES = int(os.getenv("SUMMARY_BATCH_MESSAGES", "10"))  # fold older turns this many at a time
+SUMMARY_MAX_WORDS = 200
+
+# --- Token estimation (pluggable) ---
+
+def estimate_tokens_by_chars(text: str) -> int:
+    """~4 characters per token, Gemini's rule of thumb for English"""
+    return len(text) // 4 + 1
+
+def estimate_tokens_by_words(text: str) -> int:
+    """~0.75 words per token; closer for text with long words or many emojis"""
+    return int(len(text.split()) * 4 / 3) + 1
+
+TOKEN_ESTIMATORS = {
+    "chars": estimate_tokens_by_chars,
+    "words": estimate_tokens_by_words,
+}
+
+_estimate_tokens = TOKEN_ESTIMATORS[os.getenv("CONTEXT_TOKENIZER", "chars")]
+
+def set_token_estimator(estimator: Callable[[str], int]):
+    """Swap the token estimate, e.g. for a real tokenizer"""
+    global _estimate_tokens
+    _estimate_tokens = estimator
+
+def estimate_tokens(text: str) -> int:
+    return _estimate_tokens(text)
+
+def history_tokens(history: List[dict]) -> int:
+    return sum(estimate_tokens(part) for item in history for part in item["parts"])
+
+
+# --- Rolling summary storage ---
+
+async def load_summary(db, session_id: str):
+    """(messages covered, summary text) for a session; (0, "") if there is none"""
+    row = (await db.execute(
+        select(ChatSession.summary_count, ChatSession.summary).where(ChatSession.session_id == session_id)
+    )).first()
+    return (row[0], row[1] or "") if row else (0, "")
+
+def summary_exchange(text: str) -> List[dict]:
+    """Present the summary to Gemini as an opening exchange (persona models keep their own instruction)"""
+    return [
+        {"role": "user", "parts": [f"Summary of our conversation so far:\n{text}"]},
+        {"role": "model", "parts": ["Thanks, I'll keep that in mind."]},
+    ]
+
+
+# --- Context selection ---
+
+async def build_context(db, session_id: str, history: List[dict], total_messages: int, budget: int) -> List[dict]:
+    """
+    Trim `history` (the last len(history) of the session's `total_messages` user/bot
+    messages, current message included) to the newest messages within `budget` tokens,
+    prefixed with the rolling summary when older messages are left out.
+    """
+    # Newest-first until the budget is spent; always keep the current message
+    used = 0
+    keep = 0
+    for item in reversed(history):
+        cost = sum(estimate_tokens(part) for part in item["parts"])
+        if keep and used + cost > budget:
+            break
+        used += cost
+        keep += 1
+
+    first_kept = total_messages - keep  # session index of the oldest kept message
+    if first_kept == 0:
+        return history
+
+    covered, summary_text = await load_summary(db, session_id)
+
+    if first_kept > covered:
+        if first_kept - covered >= SUMMARY_BATCH_MESSAGES:
+            schedule_summary_update(session_id, first_kept)
+        # Until the summary catches up, keep the uncovered messages we have (soft budget)
+        keep = min(len(history), total_messages - covered)
+
+    window = history[len(history) - keep:]
+    return summary_exchange(summary_text) + window if summary_text else window
+
+
+# --- Background summarization ---
+
+_in_progress = set()
+_tasks = set()
+
+def schedule_summary_update(session_id: str, through: int):
+    """Fold messages up to session index `through` into the summary, once per session at a time"""
+    if session_id in _in_progress:
+        return
+    _in_progress.add(session_id)
+    task = asyncio.create_task(_update_summary(session_id, through))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+async def _update_summary(session_id: str, through: int):
+    shard = shard_for(session_id)
+    try:
+        # Read on the read pool; the writer connection is only taken once the new summary is ready
+        async with shard.AsyncReadSessionLocal() as db:
+            covered, summary_text = await load_summary(db, session_id)
+            if through <= covered:
+                return
+
+            messages = (await db.scalars(
+                select(ChatMessage).where(
+                    ChatMessage.session_key == session_key_of(session_id)
+                ).order_by(ChatMessage.id.asc()).offset(covered).limit(through - covered)
+            )).all()
+        if not messages:
+            return
+
+        new_text = await summarize(summary_text, messages)
+        async with shard.AsyncSessionLocal() as db:
+            # Only extend the summary we started from (a cleared session no longer matches)
+            await db.execute(
+                update(ChatSession)
+                .where(ChatSession.session_id == session_id, ChatSession.summary_count == covered)
+                .values(summary=new_text, summary_count=covered + len(messages))
+            )
+            await db.commit()
+    except Exception:
+        report_error("summary")
+    finally:
+        _in_progress.discard(session_id)
+
+async def summarize(previous: Optional[str], messages: List[ChatMessage]) -> str:
+    """Extend `previous` with `messages` using Gemini"""
+    transcript = "\n".join(f"{'User' if m.role == 'user' else 'Assistant'}: {m.content}" for m in messages)
+    prompt = f"""Update the running summary of a conversation with the new messages below.
+Keep the user's goals, preferences, constraints and any decisions or recommendations made.
+Stay under {SUMMARY_MAX_WORDS} words. Return ONLY the updated summary.
+
+Current summary:
+{previous or "(none yet)"}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+    with stage("summary"):
+        response = await resilient_llm.call(lambda: model_registry.plain().generate_content_async(prompt), SUMMARY)
+    return response.text.strip()
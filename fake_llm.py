@@ -0,0 +1,165 @@
+# fake_llm.py
+"""
+Local stand-in for google.generativeai models.
+
+Used when LLM_BACKEND=fake so the API can be exercised (benchmarks, local
+load tests) without a Gemini key or network access. It mimics the small part
+of the GenerativeModel / ChatSession surface that main.py relies on.
+"""
+import os
+import re
+import random
+import asyncio
+
+# Simulated time to first token, in seconds
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+# Simulated generation speed once the reply starts
+FAKE_LLM_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "50"))
+# Simulated prompt processing speed for chat history (0 = history is free)
+FAKE_LLM_PREFILL_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_PREFILL_TOKENS_PER_SEC", "0"))
+# Simulated provider throttling: calls beyond this many at once get a 429 (0 = unlimited)
+FAKE_LLM_CAPACITY = int(os.getenv("FAKE_LLM_CAPACITY", "0"))
+# Fraction of calls that get a 429 regardless of load
+FAKE_LLM_THROTTLE_RATE = float(os.getenv("FAKE_LLM_THROTTLE_RATE", "0"))
+# Fraction of calls that fail with a 503 after the usual latency
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+# Fraction of calls that stall for FAKE_LLM_STALL_SECONDS before responding (tail latency)
+FAKE_LLM_STALL_RATE = float(os.getenv("FAKE_LLM_STALL_RATE", "0"))
+FAKE_LLM_STALL_SECONDS = float(os.getenv("FAKE_LLM_STALL_SECONDS", "30"))
+
+# Per-call override used by benchmarks/replay.py: "[fake latency=0.81 reply=512]" anywhere in the
+# prompt makes the call take that many seconds in total and return about that many characters
+REPLAY_DIRECTIVE = re.compile(r"\[fake latency=([\d.]+) reply=(\d+)\]")
+
+
+class FakeThrottled(Exception):
+    """Like google.api_core.exceptions.ResourceExhausted"""
+
+    code = 429
+
+    def __init__(self):
+        super().__init__("429 Resource has been exhausted (e.g. check quota).")
+
+
+class FakeUnavailable(Exception):
+    """Like google.api_core.exceptions.ServiceUnavailable"""
+
+    code = 503
+
+    def __init__(self):
+        super().__init__("503 The model is overloaded. Please try again later.")
+
+
+class _Load:
+    """Calls currently being served, to emulate a provider-side concurrency limit"""
+
+    active = 0
+    throttled = 0
+
+    @classmethod
+    def admit(cls):
+        if (FAKE_LLM_CAPACITY and cls.active >= FAKE_LLM_CAPACITY) or random.random() < FAKE_LLM_THROTTLE_RATE:
+            cls.throttled += 1
+            raise FakeThrottled()
+        cls.active += 1
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeStreamResponse:
+    """
+    Async iterator of chunks, like a stream=True Gemini response. Holds one unit of the
+    simulated capacity until the stream ends, is closed, or is dropped without being read.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self._open = True
+
+    async def __aiter__(self):
+        try:
+            for token in self.tokens:
+                await asyncio.sleep(1 / FAKE_LLM_TOKENS_PER_SEC)
+                yield FakeResponse(token)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._open:
+            self._open = False
+            _Load.active -= 1
+
+    def __del__(self):
+        self.close()
+
+
+class FakeChatSession:
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    async def send_message_async(self, content, **kwargs):
+        if FAKE_LLM_PREFILL_TOKENS_PER_SEC > 0:
+            prompt_chars = sum(len(part) for item in self.history for part in item["parts"])
+            await asyncio.sleep(prompt_chars / 4 / FAKE_LLM_PREFILL_TOKENS_PER_SEC)
+        return await self.model.generate_content_async(content, **kwargs)
+
+
+class FakeCachedContent:
+    """Stand-in for genai.caching.CachedContent (provider-side cached prompt prefix)"""
+
+    def __init__(self, model, system_instruction=None, ttl=None, display_name=None):
+        self.model = model
+        self.system_instruction = system_instruction
+        self.ttl = ttl
+        self.display_name = display_name
+
+    @classmethod
+    def create(cls, model, system_instruction=None, ttl=None, display_name=None, **kwargs):
+        return cls(model, system_instruction, ttl, display_name)
+
+    def update(self, ttl=None, **kwargs):
+        self.ttl = ttl
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name: str = "fake-model", system_instruction: str = None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cached_content = kwargs.get("cached_content")
+
+    @classmethod
+    def from_cached_content(cls, cached_content, **kwargs):
+        return cls(cached_content.model, cached_content.system_instruction, cached_content=cached_content)
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        prompt = contents if isinstance(contents, str) else str(contents)
+        latency = FAKE_LLM_LATENCY
+        directive = REPLAY_DIRECTIVE.search(prompt)
+        if directive:
+            tokens = ["word "] * max(1, int(directive.group(2)) // 5)
+            latency = max(0.0, float(directive.group(1)) - len(tokens) / FAKE_LLM_TOKENS_PER_SEC)
+        else:
+            tokens = [f"{word} " for word in f"Fake reply to: {prompt[:80]}".split()]
+        _Load.admit()
+        try:
+            stalled = random.random() < FAKE_LLM_STALL_RATE
+            await asyncio.sleep(FAKE_LLM_STALL_SECONDS if stalled else latency)
+            if random.random() < FAKE_LLM_ERROR_RATE:
+                raise FakeUnavailable()
+        except BaseException:
+            _Load.active -= 1
+            raise
+        if stream:
+            return FakeStreamResponse(tokens)  # releases the capacity when the stream ends
+        try:
+            await asyncio.sleep(len(tokens) / FAKE_LLM_TOKENS_PER_SEC)
+            return FakeResponse("".join(tokens).strip())
+        finally:
+            _Load.active -= 1
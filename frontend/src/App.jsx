@@ -10,11 +10,14 @@ function App() {
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(false);
   const [msgCount, setMsgCount] = useState(0);
+  const [olderCursor, setOlderCursor] = useState(null);
 
   const [sessionId, setSessionId] = useState(null);
   const [personas, setPersonas] = useState([]);
   const [currentPersona, setCurrentPersona] = useState("travel");
   const messagesEndRef = useRef(null);
+  // True while a message is being sent; a second click/Enter in the same tick must not resend it
+  const sendingRef = useRef(false);
 
   // Fetch available personas
   useEffect(() => {
@@ -64,12 +67,27 @@ function App() {
       const res = await axios.get("http://127.0.0.1:8000/api/history", {
         params: { session_id: sessionId },
       });
-      setMessages(res.data);
+      setMessages(res.data.messages);
+      setOlderCursor(res.data.has_more ? res.data.next_cursor : null);
     } catch (error) {
       console.error("Error fetching history:", error);
     }
   };
 
+  // Prepend the previous page of history (keyset pagination on message id)
+  const fetchOlderHistory = async () => {
+    if (!sessionId || !olderCursor) return;
+    try {
+      const res = await axios.get("http://127.0.0.1:8000/api/history", {
+        params: { session_id: sessionId, before_id: olderCursor },
+      });
+      setMessages((prev) => [...res.data.messages, ...prev]);
+      setOlderCursor(res.data.has_more ? res.data.next_cursor : null);
+    } catch (error) {
+      console.error("Error fetching older history:", error);
+    }
+  };
+
   const fetchStats = async () => {
     if (!sessionId) return;
     try {
@@ -96,6 +114,7 @@ function App() {
       setSessionId(sid);
       setCurrentPersona(personaToUse);
       setMessages([]);
+      setOlderCursor(null);
       setMsgCount(0);
       return sid;
     } catch (e) {
@@ -103,30 +122,92 @@ function App() {
     }
   };
 
+  // Read an SSE response body and call onEvent(event, data) for every frame
+  const readEventStream = async (res, onEvent) => {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const frame = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let event = "message";
+        let data = "";
+        for (const line of frame.split("\n")) {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        }
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+  };
+
   const sendMessage = async () => {
-    if (!input.trim() || !sessionId) return;
+    if (!input.trim() || !sessionId || sendingRef.current) return;
+    sendingRef.current = true;
     const userMsg = { role: "user", content: input, timestamp: null };
+    const botMsg = { role: "bot", content: "", timestamp: null };
 
     setMessages((prev) => [...prev, userMsg]);
     setInput("");
     setLoading(true);
 
+    // Replace the last (streaming) bot message with an updated copy
+    const updateBotMsg = (update) => {
+      setMessages((prev) => [...prev.slice(0, -1), { ...prev[prev.length - 1], ...update }]);
+    };
+
     try {
-      const res = await axios.post("http://127.0.0.1:8000/api/chat", {
-        session_id: sessionId,
-        message: userMsg.content,
-        persona: currentPersona,
+      // Stream the reply token by token instead of waiting for the full response
+      const res = await fetch("http://127.0.0.1:8000/api/chat/stream", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          session_id: sessionId,
+          message: userMsg.content,
+          persona: currentPersona,
+        }),
       });
 
-      // Fetch updated history to get correct IST timestamps from backend
-      await fetchHistory();
-      fetchStats();
-      
-      // If title was generated/updated, trigger sidebar refresh
-      if (res.data.title_generated) {
-        // Trigger a custom event to refresh sidebar
-        window.dispatchEvent(new CustomEvent('refreshSessions'));
+      if (!res.ok) {
+        const body = await res.json().catch(() => ({}));
+        throw { response: { status: res.status, data: body } };
       }
+
+      let text = "";
+      let started = false;
+      await readEventStream(res, (event, data) => {
+        if (event === "token") {
+          text += data.text;
+          if (!started) {
+            started = true;
+            setLoading(false);
+            setMessages((prev) => [...prev, { ...botMsg, content: text }]);
+          } else {
+            updateBotMsg({ content: text });
+          }
+        } else if (event === "done") {
+          if (!started) {
+            started = true;
+            setMessages((prev) => [...prev, { ...botMsg, content: text }]);
+          }
+          // Fill in ids and IST timestamps from the backend without refetching history
+          setMessages((prev) => {
+            const next = [...prev];
+            next[next.length - 1] = { ...next[next.length - 1], id: data.message_id, timestamp: data.timestamp };
+            next[next.length - 2] = { ...next[next.length - 2], id: data.user_message_id, timestamp: data.user_timestamp };
+            return next;
+          });
+          fetchStats();
+          // The sidebar picks up the new message and any generated title from /api/sessions/events
+        } else if (event === "error") {
+          throw { response: { status: data.status, data: { detail: data.detail } } };
+        }
+      });
     } catch (error) {
       console.error("Error sending message:", error);
       
@@ -146,7 +227,7 @@ function App() {
         } else if (detail) {
           errorMsg = detail;
         }
-      } else if (error.request) {
+      } else {
         errorMsg = "Cannot connect to server. Please check your connection.";
       }
       
@@ -158,6 +239,7 @@ function App() {
       };
       setMessages((prev) => [...prev, errorBotMsg]);
     } finally {
+      sendingRef.current = false;
       setLoading(false);
     }
   };
@@ -171,6 +253,7 @@ function App() {
     try {
       await axios.delete("http://127.0.0.1:8000/api/clear", { data: { session_id: sessionId } });
       setMessages([]);
+      setOlderCursor(null);
       setMsgCount(0);
     } catch (e) {
       console.error("Error clearing chat:", e);
@@ -261,6 +344,9 @@ function App() {
           </div>
 
           <div className="messages-area">
+            {olderCursor && (
+              <button onClick={fetchOlderHistory} className="load-older-btn">Load earlier messages</button>
+            )}
             {messages.map((msg, idx) => {
               // Check if we need to show a date separator
               const showDateSeparator = idx === 0 || (
@@ -13,31 +13,87 @@ export default function SessionsSidebar({ activeSession, currentPersona, onSwitc
     movie: "🎬"
   };
 
-  const fetchSessions = async () => {
-    setLoading(true);
-    try {
-      const res = await axios.get("http://127.0.0.1:8000/api/sessions");
-      setSessions(res.data.sessions || []);
-    } catch (e) {
-      console.error("Failed to fetch sessions", e);
-    } finally {
-      setLoading(false);
+  // Apply one change from /api/sessions/events to the list (values are absolute, so repeats are harmless)
+  const applyEvent = (prev, { type, session_id, session }) => {
+    if (type === "deleted") return prev.filter((s) => s.session_id !== session_id);
+    const existing = prev.find((s) => s.session_id === session_id);
+    const { fallback_title, ...fields } = session;
+    const updated = { title: "New Chat", snippet: "", message_count: 0, ...existing, session_id, ...fields };
+    if (fallback_title && (!existing || !existing.title || existing.title === "New Chat")) {
+      updated.title = fallback_title;
     }
+    const rest = prev.filter((s) => s.session_id !== session_id);
+    // Newest activity first, like GET /api/sessions
+    return [updated, ...rest].sort((a, b) => (b.last_message_time || "").localeCompare(a.last_message_time || ""));
   };
 
   useEffect(() => {
-    fetchSessions();
-    
-    // Listen for custom refresh event
-    const handleRefresh = () => fetchSessions();
-    window.addEventListener('refreshSessions', handleRefresh);
-    
-    // refresh every 20s to show new sessions if needed
-    const id = setInterval(fetchSessions, 20000);
-    
+    // A snapshot of the list, then one event per change. EventSource retries dropped streams on
+    // its own, but gives up for good when a (re)connect is refused (e.g. 429): then poll
+    // GET /api/sessions and reopen the stream with backoff.
+    let source;
+    let closed = false;
+    let retryDelay = 2000;
+    let retryTimer;
+    let pollTimer;
+
+    const fetchSessions = async () => {
+      try {
+        const res = await axios.get("http://127.0.0.1:8000/api/sessions");
+        setSessions(res.data.sessions || []);
+      } catch (e) {
+        console.error("Failed to fetch sessions", e);
+      } finally {
+        setLoading(false);
+      }
+    };
+
+    const stopPolling = () => {
+      clearInterval(pollTimer);
+      pollTimer = undefined;
+    };
+
+    const connect = () => {
+      if (closed) return;
+      setLoading(true);
+      source = new EventSource("http://127.0.0.1:8000/api/sessions/events");
+      source.addEventListener("snapshot", (e) => {
+        setSessions(JSON.parse(e.data).sessions || []);
+        setLoading(false);
+        stopPolling();
+        retryDelay = 2000;
+      });
+      source.addEventListener("session", (e) => {
+        const event = JSON.parse(e.data);
+        setSessions((prev) => applyEvent(prev, event));
+      });
+      source.addEventListener("reset", () => {
+        // We fell behind the server; start over with a fresh snapshot
+        source.close();
+        connect();
+      });
+      source.onerror = () => {
+        if (source.readyState !== EventSource.CLOSED) {
+          console.error("Session updates interrupted, reconnecting");
+          return;
+        }
+        console.error(`Session updates refused, polling and retrying in ${retryDelay / 1000}s`);
+        source.close();
+        if (!pollTimer) {
+          fetchSessions();
+          pollTimer = setInterval(fetchSessions, 20000);
+        }
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 60000);
+      };
+    };
+    connect();
+
     return () => {
-      clearInterval(id);
-      window.removeEventListener('refreshSessions', handleRefresh);
+      closed = true;
+      clearTimeout(retryTimer);
+      stopPolling();
+      source.close();
     };
   }, []);
 
@@ -46,8 +102,7 @@ export default function SessionsSidebar({ activeSession, currentPersona, onSwitc
       <div className="sidebar-header">
         <h3>Chats</h3>
         <button onClick={async () => { 
-          const newId = await onNewSession(); 
-          fetchSessions();
+          await onNewSession();
         }} className="new-chat-btn">+ New</button>
       </div>
 
@@ -80,8 +135,7 @@ export default function SessionsSidebar({ activeSession, currentPersona, onSwitc
                     e.stopPropagation(); 
                     const newTitle = prompt("New title?", title); 
                     if(newTitle && newTitle !== title) { 
-                      await onRename(s.session_id, newTitle); 
-                      fetchSessions(); 
+                      await onRename(s.session_id, newTitle);
                     } 
                   }}>✎</button>
                 <button 
@@ -89,8 +143,7 @@ export default function SessionsSidebar({ activeSession, currentPersona, onSwitc
                   onClick={async (e)=>{ 
                     e.stopPropagation(); 
                     if(confirm("Delete this chat?")){ 
-                      await onDelete(s.session_id); 
-                      fetchSessions(); 
+                      await onDelete(s.session_id);
                       if(activeSession===s.session_id) onSwitch(null); 
                     }
                   }}>🗑</button>
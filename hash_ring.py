@@ -0,0 +1,36 @@
+# hash_ring.py
+"""
+Consistent hashing of session ids onto shards.
+
+Each shard owns HASH_RING_POINTS points on a 64-bit ring; a key belongs to
+the shard owning the first point at or after the key's hash. Going from N to
+N + 1 shards only moves the keys the new shard takes over (about 1/(N + 1)
+of them), all to the new shard, and shards are addressed by index, so the
+placement depends on nothing but the shard count.
+"""
+import bisect
+import hashlib
+from typing import List
+
+HASH_RING_POINTS = 256  # points per shard; more points spread keys more evenly
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, shards: int, points: int = HASH_RING_POINTS):
+        if shards < 1:
+            raise ValueError("A hash ring needs at least one shard")
+        ring = sorted((_hash(f"shard-{shard}:{point}"), shard) for shard in range(shards) for point in range(points))
+        self.shards = shards
+        self._hashes: List[int] = [h for h, _ in ring]
+        self._owners: List[int] = [shard for _, shard in ring]
+
+    def shard_of(self, key: str) -> int:
+        """Index of the shard owning `key`"""
+        if self.shards == 1:
+            return 0
+        i = bisect.bisect_left(self._hashes, _hash(key))
+        return self._owners[i if i < len(self._owners) else 0]
@@ -0,0 +1,128 @@
+# history_cache.py
+"""
+In-memory cache of the prepared Gemini history per session.
+
+/api/chat would otherwise reload and re-format the last N messages of a
+session on every turn. Entries are appended to as messages are saved and
+validated against the session's user/bot message count, so a turn served by
+another worker (or any write this process did not see) turns into a miss
+instead of a stale prompt.
+
+Chat turns use the cache on the event loop while sync endpoints (clear,
+rename, delete, import) invalidate it from the threadpool, so every method
+takes the cache's lock.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "1000"))  # 0 disables the cache
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "900"))  # seconds since last use
+
+# Rough per-entry overhead (dict + list + strings) added to the text size
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class _Entry:
+    __slots__ = ("history", "message_count", "size", "last_used")
+
+    def __init__(self, history, message_count):
+        self.history = history
+        self.message_count = message_count
+        self.size = sum(_entry_size(item) for item in history)
+        self.last_used = time.monotonic()
+
+
+def _entry_size(item) -> int:
+    return ENTRY_OVERHEAD_BYTES + sum(len(part) for part in item["parts"])
+
+
+class HistoryCache:
+    """Bounded LRU + TTL cache of Gemini history lists keyed by session_id"""
+
+    def __init__(self, max_messages: int, max_sessions: int = HISTORY_CACHE_MAX_SESSIONS,
+                 max_bytes: int = HISTORY_CACHE_MAX_BYTES, ttl: float = HISTORY_CACHE_TTL):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str, message_count: int):
+        """
+        Cached history for a session holding `message_count` user/bot messages,
+        or None (a miss) if absent, expired or out of date.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry.message_count != message_count or time.monotonic() - entry.last_used > self.ttl:
+                if entry is not None:
+                    self._remove(session_id)
+                self.misses += 1
+                return None
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return list(entry.history)
+
+    def put(self, session_id: str, history: list, message_count: int):
+        """Store a freshly loaded history for a session holding `message_count` user/bot messages"""
+        if self.max_sessions <= 0:
+            return
+        entry = _Entry(list(history[-self.max_messages:]), message_count)
+        with self._lock:
+            self._remove(session_id)
+            self._entries[session_id] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def append(self, session_id: str, role: str, content: str):
+        """Add a just-saved message (Gemini role 'user' or 'model') to a cached session"""
+        item = {"role": role, "parts": [content]}
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            entry.history.append(item)
+            entry.message_count += 1
+            entry.size += _entry_size(item)
+            self._bytes += _entry_size(item)
+            while len(entry.history) > self.max_messages:
+                dropped = entry.history.pop(0)
+                entry.size -= _entry_size(dropped)
+                self._bytes -= _entry_size(dropped)
+            self._evict()
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._remove(session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    # Callers hold self._lock
+    def _remove(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        # Least recently used first, until both caps hold
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            session_id = next(iter(self._entries))
+            self._remove(session_id)
+            self.evictions += 1
@@ -0,0 +1,108 @@
+# llm.py
+"""
+Gemini backend selection and model registry, shared by the API (main.py),
+the title worker and the context summarizer.
+
+LLM_BACKEND=fake swaps Gemini for a local stand-in (see fake_llm.py).
+"""
+import os
+import asyncio
+import datetime
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_NAME = "gemini-2.5-flash"
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+if LLM_BACKEND == "fake":
+    from fake_llm import FakeGenerativeModel as GenerativeModel, FakeCachedContent as CachedContent
+else:
+    API_KEY = os.getenv("GEMINI_API_KEY")
+    if not API_KEY:
+        raise RuntimeError("GEMINI_API_KEY not set in environment")
+
+    genai.configure(api_key=API_KEY)
+    GenerativeModel = genai.GenerativeModel
+    CachedContent = genai.caching.CachedContent
+
+# Opt-in: store each persona instruction as provider-side cached content so it is not
+# re-sent (and re-billed) on every request. Gemini only caches prompts above a minimum
+# size; personas that are too small fall back to a regular model.
+GEMINI_CACHE_INSTRUCTIONS = os.getenv("GEMINI_CACHE_INSTRUCTIONS", "0") == "1"
+CACHED_INSTRUCTION_TTL = int(os.getenv("CACHED_INSTRUCTION_TTL", "3600"))  # seconds
+CACHED_INSTRUCTION_REFRESH = CACHED_INSTRUCTION_TTL / 2  # extend the TTL this often
+
+
+class _PersonaModel:
+    __slots__ = ("instruction", "model", "cached_content")
+
+    def __init__(self, instruction, model, cached_content=None):
+        self.instruction = instruction
+        self.model = model
+        self.cached_content = cached_content
+
+
+class ModelRegistry:
+    """
+    Configured model objects built once and reused across requests: one per persona
+    (system instruction baked in, optionally as cached content) plus a plain model for
+    utility prompts like titles and summaries. A persona whose instruction changes is
+    rebuilt on its next use.
+    """
+
+    def __init__(self, cache_instructions: bool = GEMINI_CACHE_INSTRUCTIONS):
+        self.cache_instructions = cache_instructions
+        self._personas = {}
+        self._plain = None
+
+    def load(self, personas: dict):
+        """Build models for every persona (call at startup and after persona config changes)"""
+        for key, config in personas.items():
+            self._personas[key] = self._build(key, config["instruction"])
+        for key in set(self._personas) - set(personas):
+            del self._personas[key]
+
+    def get(self, persona: str, instruction: str):
+        entry = self._personas.get(persona)
+        if entry is None or (entry.instruction is not instruction and entry.instruction != instruction):
+            entry = self._personas[persona] = self._build(persona, instruction)
+        return entry.model
+
+    def plain(self):
+        """Model without a system instruction"""
+        if self._plain is None:
+            self._plain = GenerativeModel(MODEL_NAME)
+        return self._plain
+
+    def _build(self, persona: str, instruction: str) -> _PersonaModel:
+        if self.cache_instructions:
+            try:
+                cached_content = CachedContent.create(
+                    model=f"models/{MODEL_NAME}",
+                    display_name=f"persona-{persona}",
+                    system_instruction=instruction,
+                    ttl=datetime.timedelta(seconds=CACHED_INSTRUCTION_TTL),
+                )
+                return _PersonaModel(instruction, GenerativeModel.from_cached_content(cached_content), cached_content)
+            except Exception as e:
+                print(f"Instruction caching unavailable for persona '{persona}', using a regular model: {e}")
+        return _PersonaModel(instruction, GenerativeModel(MODEL_NAME, system_instruction=instruction))
+
+    async def keep_cached_instructions_alive(self):
+        """Background loop extending the TTL of cached persona instructions before they expire"""
+        while True:
+            await asyncio.sleep(CACHED_INSTRUCTION_REFRESH)
+            for persona, entry in list(self._personas.items()):
+                if entry.cached_content is None:
+                    continue
+                try:
+                    await asyncio.to_thread(entry.cached_content.update, ttl=datetime.timedelta(seconds=CACHED_INSTRUCTION_TTL))
+                except Exception as e:
+                    # Expired or deleted upstream: rebuild it (off the event loop, it is a network call)
+                    print(f"Refreshing cached instruction for '{persona}' failed, rebuilding: {e}")
+                    self._personas[persona] = await asyncio.to_thread(self._build, persona, entry.instruction)
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,309 @@
+# llm_resilience.py
+"""
+Deadlines, retries, hedging and a circuit breaker around Gemini calls.
+
+Callers pass a factory that starts one attempt (a fresh chat object each
+time, since a ChatSession records the turn on success):
+
+    response = await resilient_llm.call(lambda: chat_factory().send_message_async(text))
+    async with resilient_llm.stream(lambda: ...send_message_async(text, stream=True)) as chunks:
+        async for chunk in chunks: ...
+
+- Deadlines: an attempt that has not responded within LLM_CALL_TIMEOUT is
+  abandoned, and all attempts plus backoff stay within LLM_TOTAL_TIMEOUT.
+  Streams also fail if no chunk arrives for LLM_STREAM_IDLE_TIMEOUT.
+- Retries: timeouts, 429 and 5xx are retried up to LLM_RETRIES times after
+  a full-jitter exponential backoff. Streams are only retried before the
+  first chunk.
+- Hedging (LLM_HEDGE=1, interactive calls only): when an attempt is still
+  waiting after the LLM_HEDGE_PERCENTILE latency of recent successful
+  attempts, a second one starts and the first to succeed wins. Hedges only
+  use spare scheduler capacity, so they never queue ahead of real requests.
+- Circuit breaker: after LLM_BREAKER_FAILURES consecutive provider failures
+  (timeouts, 5xx, connection errors) calls fail at once with
+  LLMUnavailable for LLM_BREAKER_RESET seconds; then one trial call decides
+  whether it closes again.
+
+Every attempt, hedges included, takes its own llm_scheduler slot.
+"""
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+from llm_scheduler import llm_scheduler, LLMOverloaded, INTERACTIVE, error_status
+
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "30"))  # seconds per attempt, to the first response
+LLM_TOTAL_TIMEOUT = float(os.getenv("LLM_TOTAL_TIMEOUT", "60"))  # seconds for all attempts and backoff
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "30"))  # max gap between streamed chunks
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # seconds, doubled per retry
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.2"))  # never hedge sooner than this
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+LATENCY_SAMPLES = 200  # recent successful attempts per kind, for the hedge delay
+MIN_HEDGE_SAMPLES = 20  # no hedging until this many are known
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+PROVIDER_FAILURE_STATUSES = {500, 502, 503, 504}
+
+
+class LLMUnavailable(LLMOverloaded):
+    """The circuit breaker is open: the provider failed repeatedly and is not being called"""
+
+
+def is_retryable(e: Exception) -> bool:
+    return error_status(e) in RETRYABLE_STATUSES or isinstance(e, (ConnectionError, OSError))
+
+
+def is_provider_failure(e: Exception) -> bool:
+    """Errors that suggest the provider is down (not throttling or a bad request)"""
+    return error_status(e) in PROVIDER_FAILURE_STATUSES or isinstance(e, (ConnectionError, OSError))
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, reset_timeout: float = LLM_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.opens = 0
+        self.rejected = 0
+        self._trial = False  # a half-open trial call is running
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Raise LLMUnavailable unless a call may go out now; True if it is the half-open trial"""
+        state = self.state
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN and not self._trial:
+            self._trial = True
+            return True
+        self.rejected += 1
+        retry_after = max(1.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise LLMUnavailable("The model provider is unavailable", retry_after)
+
+    def record(self, trial: bool, failure: Optional[bool]):
+        """Outcome of an attempt: failure True/False, or None if it was abandoned (cancelled)"""
+        if trial:
+            self._trial = False
+        if failure is None:
+            return
+        if not failure:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None or trial:
+                self.opens += 1
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Recent successful attempt latencies per kind ("reply" = whole reply, "stream" = first chunk)"""
+
+    def __init__(self, size: int = LATENCY_SAMPLES):
+        self.size = size
+        self._samples = {}
+
+    def add(self, kind: str, seconds: float):
+        self._samples.setdefault(kind, deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, kind: str, p: float) -> Optional[float]:
+        samples = self._samples.get(kind)
+        if not samples or len(samples) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class ResilientLLM:
+    def __init__(self, scheduler=llm_scheduler, call_timeout: float = LLM_CALL_TIMEOUT,
+                 total_timeout: float = LLM_TOTAL_TIMEOUT, retries: int = LLM_RETRIES, hedge: bool = LLM_HEDGE,
+                 breaker: CircuitBreaker = None):
+        self.scheduler = scheduler
+        self.call_timeout = call_timeout
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.attempts = 0
+        self.retried = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    async def call(self, request: Callable[[], Awaitable], priority: int = INTERACTIVE,
+                   retries: Optional[int] = None):
+        """Response of the first successful attempt of `request()`"""
+        response, _ = await self._run(request, priority, retries, stream=False)
+        return response
+
+    @asynccontextmanager
+    async def stream(self, request: Callable[[], Awaitable], priority: int = INTERACTIVE,
+                     retries: Optional[int] = None):
+        """
+        Yields the chunks of the first streamed response to arrive. Its scheduler slot is held
+        until the block exits; a stalled or failing stream is not retried once chunks flowed.
+        """
+        response, slot = await self._run(request, priority, retries, stream=True)
+        try:
+            yield self._chunks(response)
+        except BaseException as e:
+            if isinstance(e, Exception) and (is_provider_failure(e) or isinstance(e, asyncio.TimeoutError)):
+                self.breaker.record(False, True)
+            await slot.__aexit__(type(e), e, e.__traceback__)
+            raise
+        else:
+            await slot.__aexit__(None, None, None)
+
+    def stats(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "retries": self.retried,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "breaker_state": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "breaker_rejected": self.breaker.rejected,
+        }
+
+    async def _chunks(self, response):
+        iterator = response.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), LLM_STREAM_IDLE_TIMEOUT)
+            except StopAsyncIteration:
+                return
+            yield chunk
+
+    async def _run(self, request, priority, retries, stream):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.total_timeout
+        retries = self.retries if retries is None else retries
+        kind = "stream" if stream else "reply"
+        attempt = 0
+        while True:
+            try:
+                if self.hedge and priority == INTERACTIVE:
+                    return await self._hedged(request, priority, kind, stream, deadline)
+                return await self._attempt(request, priority, kind, stream, deadline)
+            except LLMOverloaded:
+                raise  # already waited its queue deadline, or the breaker is open
+            except Exception as e:
+                if attempt >= retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+                if loop.time() + delay >= deadline:
+                    raise
+                attempt += 1
+                self.retried += 1
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, request, priority, kind, stream, deadline):
+        """One attempt in its own scheduler slot: (response, slot held for a stream or None)"""
+        loop = asyncio.get_running_loop()
+        trial = self.breaker.allow()
+        slot = self.scheduler.slot(priority)
+        try:
+            granted = await slot.__aenter__()
+        except BaseException:
+            self.breaker.record(trial, None)
+            raise
+        self.attempts += 1
+        start = loop.time()
+        try:
+            timeout = min(self.call_timeout, deadline - start)
+            if timeout <= 0:
+                raise asyncio.TimeoutError()
+            response = await asyncio.wait_for(request(), timeout)
+        except BaseException as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+            if isinstance(e, Exception):
+                failure = is_provider_failure(e) or isinstance(e, asyncio.TimeoutError)
+            else:
+                failure = None  # cancelled: says nothing about the provider
+            self.breaker.record(trial, failure)
+            await slot.__aexit__(type(e), e, e.__traceback__)
+            raise
+        self.breaker.record(trial, False)
+        self.latency.add(kind, loop.time() - start)
+        if stream:
+            granted.mark_response()
+            return response, slot
+        await slot.__aexit__(None, None, None)
+        return response, None
+
+    def _hedge_delay(self, kind: str) -> Optional[float]:
+        delay = self.latency.percentile(kind, LLM_HEDGE_PERCENTILE)
+        return None if delay is None else max(LLM_HEDGE_MIN_DELAY, delay)
+
+    def _spare_capacity(self) -> bool:
+        return (self.breaker.state == CircuitBreaker.CLOSED and not self.scheduler.queued
+                and self.scheduler.in_flight < int(self.scheduler.limit))
+
+    async def _hedged(self, request, priority, kind, stream, deadline):
+        delay = self._hedge_delay(kind)
+        if delay is None:
+            return await self._attempt(request, priority, kind, stream, deadline)
+        first = asyncio.ensure_future(self._attempt(request, priority, kind, stream, deadline))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done and self._spare_capacity():
+                self.hedges += 1
+                pending.add(asyncio.ensure_future(self._attempt(request, priority, kind, stream, deadline)))
+            error = None
+            while pending or done:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedges_won += 1
+                        winner = task.result()
+                        for other in done - {task}:
+                            await self._discard(other)
+                        return winner
+                    error = task.exception()
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+                for task in pending:
+                    await self._discard(task)
+
+    @staticmethod
+    async def _discard(task):
+        """Release the stream slot of an attempt that finished but lost the race"""
+        if task.cancelled() or task.exception() is not None:
+            return
+        _, slot = task.result()
+        if slot is not None:
+            await slot.__aexit__(None, None, None)
+
+
+resilient_llm = ResilientLLM()
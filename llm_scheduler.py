@@ -0,0 +1,216 @@
+# llm_scheduler.py
+"""
+Admission control for upstream LLM calls (chat replies, titles, summaries).
+
+Every call takes a slot from the process-wide scheduler first:
+
+- Concurrency limit: at most `limit` calls run at once. The limit adapts
+  AIMD-style between LLM_MIN_CONCURRENCY and LLM_MAX_CONCURRENCY: +1 per
+  `limit` successful calls, halved when the provider throttles (429), and
+  cut by LLM_LATENCY_BACKOFF when replies are slower than
+  LLM_TARGET_LATENCY (if set). At most one multiplicative decrease per
+  recent call duration, so a burst of 429s from the same overload counts
+  once; every 429 still caps the limit below the calls then in flight.
+- Priority queue: waiting calls are admitted by priority (interactive chat
+  before summaries before background titling), then in arrival order.
+- Deadlines: a call that cannot start within its priority's queue timeout
+  fails with LLMOverloaded instead of waiting behind a backlog.
+- Fast rejection: when LLM_QUEUE_LIMIT calls are already waiting, new ones
+  fail at once with LLMOverloaded; the API turns that into 503 + Retry-After.
+
+The scheduler is per process; LLM_MAX_CONCURRENCY is a per-worker cap.
+"""
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Optional
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "8"))
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "200"))  # waiting calls before fast 503s
+LLM_TARGET_LATENCY = float(os.getenv("LLM_TARGET_LATENCY", "0"))  # seconds to first response; 0 = ignore latency
+LLM_LATENCY_BACKOFF = 0.9  # limit multiplier when a call is slower than LLM_TARGET_LATENCY
+LLM_THROTTLE_BACKOFF = 0.5  # limit multiplier on a 429
+
+# Priorities (lower runs first) and how long each may wait for a slot
+INTERACTIVE = 0
+SUMMARY = 1
+BACKGROUND = 2
+QUEUE_TIMEOUTS = {
+    INTERACTIVE: float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+    SUMMARY: float(os.getenv("LLM_SUMMARY_QUEUE_TIMEOUT", "30")),
+    BACKGROUND: float(os.getenv("LLM_BACKGROUND_QUEUE_TIMEOUT", "120")),
+}
+
+
+class LLMOverloaded(Exception):
+    """No upstream capacity within the caller's deadline; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def error_status(e: Exception) -> Optional[int]:
+    """HTTP status of an upstream error (google.api_core exceptions carry `code`), if known"""
+    code = getattr(e, "code", None)
+    if isinstance(code, int):
+        return code
+    if isinstance(e, asyncio.TimeoutError):
+        return 504
+    return None
+
+
+def is_throttled(e: Exception) -> bool:
+    return error_status(e) == 429
+
+
+class Slot:
+    """A granted slot; streaming callers mark when the first response arrived"""
+
+    __slots__ = ("started", "responded")
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.responded = None
+
+    def mark_response(self):
+        if self.responded is None:
+            self.responded = time.monotonic()
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, min_concurrency: int = LLM_MIN_CONCURRENCY,
+                 initial_concurrency: int = LLM_INITIAL_CONCURRENCY, queue_limit: int = LLM_QUEUE_LIMIT,
+                 target_latency: float = LLM_TARGET_LATENCY, queue_timeouts: dict = None):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = max(1, min(min_concurrency, max_concurrency))
+        self.limit = float(max(self.min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.queue_limit = queue_limit
+        self.target_latency = target_latency
+        self.queue_timeouts = queue_timeouts or QUEUE_TIMEOUTS
+        self.in_flight = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._latency = 1.0  # EWMA of call duration, seconds
+        self._last_decrease = 0.0
+        self.started = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.throttled = 0
+        self.decreases = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        """Rough time for the current backlog to drain at the current limit"""
+        return max(1.0, math.ceil(self._latency * (self.queued + 1) / max(self.limit, 1.0)))
+
+    def check_admission(self):
+        """Raise LLMOverloaded if a new call would be rejected right now (lets endpoints 503 before streaming)"""
+        if self.queued >= self.queue_limit:
+            self.rejected += 1
+            raise LLMOverloaded("Too many requests waiting for the model", self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE, timeout: Optional[float] = None):
+        """Hold one upstream slot for the duration of the block"""
+        await self._acquire(priority, self.queue_timeouts[priority] if timeout is None else timeout)
+        slot = Slot()
+        self.started += 1
+        try:
+            yield slot
+        except BaseException as e:
+            self._release(slot, e if isinstance(e, Exception) else None, completed=False)
+            raise
+        else:
+            self._release(slot, None, completed=True)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "started": self.started,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "throttled": self.throttled,
+            "decreases": self.decreases,
+            "latency_ewma": round(self._latency, 3),
+        }
+
+    async def _acquire(self, priority: int, timeout: float):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        self.check_admission()
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                return  # granted just as the deadline passed
+            self._remove(entry)
+            self.timed_out += 1
+            raise LLMOverloaded("Timed out waiting for the model", self.retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release_count()  # granted, but the caller went away
+            else:
+                self._remove(entry)
+            raise
+
+    def _remove(self, entry):
+        future = entry[2]
+        if not future.done():
+            future.cancel()
+        try:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        except ValueError:
+            pass
+
+    def _release(self, slot: Slot, error: Optional[Exception], completed: bool):
+        now = time.monotonic()
+        duration = (slot.responded or now) - slot.started
+        if error is not None and is_throttled(error):
+            self.throttled += 1
+            self._decrease(LLM_THROTTLE_BACKOFF, now)
+            # The provider refused this many concurrent calls: never admit as many again until it recovers
+            self.limit = max(self.min_concurrency, min(self.limit, self.in_flight - 1))
+        elif completed or slot.responded is not None:
+            self._latency = 0.8 * self._latency + 0.2 * duration
+            if self.target_latency and duration > self.target_latency:
+                self._decrease(LLM_LATENCY_BACKOFF, now)
+            elif completed:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+        self._release_count()
+
+    def _decrease(self, factor: float, now: float):
+        # Calls already running when the limit dropped report the same overload; count it once
+        if now - self._last_decrease < self._latency:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * factor)
+        self.decreases += 1
+
+    def _release_count(self):
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # timed out or cancelled
+            self.in_flight += 1
+            future.set_result(None)
+
+
+llm_scheduler = LLMScheduler()
@@ -1,16 +1,19 @@
 # main.py
 import os
+import json
+import anyio
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel, Field
-import google.generativeai as genai
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, select
 import pytz
-from collections import defaultdict
-import time
 
 # IST timezone
 IST = pytz.timezone('Asia/Kolkata')
@@ -20,23 +23,47 @@ def get_ist_now():
     return datetime.now(IST)
 
 # Import database & models
-from database import ChatMessage, get_db
+from database import (
+    ChatMessage, ChatSession, get_session_read_db, get_shard_read_dbs,
+    add_message, record_title, forget_session, title_from_first_message, sessions_version, shards, shard_for,
+    SessionArchived, stored_timestamp,
+)
+from llm import model_registry, GEMINI_CACHE_INSTRUCTIONS
+from llm_scheduler import llm_scheduler, LLMOverloaded, error_status
+from llm_resilience import resilient_llm, LLMUnavailable
+from title_worker import TitleWorker, TITLE_WORKER_MODE, enqueue_title_job, is_greeting
+from history_cache import HistoryCache
+from response_cache import ResponseCache
+from single_flight import SingleFlight, SessionLocks, chat_key
+from group_commit import GroupCommitWriter
+from schema_migration import migrate_if_needed
+from search import SEARCH_SUPPORTED, ensure_search_index, search_messages, search_all_shards
+from archive import Archiver, ARCHIVE_AFTER_DAYS, load_messages, restore as restore_archived
+from bulk_transfer import EXISTING_MODES, BadRecord, Importer, export_chunks, export_records, gzip_chunks, import_stream
+from session_events import session_events
+from responses import CompressionMiddleware, FastJSONResponse, make_etag, not_modified, versioned_json
+from context import DEFAULT_CONTEXT_BUDGET, build_context, estimate_tokens, history_tokens
+from metrics import MetricsMiddleware, REGISTRY, stage, count_tokens, report_error, instrument_engine
+from profiling import profiler, PROFILE_OUTPUT
+from traffic_capture import CaptureMiddleware, TRAFFIC_CAPTURE, traffic_log, annotate, upstream_timer
+from rate_limit import RateLimit, ConcurrencyLimit, create_backend
 
 from fastapi.middleware.cors import CORSMiddleware
 
-# 1. Load env
+# 1. Load env (Gemini is configured in llm.py)
 load_dotenv()
-API_KEY = os.getenv("GEMINI_API_KEY")
-if not API_KEY:
-    raise RuntimeError("GEMINI_API_KEY not set in environment")
 
-genai.configure(api_key=API_KEY)
+# Finish moving a database from the original schema before serving (see schema_migration.py)
+migrate_if_needed()
+for _shard in shards:
+    ensure_search_index(_shard.engine)
 
 # 2. System instructions for different personas
 PERSONAS = {
     "travel": {
         "name": "Travel Companion",
         "emoji": "✈️",
+        "context_budget": 4000,  # tokens of conversation history sent to Gemini
         "instruction": """
 You are an expert Travel Companion with 15+ years of global travel experience. You're passionate, knowledgeable, and genuinely excited to help people explore the world.
 
@@ -82,6 +109,7 @@ You ONLY discuss travel-related topics. For ANY question outside travel:
     "career": {
         "name": "Career Mentor",
         "emoji": "💼",
+        "context_budget": 6000,  # tokens of conversation history sent to Gemini
         "instruction": """
 You are a seasoned Career Mentor with 20+ years of experience in HR, recruiting, and professional development across multiple industries. You've helped hundreds of professionals advance their careers.
 
@@ -136,6 +164,7 @@ You ONLY discuss career and professional development. For ANY question outside c
     "fitness": {
         "name": "Fitness Coach",
         "emoji": "💪",
+        "context_budget": 4000,  # tokens of conversation history sent to Gemini
         "instruction": """
 You are a certified Fitness Coach with 10+ years of experience in personal training, nutrition coaching, and wellness. You're passionate about helping people achieve sustainable, healthy lifestyles.
 
@@ -204,6 +233,7 @@ You ONLY discuss fitness, exercise, and general wellness. For ANY question outsi
     "movie": {
         "name": "Movie Recommender",
         "emoji": "🎬",
+        "context_budget": 4000,  # tokens of conversation history sent to Gemini
         "instruction": """
 You are a passionate Film Expert and Entertainment Curator with encyclopedic knowledge of cinema across all genres, eras, and cultures. You've watched thousands of films and love sharing your passion.
 
@@ -271,12 +301,51 @@ You ONLY discuss movies, TV shows, and entertainment. For ANY question outside m
     }
 }
 
+# Build the persona models once; get_model_for_persona reuses them (and rebuilds a persona if its instruction changes)
+model_registry.load(PERSONAS)
+
 def get_model_for_persona(persona: str):
     """Get a Gemini model configured for the specified persona"""
     persona_config = PERSONAS.get(persona, PERSONAS["travel"])
-    return genai.GenerativeModel('gemini-2.5-flash', system_instruction=persona_config["instruction"])
-
-app = FastAPI()
+    return model_registry.get(persona if persona in PERSONAS else "travel", persona_config["instruction"])
+
+# Background title generation (runs in this process unless TITLE_WORKER=external)
+title_worker = TitleWorker()
+# Moves sessions idle for ARCHIVE_AFTER_DAYS to the archive store (off when 0; see archive.py)
+archiver = Archiver() if ARCHIVE_AFTER_DAYS > 0 else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await session_events.start()
+    worker_task = None
+    if TITLE_WORKER_MODE == "inprocess":
+        worker_task = asyncio.create_task(title_worker.run())
+    cache_task = None
+    if GEMINI_CACHE_INSTRUCTIONS:
+        cache_task = asyncio.create_task(model_registry.keep_cached_instructions_alive())
+    archive_task = asyncio.create_task(archiver.run()) if archiver else None
+    if profiler:
+        profiler.start()
+    yield
+    if profiler:
+        profiler.stop()
+        profiler.write()
+        print(f"Wrote {profiler.samples} profile samples to {PROFILE_OUTPUT}")
+    if cache_task:
+        cache_task.cancel()
+    if worker_task:
+        title_worker.stop()
+        await worker_task
+    if archive_task:
+        archiver.stop()
+        await archive_task
+    await session_events.close()
+    if traffic_log:
+        traffic_log.close()
+        print(f"Captured {traffic_log.records} requests to {TRAFFIC_CAPTURE}")
+
+# orjson for every JSON body; the polled read endpoints also send validators (see responses.py)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # CORS for development; lock this down for production
 app.add_middleware(
@@ -285,33 +354,67 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Retry-After", "Server-Timing"],
 )
+# gzip/brotli for complete JSON bodies over COMPRESS_MIN_BYTES (SSE streams pass through)
+app.add_middleware(CompressionMiddleware)
+# Opt-in (TRAFFIC_CAPTURE=path): anonymized request shapes for benchmarks/replay.py
+if traffic_log:
+    app.add_middleware(CaptureMiddleware, log=traffic_log)
+# Outermost (added last): request counts/latency/SQL statements per route, Server-Timing (see metrics.py)
+app.add_middleware(MetricsMiddleware)
+for _shard in shards:
+    for _engine in _shard.engines():
+        instrument_engine(_engine)
+
+# Rate limiting: token buckets per client IP and per session (see rate_limit.py for backends)
+RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "10"))  # max requests
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # per 60 seconds
+SESSION_RATE_LIMIT_REQUESTS = int(os.getenv("SESSION_RATE_LIMIT_REQUESTS", "8"))  # per session, same window
+# Per client IP in the same window for the other endpoint groups
+SEARCH_RATE_LIMIT_REQUESTS = int(os.getenv("SEARCH_RATE_LIMIT_REQUESTS", "60"))
+SESSION_WRITE_RATE_LIMIT_REQUESTS = int(os.getenv("SESSION_WRITE_RATE_LIMIT_REQUESTS", "30"))  # create/rename/delete/clear
+TRANSFER_RATE_LIMIT_REQUESTS = int(os.getenv("TRANSFER_RATE_LIMIT_REQUESTS", "5"))  # export/import
+
+# Per-endpoint limits; endpoints in the same group share buckets. Cheap reads that clients poll
+# with If-None-Match (history, sessions, stats) and the static/diagnostic endpoints are not limited.
+RATE_LIMITS = {
+    "chat": {
+        "ip": RateLimit(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW),
+        "session": RateLimit(SESSION_RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW),
+    },
+    "search": {"ip": RateLimit(SEARCH_RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW)},
+    "session_write": {"ip": RateLimit(SESSION_WRITE_RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW)},
+    "transfer": {"ip": RateLimit(TRANSFER_RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW)},
+}
 
-# Simple rate limiting: track requests per IP
-rate_limit_store = defaultdict(list)
-RATE_LIMIT_REQUESTS = 10  # max requests
-RATE_LIMIT_WINDOW = 60  # per 60 seconds
+rate_limit_backend = create_backend()
 
-def check_rate_limit(request: Request):
-    """Simple rate limiting by IP address"""
-    client_ip = request.client.host
-    current_time = time.time()
-    
-    # Clean old requests outside the window
-    rate_limit_store[client_ip] = [
-        req_time for req_time in rate_limit_store[client_ip]
-        if current_time - req_time < RATE_LIMIT_WINDOW
-    ]
-    
-    # Check if limit exceeded
-    if len(rate_limit_store[client_ip]) >= RATE_LIMIT_REQUESTS:
-        raise HTTPException(
-            status_code=429,
-            detail=f"Rate limit exceeded. Max {RATE_LIMIT_REQUESTS} requests per {RATE_LIMIT_WINDOW} seconds."
-        )
-    
-    # Add current request
-    rate_limit_store[client_ip].append(current_time)
+async def check_rate_limit(request: Request, endpoint: str = "chat", session_id: Optional[str] = None):
+    """Rate limiting by IP address (and session, when given) for an endpoint group"""
+    limits = RATE_LIMITS[endpoint]
+    checks = [("ip", request.client.host)]
+    if session_id:
+        checks.append(("session", session_id))
+
+    for scope, key in checks:
+        limit = limits.get(scope)
+        if limit is None:
+            continue
+        allowed, retry_after = await rate_limit_backend.acquire(f"{endpoint}:{scope}:{key}", limit)
+        if not allowed:
+            per = "per session" if scope == "session" else "per client"
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded. Max {limit.requests} requests {per} per {limit.window} seconds.",
+                headers={"Retry-After": str(max(1, round(retry_after)))},
+            )
+
+def rate_limited(endpoint: str):
+    """Dependency applying an endpoint group's per-IP limit (also to sync endpoints)"""
+    async def dependency(request: Request):
+        await check_rate_limit(request, endpoint)
+    return dependency
 
 # Pydantic models
 class UserMessage(BaseModel):
@@ -322,69 +425,211 @@ class UserMessage(BaseModel):
 class ClearRequest(BaseModel):
     session_id: str = Field(..., min_length=1, max_length=200)
 
+# Number of recent messages sent to Gemini as context; tune as needed
+HISTORY_LIMIT = 200
+
+# Prepared Gemini history per session, so most turns skip the history query
+history_cache = HistoryCache(max_messages=HISTORY_LIMIT)
+
+# Replies to first messages for RESPONSE_CACHE_PERSONAS, reused for repeated questions
+response_cache = ResponseCache()
+
+# Duplicate chat requests share one turn; turns of a session run one at a time
+chat_flights = SingleFlight()
+session_locks = SessionLocks()
+
+# Chat-turn writes from concurrent requests share one transaction/commit (one writer per shard,
+# so shards commit in parallel)
+group_writers = [GroupCommitWriter(shard.AsyncSessionLocal) for shard in shards]
+
+def writer_for(session_id: str) -> GroupCommitWriter:
+    return group_writers[shard_for(session_id).index]
+
+async def submit_message_write(session_id: str, operation):
+    """
+    Run operation(write_db, archived_rows) through the session's group-commit writer. When
+    the session turns out to be archived, its blob is read and decompressed here, outside
+    the write transaction, and the operation resubmitted with the rows to restore.
+    """
+    writer = writer_for(session_id)
+    try:
+        return await writer.submit(lambda write_db: operation(write_db, None))
+    except SessionArchived:
+        with stage("restore"):
+            rows = await asyncio.to_thread(load_messages, session_id)
+        return await writer.submit(lambda write_db: operation(write_db, rows))
+
 # Helpers
+def validate_chat_input(user_input: UserMessage):
+    """Normalize and validate a chat request; returns (session_id, message_text, persona)"""
+    session_id = user_input.session_id.strip()
+    message_text = user_input.message.strip()
+    persona = user_input.persona or "travel"
+    
+    if not message_text:
+        raise HTTPException(status_code=400, detail="Empty message")
+    
+    # Validate persona
+    if persona not in PERSONAS:
+        raise HTTPException(status_code=400, detail=f"Invalid persona. Choose from: {', '.join(PERSONAS.keys())}")
+
+    return session_id, message_text, persona
+
+def http_error_for_llm_exception(e: Exception) -> HTTPException:
+    """Map Gemini API errors to user-friendly HTTP errors"""
+    if isinstance(e, LLMOverloaded):
+        if isinstance(e, LLMUnavailable):
+            detail = "The AI service is temporarily unavailable. Please try again shortly."
+        else:
+            detail = "The assistant is busy right now. Please try again shortly."
+        return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(round(e.retry_after))})
+    # google.api_core errors carry their HTTP status; the message checks cover anything else
+    status = error_status(e)
+    error_msg = str(e)
+    if status == 403 or "403" in error_msg or "PermissionDenied" in error_msg:
+        return HTTPException(status_code=403, detail="API key issue. Please check your Gemini API key.")
+    elif status == 429 or "429" in error_msg or "quota" in error_msg.lower():
+        return HTTPException(status_code=429, detail="API rate limit exceeded. Please try again later.")
+    elif status == 504 or "timeout" in error_msg.lower():
+        return HTTPException(status_code=504, detail="Request timeout. Please try again.")
+    else:
+        return HTTPException(status_code=500, detail="An error occurred while processing your request.")
+
 def build_gemini_history(db_msgs: List[ChatMessage]):
     history = []
     for m in db_msgs:
-        # Skip system messages (titles)
-        if m.role == "system":
-            continue
         # Correct Gemini roles:
         role = "user" if m.role == "user" else "model"
         history.append({"role": role, "parts": [m.content]})
     return history
 
-def is_greeting(message: str) -> bool:
-    """Check if message is just a greeting"""
-    greetings = [
-        "hi", "hello", "hey", "hii", "hiii", "hiiii", "helo", "helo", 
-        "yo", "sup", "wassup", "whatsup", "namaste", "namaskar",
-        "good morning", "good afternoon", "good evening", "good night",
-        "gm", "gn", "morning", "evening"
-    ]
-    msg_lower = message.lower().strip().strip('!.,?')
-    return msg_lower in greetings or len(message.strip()) < 3
-
-def generate_title_from_conversation(messages: List[ChatMessage]) -> str:
-    """Generate a meaningful title from conversation context (first 3 messages)"""
-    try:
-        # Get first 3 user messages (skip greetings)
-        user_messages = [m.content for m in messages if m.role == "user" and not is_greeting(m.content)][:3]
-        
-        if not user_messages:
-            return "New Chat"
-        
-        # Combine messages for context
-        context = " | ".join(user_messages)
-        
-        title_model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""Based on this conversation context, generate a very short, meaningful title (max 4-5 words).
-Context: {context}
-
-Rules:
-- Be specific and descriptive
-- Use proper spelling (fix any typos in context)
-- Focus on the main topic/intent
-- Don't use greetings
-- Return ONLY the title, nothing else
-
-Title:"""
-        response = title_model.generate_content(prompt)
-        title = response.text.strip().strip('"').strip("'").strip('.')
-        # Limit to 50 chars
-        return title[:50] if len(title) > 50 else title
-    except Exception as e:
-        # Fallback: use first non-greeting message
-        for m in messages:
-            if m.role == "user" and not is_greeting(m.content):
-                words = m.content.split()[:5]
-                return " ".join(words) + ("..." if len(m.content.split()) > 5 else "")
-        return "New Chat"
+def title_due(user_message_count: int, message_text: str) -> bool:
+    """Generate/update the title after the 3rd user message (or the 1st if it is not a greeting)"""
+    if user_message_count == 1 and not is_greeting(message_text):
+        # First message and not a greeting - create temporary title
+        return True
+    # After 3 messages - generate meaningful title from context
+    return user_message_count == 3
+
+async def prepare_chat_turn(db: AsyncSession, session_id: str, message_text: str, persona: str) -> dict:
+    """
+    Steps shared by /api/chat and /api/chat/stream: save the user message, queue a
+    title refresh when due and build the Gemini history for the turn.
+    """
+    def save_user_message(write_db: Session, archived_rows):
+        # 1) Save user message with persona; the session row hands back its updated counters
+        user_msg_entry, message_count, user_msg_count = add_message(
+            write_db, session_id, "user", message_text, persona, archived_rows=archived_rows
+        )
+
+        # 2) Smart title generation logic, queued in the same transaction
+        should_generate_title = title_due(user_msg_count, message_text)
+        if should_generate_title:
+            enqueue_title_job(write_db, session_id)
+        return user_msg_entry, message_count, user_msg_count, should_generate_title
+
+    with stage("save_user_message"):
+        user_msg_entry, message_count, user_msg_count, should_generate_title = await submit_message_write(session_id, save_user_message)
+    annotate(d=message_count)
+    await publish_message_event(session_id, user_msg_entry, message_count, user_msg_count)
+    if should_generate_title:
+        # Titling runs in the background worker; the new title arrives as a `titled` session event
+        title_worker.notify()
+
+    # 3) Session history for Gemini: from the cache when it is current, else the last N messages
+    with stage("history"):
+        cached_history = history_cache.get(session_id, message_count - 1)
+        if cached_history is not None:
+            chat_history = cached_history + [{"role": "user", "parts": [message_text]}]
+            history_cache.append(session_id, "user", message_text)
+        else:
+            history_rows = (await db.scalars(
+                select(ChatMessage)
+                .where(ChatMessage.session_key == user_msg_entry.session_key)
+                .order_by(ChatMessage.id.desc())
+                .limit(HISTORY_LIMIT)
+            )).all()
+            history_rows = history_rows[::-1]  # chronological order
+
+            # 4) Format history for Gemini
+            chat_history = build_gemini_history(history_rows)
+            history_cache.put(session_id, chat_history, message_count)
+
+    # Keep what fits the persona's token budget; older turns are covered by the rolling summary
+    with stage("context"):
+        budget = PERSONAS[persona].get("context_budget", DEFAULT_CONTEXT_BUDGET)
+        chat_history = await build_context(db, session_id, chat_history, message_count, budget)
+
+    # End the read transaction so the pooled connection is released while we wait on Gemini
+    await db.commit()
+
+    return {
+        "user_message": user_msg_entry,
+        "history": chat_history,
+        "title_generated": should_generate_title,
+        "first_turn": message_count == 1,
+    }
+
+def cached_reply(turn: dict, message_text: str, persona: str):
+    """(reply, kind) from the response cache for a session's first message, else (None, None)"""
+    if not turn["first_turn"]:
+        return None, None
+    return response_cache.get(persona, message_text, greeting=is_greeting(message_text))
+
+def record_token_usage(persona: str, history: list, reply: str, usage=None):
+    """Count tokens sent/received: Gemini's usage metadata when present, else the context estimate"""
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or history_tokens(history)
+    reply_tokens = getattr(usage, "candidates_token_count", None) or estimate_tokens(reply)
+    count_tokens("in", persona, prompt_tokens)
+    count_tokens("out", persona, reply_tokens)
+
+def remember_reply(turn: dict, message_text: str, persona: str, reply: str):
+    if turn["first_turn"]:
+        response_cache.put(persona, message_text, reply, greeting=is_greeting(message_text))
+
+async def save_bot_reply(session_id: str, content: str, persona: str) -> ChatMessage:
+    """Persist a bot reply through the group-commit writer"""
+    def save(write_db: Session, archived_rows):
+        return add_message(write_db, session_id, "bot", content, persona, archived_rows=archived_rows)
+
+    with stage("save_reply"):
+        bot_msg_entry, message_count, user_msg_count = await submit_message_write(session_id, save)
+    history_cache.append(session_id, "model", content)
+    await publish_message_event(session_id, bot_msg_entry, message_count, user_msg_count)
+    return bot_msg_entry
+
+async def publish_message_event(session_id: str, message: ChatMessage, message_count: int, user_message_count: int):
+    """Tell session-list subscribers about a new message (the first one creates the session)"""
+    fields = {
+        "persona": message.persona,
+        "last_message_time": stored_timestamp(message.timestamp).isoformat(),
+        "message_count": message_count,
+    }
+    if message.role == "user" and user_message_count == 1:
+        # First user message: it becomes the snippet and, until titled, the title
+        fields["snippet"] = message.content[:60]
+        fields["fallback_title"] = title_from_first_message(message.content)
+    await session_events.publish("created" if message_count == 1 else "message", session_id, **fields)
 
 # --- Endpoints ---
 
+def turn_result(turn: dict, bot_msg_entry: ChatMessage, cached: Optional[str]) -> dict:
+    """
+    Outcome of a chat turn, shared with duplicate requests (see single_flight.py). Timestamps
+    are the stored values, so they match what /api/history returns for the same messages.
+    """
+    return {
+        "reply": bot_msg_entry.content,
+        "title_generated": turn["title_generated"],
+        "cached": cached,
+        "message_id": bot_msg_entry.id,
+        "timestamp": stored_timestamp(bot_msg_entry.timestamp).isoformat(),
+        "user_message_id": turn["user_message"].id,
+        "user_timestamp": stored_timestamp(turn["user_message"].timestamp).isoformat(),
+    }
+
 @app.post("/api/chat")
-async def chat_with_gemini(user_input: UserMessage, request: Request, db: Session = Depends(get_db)):
+async def chat_with_gemini(user_input: UserMessage, request: Request):
     """
     Expects JSON:
     {
@@ -392,171 +637,375 @@ async def chat_with_gemini(user_input: UserMessage, request: Request, db: Sessio
       "message": "Hi, suggest places...",
       "persona": "travel" (optional, defaults to travel)
     }
+    An optional Idempotency-Key header makes retries replay the first reply.
     """
+    session_id, message_text, persona = validate_chat_input(user_input)
+    annotate(session_id, p=persona, len=len(message_text))
+
     # Apply rate limiting
-    check_rate_limit(request)
-    
-    session_id = user_input.session_id.strip()
-    message_text = user_input.message.strip()
-    persona = user_input.persona or "travel"
-    
-    if not message_text:
-        raise HTTPException(status_code=400, detail="Empty message")
-    
-    # Validate persona
-    if persona not in PERSONAS:
-        raise HTTPException(status_code=400, detail=f"Invalid persona. Choose from: {', '.join(PERSONAS.keys())}")
+    await check_rate_limit(request, "chat", session_id)
 
     try:
-        # Check if this is the first user message in the session
-        message_count = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id,
-            ChatMessage.role.in_(["user", "bot"])
-        ).count()
-        
-        is_first_message = message_count == 0
-        
-        # 1) Save user message with persona
-        user_msg_entry = ChatMessage(session_id=session_id, role="user", content=message_text, persona=persona, timestamp=get_ist_now())
-        db.add(user_msg_entry)
-        db.commit()
-        db.refresh(user_msg_entry)
-
-        # 2) Smart title generation logic
-        # Count user messages (after adding current one)
-        user_msg_count = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id,
-            ChatMessage.role == "user"
-        ).count()
-        
-        # Generate/update title after 3rd user message (or 1st if not a greeting)
-        should_generate_title = False
-        
-        if user_msg_count == 1 and not is_greeting(message_text):
-            # First message and not a greeting - create temporary title
-            should_generate_title = True
-        elif user_msg_count == 3:
-            # After 3 messages - generate meaningful title from context
-            should_generate_title = True
-        
-        if should_generate_title:
-            # Get all messages for context
-            all_messages = db.query(ChatMessage).filter(
-                ChatMessage.session_id == session_id,
-                ChatMessage.role.in_(["user", "bot"])
-            ).order_by(ChatMessage.id.asc()).all()
-            
-            title = generate_title_from_conversation(all_messages)
-            
-            # Check if title already exists
-            existing_title = db.query(ChatMessage).filter(
-                ChatMessage.session_id == session_id,
-                ChatMessage.role == "system",
-                ChatMessage.content.like("[title]%")
-            ).first()
-            
-            if existing_title:
-                # Update existing title
-                existing_title.content = f"[title]{title}"
-            else:
-                # Create new title
-                title_msg = ChatMessage(session_id=session_id, role="system", content=f"[title]{title}", timestamp=get_ist_now())
-                db.add(title_msg)
-            
-            db.commit()
-
-        # 3) Fetch recent session-specific history (limit to last N messages)
-        N = 200  # number of DB messages to include; tune as needed
-        history_rows = (
-            db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session_id)
-            .order_by(ChatMessage.id.desc())
-            .limit(N)
-            .all()
-        )
-        history_rows = history_rows[::-1]  # chronological order
-
-        # 4) Format history for Gemini
-        chat_history = build_gemini_history(history_rows)
-
-        # 5) Get model for current persona and start conversation
-        model = get_model_for_persona(persona)
-        chat = model.start_chat(history=chat_history)
-        response = chat.send_message(message_text)
-        bot_reply_text = response.text if hasattr(response, "text") else str(response)
-
-        # 6) Save bot reply with persona
-        bot_msg_entry = ChatMessage(session_id=session_id, role="bot", content=bot_reply_text, persona=persona, timestamp=get_ist_now())
-        db.add(bot_msg_entry)
-        db.commit()
-        db.refresh(bot_msg_entry)
+        # Saturated: answer 503 + Retry-After before saving anything, so retries do not add copies
+        llm_scheduler.check_admission()
+    except LLMOverloaded as e:
+        raise http_error_for_llm_exception(e)
 
-        return {"reply": bot_reply_text, "title_generated": should_generate_title}
+    key, replay_ttl = chat_key(session_id, persona, message_text, request.headers.get("idempotency-key"))
+    try:
+        async with chat_flights.claim(key, replay_ttl) as flight:
+            if flight.result is None:
+                # Turns of one session run in arrival order, each seeing the previous reply
+                async with session_locks.hold(session_id):
+                    async with shard_for(session_id).AsyncReadSessionLocal() as db:
+                        turn = await prepare_chat_turn(db, session_id, message_text, persona)
+
+                    bot_reply_text, cached = cached_reply(turn, message_text, persona)
+                    if bot_reply_text is None:
+                        # 5) Get model for current persona and start conversation
+                        model = get_model_for_persona(persona)
+                        # Deadline, retries (a fresh chat per attempt), optional hedging; see llm_resilience.py
+                        with stage("llm"), upstream_timer():
+                            response = await resilient_llm.call(
+                                lambda: model.start_chat(history=turn["history"]).send_message_async(message_text)
+                            )
+                        bot_reply_text = response.text if hasattr(response, "text") else str(response)
+                        record_token_usage(persona, turn["history"], bot_reply_text, getattr(response, "usage_metadata", None))
+                        remember_reply(turn, message_text, persona, bot_reply_text)
+
+                    # 6) Save bot reply with persona
+                    bot_msg_entry = await save_bot_reply(session_id, bot_reply_text, persona)
+                    flight.result = turn_result(turn, bot_msg_entry, cached)
+
+        result = flight.result
+        annotate(out=len(result["reply"]), c=result["cached"])
+        return {"reply": result["reply"], "title_generated": result["title_generated"], "cached": result["cached"]}
 
     except HTTPException:
         # Re-raise HTTP exceptions (like rate limit)
         raise
     except Exception as e:
         # Log the full error for debugging
-        import traceback
-        print("ERROR in /api/chat:")
-        print(traceback.format_exc())
-        
-        # Handle specific Gemini API errors
-        error_msg = str(e)
-        if "403" in error_msg or "PermissionDenied" in error_msg:
-            raise HTTPException(status_code=403, detail="API key issue. Please check your Gemini API key.")
-        elif "429" in error_msg or "quota" in error_msg.lower():
-            raise HTTPException(status_code=429, detail="API rate limit exceeded. Please try again later.")
-        elif "timeout" in error_msg.lower():
-            raise HTTPException(status_code=504, detail="Request timeout. Please try again.")
-        else:
-            raise HTTPException(status_code=500, detail="An error occurred while processing your request.")
+        report_error("/api/chat")
+        raise http_error_for_llm_exception(e)
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a single Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def done_event(result: dict) -> str:
+    return sse_event("done", {name: value for name, value in result.items() if name != "reply"})
+
+def error_event(e: Exception) -> str:
+    error = http_error_for_llm_exception(e)
+    payload = {"status": error.status_code, "detail": error.detail}
+    if error.headers and "Retry-After" in error.headers:
+        payload["retry_after"] = int(error.headers["Retry-After"])
+    return sse_event("error", payload)
+
+def chunk_text(chunk) -> str:
+    """Text of a streamed Gemini chunk ('' for chunks without text parts)"""
+    try:
+        return chunk.text
+    except (AttributeError, ValueError):
+        return ""
+
+@app.post("/api/chat/stream")
+async def chat_with_gemini_stream(user_input: UserMessage, request: Request):
+    """
+    Same request body (and Idempotency-Key header) as /api/chat, but the reply is streamed as Server-Sent Events:
+      event: token  data: {"text": "..."}           (repeated, as Gemini produces text)
+      event: done   data: {"message_id", "timestamp", "user_message_id", "user_timestamp", "title_generated", "cached"}
+      event: error  data: {"status", "detail"}
+    The bot message is saved once the stream completes, or as a partial row if the client disconnects.
+    A duplicate of a request in flight waits for it and receives its reply as a single token event.
+    """
+    session_id, message_text, persona = validate_chat_input(user_input)
+    annotate(session_id, p=persona, len=len(message_text))
+
+    await check_rate_limit(request, "chat", session_id)
+
+    key, replay_ttl = chat_key(session_id, persona, message_text, request.headers.get("idempotency-key"))
+    try:
+        # Saturated: answer 503 + Retry-After now rather than as an error event in a 200 stream
+        llm_scheduler.check_admission()
+    except LLMOverloaded as e:
+        raise http_error_for_llm_exception(e)
+
+    async def event_stream():
+        try:
+            async with chat_flights.claim(key, replay_ttl) as flight:
+                if flight.result is not None:
+                    if flight.result["reply"]:
+                        yield sse_event("token", {"text": flight.result["reply"]})
+                    annotate(out=len(flight.result["reply"]), c=flight.result["cached"])
+                    yield done_event(flight.result)
+                    return
+
+                async with session_locks.hold(session_id):
+                    parts = []
+                    finished = False
+                    try:
+                        async with shard_for(session_id).AsyncReadSessionLocal() as db:
+                            turn = await prepare_chat_turn(db, session_id, message_text, persona)
+                        cached_text, cached = cached_reply(turn, message_text, persona)
+                        if cached_text is not None:
+                            # Cached reply: one token event, no Gemini call
+                            parts.append(cached_text)
+                            yield sse_event("token", {"text": cached_text})
+                        else:
+                            model = get_model_for_persona(persona)
+                            # Retried/hedged until the stream starts; its scheduler slot is held until it ends
+                            usage = None
+                            with stage("llm"), upstream_timer():
+                                async with resilient_llm.stream(
+                                    lambda: model.start_chat(history=turn["history"]).send_message_async(message_text, stream=True)
+                                ) as chunks:
+                                    async for chunk in chunks:
+                                        usage = getattr(chunk, "usage_metadata", None) or usage
+                                        text = chunk_text(chunk)
+                                        if text:
+                                            parts.append(text)
+                                            yield sse_event("token", {"text": text})
+                            record_token_usage(persona, turn["history"], "".join(parts), usage)
+                            remember_reply(turn, message_text, persona, "".join(parts))
+                        finished = True
+                    except Exception as e:
+                        report_error("/api/chat/stream")
+                        flight.error = e  # duplicates waiting on this turn get the same error
+                        yield error_event(e)
+                    finally:
+                        if finished or parts:
+                            # Shield the write so a client disconnect (task cancellation) still persists the partial reply
+                            with anyio.CancelScope(shield=True):
+                                bot_msg_entry = await save_bot_reply(session_id, "".join(parts), persona)
+                                # Duplicates get what was saved, rather than running the turn again
+                                flight.result = turn_result(turn, bot_msg_entry, cached)
+                    if finished:
+                        annotate(out=len(flight.result["reply"]), c=flight.result["cached"])
+                        yield done_event(flight.result)
+        except Exception as e:
+            # A duplicate whose leading request failed gets its error instead of running the turn again
+            report_error("/api/chat/stream")
+            yield error_event(e)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def session_version(db: Session, session_id: str):
+    """
+    (key, message_count, last_message_time, archived) of a session, or None. Messages are
+    append-only until the session is cleared, and a recreated session gets newer times, so the
+    first three change whenever the session's messages do (archiving and restoring keep ids).
+    """
+    return db.query(
+        ChatSession.key, ChatSession.message_count, ChatSession.last_message_time, ChatSession.archived
+    ).filter(ChatSession.session_id == session_id).first()
 
 @app.get("/api/history")
-def get_chat_history(session_id: str, limit: Optional[int] = 200, db: Session = Depends(get_db)):
+def get_chat_history(
+    session_id: str,
+    request: Request,
+    limit: Optional[int] = 200,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    db: Session = Depends(get_session_read_db),
+):
     """
-    GET /api/history?session_id=...&limit=100
-    Returns only user and bot messages (excludes system messages like titles).
+    GET /api/history?session_id=...&limit=100[&before_id=...|&after_id=...]
+    Returns the session's messages, oldest first.
+
+    Keyset pagination on message id:
+      - no cursor: the latest `limit` messages; `next_cursor` is the before_id for the previous page
+      - before_id: the `limit` messages just older than that id (scrolling back)
+      - after_id: messages newer than that id (incremental "since last id" fetch);
+        `next_cursor` is the after_id to use on the next call
+    Sends an ETag; a matching If-None-Match gets 304 without reading any message rows.
     """
-    limit = min(int(limit or 200), 2000)
-    if session_id:
-        msgs = (
-            db.query(ChatMessage)
-            .filter(
-                ChatMessage.session_id == session_id,
-                ChatMessage.role.in_(["user", "bot"])  # Exclude system messages
-            )
-            .order_by(ChatMessage.id.asc())
-            .all()
-        )
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use either before_id or after_id, not both")
+    limit = max(1, min(int(limit or 200), 2000))
+
+    # Version first, then messages: a write landing in between only costs the client one extra refetch
+    version = session_version(db, session_id)
+    annotate(session_id, d=version.message_count if version else 0)
+    etag = make_etag("h", *version[:3]) if version else make_etag("h", 0)
+    last_modified = version.last_message_time if version else None
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+    if version and version.archived:
+        # First read since the session was archived: bring its messages back, then read them
+        # in a new snapshot (this transaction's snapshot predates the restore)
+        with stage("restore"):
+            restore_archived(session_id)
+        db.rollback()
+
+    query = db.query(ChatMessage).filter(ChatMessage.session_key == (version.key if version else None))
+    # Fetch one extra row to know whether another page exists
+    with stage("history_query"):
+        if after_id is not None:
+            msgs = query.filter(ChatMessage.id > after_id).order_by(ChatMessage.id.asc()).limit(limit + 1).all()
+            has_more = len(msgs) > limit
+            msgs = msgs[:limit]
+            next_cursor = msgs[-1].id if msgs else after_id
+        else:
+            if before_id is not None:
+                query = query.filter(ChatMessage.id < before_id)
+            msgs = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+            has_more = len(msgs) > limit
+            msgs = msgs[:limit][::-1]  # chronological order
+            next_cursor = msgs[0].id if has_more else None
     
     # serialize
-    return [
-        {
-            "id": m.id,
-            "session_id": m.session_id,
-            "role": m.role,
-            "content": m.content,
-            "timestamp": m.timestamp.isoformat() if m.timestamp else None,
-        }
-        for m in msgs
-    ]
+    return versioned_json({
+        "messages": [
+            {
+                "id": m.id,
+                "session_id": session_id,
+                "role": m.role,
+                "content": m.content,
+                "timestamp": m.timestamp.isoformat() if m.timestamp else None,
+            }
+            for m in msgs
+        ],
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    }, etag, last_modified)
+
+@app.get("/api/search", dependencies=[Depends(rate_limited("search"))])
+def search_history(
+    q: str,
+    session_id: Optional[str] = None,
+    persona: Optional[str] = None,
+    role: Optional[str] = None,
+    sort: str = "rank",
+    limit: Optional[int] = 20,
+    offset: int = 0,
+):
+    """
+    GET /api/search?q=goa beaches[&session_id=...][&persona=travel][&role=user|bot][&sort=rank|recent]
+                   [&limit=20][&offset=0]
+    Full-text search over all sessions (or one), best matches first (or newest with sort=recent).
+    Every word must match; end a word with * to match it as a prefix ("itiner*"). Each result has message_id, session_id, session_title, role, persona, timestamp and an
+    HTML-escaped snippet with the matched words in <mark>. Page with `next_offset`.
+    """
+    if not SEARCH_SUPPORTED:
+        raise HTTPException(status_code=501, detail="Search needs the SQLite backend")
+    q = q.strip()
+    if not q or len(q) > 200:
+        raise HTTPException(status_code=400, detail="q must be 1-200 characters")
+    if persona is not None and persona not in PERSONAS:
+        raise HTTPException(status_code=400, detail=f"Invalid persona. Choose from: {', '.join(PERSONAS.keys())}")
+    if role is not None and role not in ("user", "bot"):
+        raise HTTPException(status_code=400, detail="role must be 'user' or 'bot'")
+    if sort not in ("rank", "recent"):
+        raise HTTPException(status_code=400, detail="sort must be 'rank' or 'recent'")
+    limit = max(1, min(int(limit or 20), 100))
+    offset = max(0, min(offset, 1000))  # deep pages: refine the query instead
+    annotate(session_id, w=len(q.split()))
+
+    with stage("search"):
+        if session_id is not None:
+            with shard_for(session_id).ReadSessionLocal() as db:
+                results, has_more = search_messages(db, q, session_id=session_id, persona=persona, role=role,
+                                                    sort=sort, limit=limit, offset=offset)
+        else:
+            results, has_more = search_all_shards(q, persona=persona, role=role, sort=sort, limit=limit, offset=offset)
+    return {
+        "results": results,
+        "next_offset": offset + len(results) if has_more else None,
+        "has_more": has_more,
+    }
 
 @app.get("/api/stats")
-def get_stats(session_id: Optional[str] = None, db: Session = Depends(get_db)):
+def get_stats(request: Request, session_id: Optional[str] = None, dbs: List[Session] = Depends(get_shard_read_dbs)):
     """
     GET /api/stats?session_id=...
-    Returns total_messages either for session or globally.
+    Returns total_messages either for session or globally (summed over the shards), from the
+    session rows (with an ETag).
     """
     if session_id:
-        count = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).count()
+        version = session_version(dbs[shard_for(session_id).index], session_id)
+        etag = make_etag("c", *version[:3]) if version else make_etag("c", 0)
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        count = version.message_count if version else 0
+        annotate(session_id, d=count)
     else:
-        count = db.query(ChatMessage).count()
-    return {"total_messages": count}
+        etag = make_etag("c", *(sessions_version(db) for db in dbs))
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        count = sum(db.query(func.coalesce(func.sum(ChatSession.message_count), 0)).scalar() for db in dbs)
+    return versioned_json({"total_messages": count}, etag)
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Hit/miss counters and sizes of this process's in-memory caches"""
+    return {
+        "responses": response_cache.stats(),
+        "history": history_cache.stats(),
+        "chat_flights": chat_flights.stats(),
+    }
 
-@app.delete("/api/clear")
-def clear_history(req: ClearRequest, db: Session = Depends(get_db)):
+@app.get("/api/llm/stats")
+def get_llm_stats():
+    """Upstream scheduler (limit, queue, throttling) and call resilience counters of this process"""
+    return {"scheduler": llm_scheduler.stats(), "calls": resilient_llm.stats()}
+
+# Scrape-time views of counters kept by other modules (no per-request cost)
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+for _name, _help, _fn in (
+    ("app_response_cache_misses_total", "Response cache lookups without a reusable answer", lambda: response_cache.misses),
+    ("app_history_cache_hits_total", "Chat turns served from the history cache", lambda: history_cache.hits),
+    ("app_history_cache_misses_total", "Chat turns that read history from the database", lambda: history_cache.misses),
+    ("app_chat_coalesced_total", "Duplicate chat requests that waited for an in-flight one", lambda: chat_flights.coalesced),
+    ("app_chat_replayed_total", "Duplicate chat requests answered with a recent result", lambda: chat_flights.replayed),
+    ("llm_scheduler_rejected_total", "LLM calls refused because the queue was full", lambda: llm_scheduler.rejected),
+    ("llm_scheduler_timed_out_total", "LLM calls that waited past their queue deadline", lambda: llm_scheduler.timed_out),
+    ("llm_throttled_total", "LLM calls the provider answered with 429", lambda: llm_scheduler.throttled),
+    ("llm_attempts_total", "Upstream LLM attempts, including retries and hedges", lambda: resilient_llm.attempts),
+    ("llm_retries_total", "Upstream LLM retries", lambda: resilient_llm.retried),
+    ("llm_timeouts_total", "Upstream LLM attempts cut off by a deadline", lambda: resilient_llm.timeouts),
+    ("llm_hedges_total", "Hedged LLM requests sent", lambda: resilient_llm.hedges),
+    ("llm_breaker_rejected_total", "LLM calls refused while the circuit breaker was open", lambda: resilient_llm.breaker.rejected),
+    ("db_group_commit_batches_total", "Write transactions committed by the group-commit writers",
+     lambda: sum(writer.batches for writer in group_writers)),
+    ("db_group_commit_operations_total", "Writes committed by the group-commit writers",
+     lambda: sum(writer.operations for writer in group_writers)),
+):
+    REGISTRY.register_callback(_name, "counter", _help, _fn)
+REGISTRY.register_callback("app_response_cache_hits_total", "counter", "Response cache hits by kind",
+                           lambda: {(kind,): n for kind, n in response_cache.hits.items()}, ("kind",))
+for _name, _help, _fn in (
+    ("llm_concurrency_limit", "Current adaptive limit on concurrent LLM calls", lambda: llm_scheduler.limit),
+    ("llm_in_flight", "LLM calls running now", lambda: llm_scheduler.in_flight),
+    ("llm_queued", "LLM calls waiting for a slot", lambda: llm_scheduler.queued),
+    ("llm_breaker_state", "Circuit breaker state (0 closed, 1 half open, 2 open)",
+     lambda: BREAKER_STATES.get(resilient_llm.breaker.state, 2)),
+    ("app_session_event_subscribers", "Open /api/sessions/events streams", lambda: session_events.subscriber_count),
+):
+    REGISTRY.register_callback(_name, "gauge", _help, _fn)
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition of this process's metrics (see metrics.py)"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/profile")
+def get_profile(reset: bool = False):
+    """Collapsed stacks from the sampling profiler (PROFILE_SAMPLING=1); ?reset=1 starts a new window"""
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is off; set PROFILE_SAMPLING=1")
+    return PlainTextResponse(profiler.collapsed(reset=reset))
+
+@app.delete("/api/clear", dependencies=[Depends(rate_limited("session_write"))])
+def clear_history(req: ClearRequest):
     """
     Clears chat history for the provided session_id ONLY.
     Request body: { "session_id": "..." }
@@ -564,133 +1013,240 @@ def clear_history(req: ClearRequest, db: Session = Depends(get_db)):
     session_id = req.session_id.strip()
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id required")
+    annotate(session_id)
 
     try:
-        deleted = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
-        db.commit()
+        with shard_for(session_id).SessionLocal() as db:
+            deleted = forget_session(db, session_id)
+            db.commit()
+        history_cache.invalidate(session_id)
+        anyio.from_thread.run(session_events.publish, "deleted", session_id)
         return {"message": "Cleared session", "deleted": deleted}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sessions")
-def list_sessions(db: Session = Depends(get_db)):
+def list_sessions(request: Request, dbs: List[Session] = Depends(get_shard_read_dbs)):
     """
     Return a list of sessions with auto-generated titles and persona info.
+    Served from the sessions summary table in a single indexed query per shard; the ETag is
+    the shards' `sessions` change counters, so an unchanged list costs one primary-key read each.
     """
-    # Get all unique session IDs
-    session_ids = db.query(ChatMessage.session_id).distinct().all()
-    
-    sessions = []
-    for (sid,) in session_ids:
-        # Get title from system message if exists (get the most recent one)
-        title_msg = db.query(ChatMessage).filter(
-            ChatMessage.session_id == sid,
-            ChatMessage.role == "system",
-            ChatMessage.content.like("[title]%")
-        ).order_by(ChatMessage.timestamp.desc()).first()
-        
-        # Get last message timestamp (exclude system messages for sorting)
-        last_msg = db.query(ChatMessage).filter(
-            ChatMessage.session_id == sid,
-            ChatMessage.role.in_(["user", "bot"])  # Only user/bot messages for sorting
-        ).order_by(ChatMessage.timestamp.desc()).first()
-        
-        # Get first user message as fallback
-        first_user_msg = db.query(ChatMessage).filter(
-            ChatMessage.session_id == sid,
-            ChatMessage.role == "user"
-        ).order_by(ChatMessage.timestamp.asc()).first()
-        
-        # Get persona from last message
-        persona = last_msg.persona if last_msg and last_msg.persona else "travel"
-        
-        if title_msg:
-            title = title_msg.content.replace("[title]", "").strip()
-        elif first_user_msg:
-            # Use first few words as title
-            words = first_user_msg.content.split()[:5]
-            title = " ".join(words) + ("..." if len(first_user_msg.content.split()) > 5 else "")
+    etag = make_etag("s", *(sessions_version(db) for db in dbs))  # read before the rows, as in /api/history
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    with stage("session_list"):
+        if len(dbs) == 1:
+            sessions = session_list(dbs[0])
         else:
-            title = "New Chat"
-        
-        sessions.append({
-            "session_id": sid,
-            "title": title,
-            "persona": persona,
-            "last_message_time": last_msg.timestamp.isoformat() if last_msg else None,
-            "snippet": first_user_msg.content[:60] if first_user_msg else ""
-        })
-    
-    # Sort by last message time
-    sessions.sort(key=lambda x: x["last_message_time"] or "", reverse=True)
-    
-    return {"sessions": sessions}
+            sessions = {"sessions": [session_summary(row) for row in newest_first(
+                row for db in dbs for row in db.query(*SESSION_LIST_COLUMNS)
+            )]}
+    return versioned_json(sessions, etag)
+
+SESSION_LIST_COLUMNS = (
+    ChatSession.session_id, ChatSession.title, ChatSession.fallback_title, ChatSession.persona,
+    ChatSession.last_message_time, ChatSession.snippet, ChatSession.message_count,
+)
+
+def session_list(db: Session) -> dict:
+    # Plain column rows: no ORM objects or identity map for what is only serialized
+    rows = db.query(*SESSION_LIST_COLUMNS).order_by(ChatSession.last_message_time.desc()).all()
+    return {"sessions": [session_summary(row) for row in rows]}
+
+def newest_first(rows) -> list:
+    """Session rows merged across shards in list order (sessions without messages last, as in SQLite)"""
+    return sorted(rows, key=lambda row: (row.last_message_time is not None, row.last_message_time or 0), reverse=True)
+
+def session_summary(row) -> dict:
+    """A session (ChatSession or SESSION_LIST_COLUMNS row) as listed by /api/sessions"""
+    return {
+        "session_id": row.session_id,
+        "title": row.title or row.fallback_title or "New Chat",
+        "persona": row.persona or "travel",
+        "last_message_time": row.last_message_time.isoformat() if row.last_message_time else None,
+        "snippet": row.snippet or "",
+        "message_count": row.message_count,
+    }
+
+SESSION_EVENTS_KEEPALIVE = float(os.getenv("SESSION_EVENTS_KEEPALIVE", "15"))  # seconds between idle pings
+
+# Open /api/sessions/events streams per client IP (per process). Streams are capped rather than
+# their connects counted, so a client reconnecting after a dropped stream is never locked out.
+EVENTS_MAX_STREAMS_PER_IP = int(os.getenv("EVENTS_MAX_STREAMS_PER_IP", "5"))
+event_streams = ConcurrencyLimit(EVENTS_MAX_STREAMS_PER_IP)
+
+class SlotStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls `release` however the stream ends, even if it never starts"""
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+@app.get("/api/sessions/events")
+async def session_list_events(request: Request):
+    """
+    Server-Sent Events replacing /api/sessions polling:
+      event: snapshot  data: {"sessions": [...]}     (once, same rows as GET /api/sessions)
+      event: session   data: {"type", "session_id", "session": {changed fields}}   (per change)
+      event: reset     data: {}                       (client fell behind; reconnect for a new snapshot)
+    Event types are created, message, renamed, titled and deleted (see session_events.py).
+    """
+    client = request.client.host
+    if not event_streams.acquire(client):
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many open session event streams. Max {event_streams.limit} per client.",
+            headers={"Retry-After": "10"},
+        )
+
+    async def event_stream():
+        # Subscribe before reading the snapshot so no change falls in between (events are idempotent)
+        async with session_events.subscribe() as subscription:
+            rows = []
+            for shard in shards:
+                async with shard.AsyncReadSessionLocal() as db:
+                    rows += (await db.execute(
+                        select(*SESSION_LIST_COLUMNS).order_by(ChatSession.last_message_time.desc())
+                    )).all()
+            if len(shards) > 1:
+                rows = newest_first(rows)
+            yield sse_event("snapshot", {"sessions": [session_summary(row) for row in rows]})
+
+            while True:
+                try:
+                    data = await asyncio.wait_for(subscription.get(), timeout=SESSION_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"  # SSE comment; keeps proxies from closing an idle stream
+                    continue
+                if data is None:
+                    yield sse_event("reset", {})
+                    return
+                yield f"event: session\ndata: {data}\n\n"
+
+    return SlotStreamingResponse(
+        event_stream(),
+        release=lambda: event_streams.release(client),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 class NewSessionRequest(BaseModel):
     title: Optional[str] = None
     persona: Optional[str] = "travel"
 
-@app.post("/api/sessions")
-def create_session(req: NewSessionRequest = None, db: Session = Depends(get_db)):
+@app.post("/api/sessions", dependencies=[Depends(rate_limited("session_write"))])
+def create_session(req: NewSessionRequest = None):
     """
-    Create a new session id and optionally a system message/title.
+    Create a new session id and optionally its title.
     Returns { session_id, title (optional), persona }.
     """
     import uuid
     sid = str(uuid.uuid4())
     persona = req.persona if req and req.persona else "travel"
     
-    # Optionally create an initial system message or title marker (not required)
+    # Optionally store the session with its title right away (otherwise it appears with the first message)
     if req and req.title:
-        msg = ChatMessage(session_id=sid, role="system", content=f"[title]{req.title}", persona=persona, timestamp=get_ist_now())
-        db.add(msg)
-        db.commit()
+        with shard_for(sid).SessionLocal() as db:
+            record_title(db, sid, req.title, persona)
+            db.commit()
+        anyio.from_thread.run(
+            lambda: session_events.publish("created", sid, title=req.title, persona=persona, message_count=0)
+        )
     return {"session_id": sid, "title": req.title if req else None, "persona": persona}
 
 class RenameSessionRequest(BaseModel):
     session_id: str
     title: str
 
-@app.post("/api/sessions/rename")
-def rename_session(req: RenameSessionRequest, db: Session = Depends(get_db)):
+@app.post("/api/sessions/rename", dependencies=[Depends(rate_limited("session_write"))])
+def rename_session(req: RenameSessionRequest):
     """
-    Rename a session by updating or creating a title marker message.
+    Rename a session (its last message time, and so its place in the list, is unchanged).
     """
     sid = req.session_id.strip()
     if not sid:
         raise HTTPException(status_code=400, detail="session_id required")
-    
-    # Find existing title message
-    existing_title = db.query(ChatMessage).filter(
-        ChatMessage.session_id == sid,
-        ChatMessage.role == "system",
-        ChatMessage.content.like("[title]%")
-    ).first()
-    
-    if existing_title:
-        # Update existing title (keep original timestamp to not affect sorting)
-        existing_title.content = f"[title]{req.title}"
-        # Don't update timestamp - keep original
-    else:
-        # Create new title message with current time
-        marker = ChatMessage(session_id=sid, role="system", content=f"[title]{req.title}", timestamp=get_ist_now())
-        db.add(marker)
-    
-    db.commit()
+    annotate(sid)
+
+    with shard_for(sid).SessionLocal() as db:
+        record_title(db, sid, req.title)
+        db.commit()
+    history_cache.invalidate(sid)
+    anyio.from_thread.run(lambda: session_events.publish("renamed", sid, title=req.title))
     return {"ok": True}
 
 class DeleteSessionRequest(BaseModel):
     session_id: str
 
-@app.delete("/api/sessions")
-def delete_session(req: DeleteSessionRequest, db: Session = Depends(get_db)):
+@app.delete("/api/sessions", dependencies=[Depends(rate_limited("session_write"))])
+def delete_session(req: DeleteSessionRequest):
     """
     Delete all messages for a session.
     """
-    deleted = db.query(ChatMessage).filter(ChatMessage.session_id == req.session_id).delete()
-    db.commit()
+    annotate(req.session_id)
+    with shard_for(req.session_id).SessionLocal() as db:
+        deleted = forget_session(db, req.session_id)
+        db.commit()
+    history_cache.invalidate(req.session_id)
+    anyio.from_thread.run(session_events.publish, "deleted", req.session_id)
     return {"deleted": deleted}
 
+# Bulk NDJSON transfer (see bulk_transfer.py); import writes arbitrary sessions, so it is opt-in
+BULK_IMPORT_ENABLED = os.getenv("BULK_IMPORT_ENABLED", "0") == "1"
+
+@app.get("/api/export", dependencies=[Depends(rate_limited("transfer"))])
+def export_sessions(
+    request: Request,
+    persona: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """
+    GET /api/export[?persona=travel][&since=2025-01-01][&until=2025-07-01]
+    Streams sessions (filtered by persona and last message time, IST) and their messages as NDJSON
+    in constant memory; gzip-encoded when the client accepts it.
+    """
+    if persona is not None and persona not in PERSONAS:
+        raise HTTPException(status_code=400, detail=f"Invalid persona. Choose from: {', '.join(PERSONAS.keys())}")
+    chunks = export_chunks(export_records(persona, since, until))
+    headers = {"Content-Disposition": 'attachment; filename="sessions.ndjson"', "Cache-Control": "no-store"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        chunks = gzip_chunks(chunks)
+        headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+@app.post("/api/import", dependencies=[Depends(rate_limited("transfer"))])
+async def import_sessions(request: Request, existing: str = "skip"):
+    """
+    POST /api/import[?existing=skip|replace|append] with an NDJSON body from /api/export
+    (optionally Content-Encoding: gzip). Commits every IMPORT_BATCH lines as the body arrives.
+    Needs BULK_IMPORT_ENABLED=1. A bad line stops the import with 400; earlier batches stay.
+    """
+    if not BULK_IMPORT_ENABLED:
+        raise HTTPException(status_code=403, detail="Bulk import is disabled (set BULK_IMPORT_ENABLED=1)")
+    if existing not in EXISTING_MODES:
+        raise HTTPException(status_code=400, detail=f"existing must be one of: {', '.join(EXISTING_MODES)}")
+    importer = Importer(existing)
+
+    def invalidate(session_ids):
+        for session_id in session_ids:
+            history_cache.invalidate(session_id)
+
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    try:
+        await import_stream(request.stream(), importer, gzipped=gzipped, on_batch=invalidate)
+    except BadRecord as e:
+        raise HTTPException(status_code=400, detail=f"Import stopped at {e}; imported before it: {importer.stats()}")
+    return importer.stats()  # open sidebars pick up imported sessions with their next snapshot
+
 @app.get("/api/personas")
 def get_personas():
     """
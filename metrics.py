@@ -0,0 +1,258 @@
+# metrics.py
+"""
+Request instrumentation: per-stage timings, counters and histograms in the
+Prometheus text format (GET /metrics), and Server-Timing headers.
+
+- MetricsMiddleware times every request and counts it by route template
+  and status, together with the SQL statements it ran (engines are hooked
+  with instrument_engine()).
+- Code marks the stages of a request with `with stage("history"): ...`;
+  each stage feeds the `app_stage_duration_seconds` histogram and the
+  request's Server-Timing header (stages that finish after the headers are
+  sent, e.g. the reply of a streamed chat, only reach the histogram).
+- Values owned by other modules (cache hits, scheduler counters) are read
+  at scrape time through register_callback(), so they cost nothing per
+  request.
+- report_error() replaces bare traceback prints: it prints the same
+  traceback and counts the error.
+
+METRICS_ENABLED=0 turns the middleware and stage timing into no-ops.
+Everything is per process; scrape each worker.
+"""
+import os
+import time
+import bisect
+import threading
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labels + ("le",)
+        for label_values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, label_values + (_format_value(float(bound)),))} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(names, label_values + ('+Inf',))} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(float(series[-2]))}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._callbacks = []  # (name, type, help, labels, fn returning value or {label values: value})
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_callback(self, name: str, type: str, help: str, fn: Callable, labels: Tuple[str, ...] = ()):
+        """Metric read at scrape time: fn() returns a number, or {label values tuple: number} with `labels`"""
+        self._callbacks.append((name, type, help, labels, fn))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, type, help, labels, fn in self._callbacks:
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"ERROR collecting metric {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            if isinstance(value, dict):
+                for label_values, v in sorted(value.items()):
+                    lines.append(f"{name}{_format_labels(labels, label_values)} {_format_value(v)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+requests_total = REGISTRY.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+request_duration = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time until the response is complete", ("method", "route"))
+request_queries = REGISTRY.histogram(
+    "http_request_db_queries", "SQL statements run per request", ("route",), buckets=COUNT_BUCKETS)
+stage_duration = REGISTRY.histogram("app_stage_duration_seconds", "Time spent in each request stage", ("stage",))
+llm_tokens = REGISTRY.counter("llm_tokens_total", "LLM tokens sent and received", ("direction", "persona"))
+errors_total = REGISTRY.counter("app_errors_total", "Unhandled errors by location", ("where",))
+
+
+class RequestTimings:
+    """Stage durations and SQL statement count of the current request"""
+
+    __slots__ = ("stages", "queries")
+
+    def __init__(self):
+        self.stages = []  # (name, seconds), in completion order
+        self.queries = 0
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages]
+        parts.append(f'db;desc="{self.queries} queries"')
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def detach_request():
+    """Stop attributing work to the request that started this task (long-lived background tasks)"""
+    _current.set(None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a named stage of the current request"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, name)
+        timings = _current.get()
+        if timings is not None:
+            timings.stages.append((name, elapsed))
+
+
+def count_tokens(direction: str, persona: str, tokens: int):
+    if METRICS_ENABLED and tokens:
+        llm_tokens.inc(direction, persona, amount=tokens)
+
+
+def report_error(where: str):
+    """Print the current exception's traceback (call from an except block) and count it"""
+    print(f"ERROR in {where}:")
+    print(traceback.format_exc())
+    errors_total.inc(where)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    timings = _current.get()
+    if timings is not None:
+        timings.queries += 1
+
+
+def instrument_engine(engine):
+    """Count the SQL statements each request runs on `engine` (sync Engine or AsyncEngine)"""
+    from sqlalchemy import event
+    target = getattr(engine, "sync_engine", engine)
+    if not event.contains(target, "before_cursor_execute", _count_query):  # read and write engines may be one
+        event.listen(target, "before_cursor_execute", _count_query)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts/durations/queries and adding Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", timings.server_timing(time.perf_counter() - start).encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"  # route templates keep label cardinality bounded
+            method = scope["method"]
+            requests_total.inc(method, path, status)
+            request_duration.observe(elapsed, method, path)
+            request_queries.observe(timings.queries, path)
+            _current.reset(token)
@@ -0,0 +1,100 @@
+# profiling.py
+"""
+Optional sampling profiler (PROFILE_SAMPLING=1).
+
+A daemon thread records the Python stack of every busy thread each
+PROFILE_INTERVAL seconds. Threads that used no CPU since the last sample
+(where per-thread CPU clocks exist) or sit in a selector, lock or queue
+wait are skipped. Stacks are aggregated in the "collapsed" format read by
+flamegraph.pl, speedscope and similar tools:
+
+    MainThread;main.py:chat_with_gemini;context.py:build_context 42
+
+GET /debug/profile returns the samples so far (?reset=1 starts over), and
+they are written to PROFILE_OUTPUT when the app shuts down. Sampling costs
+a few microseconds per thread per sample, so keep the interval at 5 ms or
+more in production.
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+PROFILE_SAMPLING = os.getenv("PROFILE_SAMPLING", "0") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))  # seconds between samples
+PROFILE_OUTPUT = os.getenv("PROFILE_OUTPUT", "profile.collapsed")
+MAX_DEPTH = 64
+
+# A thread whose innermost frame is in one of these is waiting, not working
+IDLE_FILES = ("selectors.py", "threading.py", "queue.py", "base_events.py")
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._cpu = {}  # thread ident -> CPU seconds at the last sample
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self, reset: bool = False) -> str:
+        with self._lock:
+            stacks = self._stacks
+            if reset:
+                self._stacks = Counter()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def write(self, path: str = PROFILE_OUTPUT):
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_filename.endswith(IDLE_FILES) or not self._ran(ident):
+                    continue
+                sampled.append(self._collapse(names.get(ident, "thread"), frame))
+            with self._lock:
+                self.samples += 1
+                self._stacks.update(sampled)
+
+    def _ran(self, ident: int) -> bool:
+        """Whether the thread used CPU since the last sample (blocked in C code, it did not)"""
+        try:
+            cpu = time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except (AttributeError, OSError):
+            return True  # no per-thread clocks here; rely on IDLE_FILES
+        previous = self._cpu.get(ident)
+        self._cpu[ident] = cpu
+        return previous is None or cpu > previous
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        names = []
+        while frame is not None and len(names) < MAX_DEPTH:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        names.append(thread_name)
+        return ";".join(reversed(names))
+
+
+profiler = SamplingProfiler() if PROFILE_SAMPLING else None
@@ -0,0 +1,221 @@
+# rate_limit.py
+"""
+Token-bucket rate limiting with pluggable storage.
+
+Each limited key (e.g. "chat:ip:1.2.3.4") is one bucket of `requests` tokens
+refilled at `requests / window` per second, so memory per client is O(1)
+and idle buckets can be dropped once they would be full again.
+
+Backends (RATE_LIMIT_BACKEND):
+  memory - per-process dict (default; limits multiply with uvicorn workers)
+  sqlite - shared SQLite file (RATE_LIMIT_SQLITE_PATH), holds across workers on one host
+  redis  - any Redis-protocol server (RATE_LIMIT_REDIS_URL), holds across hosts
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import anyio
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "./rate_limits.db")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # memory backend hard cap
+
+
+class RateLimit:
+    """At most `requests` per `window` seconds (bursts up to `requests`)"""
+
+    def __init__(self, requests: int, window: float):
+        self.requests = requests
+        self.window = window
+
+    @property
+    def capacity(self) -> float:
+        return float(self.requests)
+
+    @property
+    def refill_rate(self) -> float:
+        return self.requests / self.window
+
+
+class MemoryBackend:
+    """In-process buckets; least recently used keys are evicted once idle long enough to be full"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated, full_at]
+        self._lock = threading.Lock()
+
+    async def acquire(self, key: str, limit: RateLimit, now: float = None):
+        return self.acquire_sync(key, limit, now)
+
+    def acquire_sync(self, key: str, limit: RateLimit, now: float = None):
+        """Take one token; returns (allowed, retry_after_seconds)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = limit.capacity
+            else:
+                tokens = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.refill_rate)
+                self._buckets.move_to_end(key)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            full_at = now + (limit.capacity - tokens) / limit.refill_rate
+            if bucket is None:
+                self._buckets[key] = [tokens, now, full_at]
+            else:
+                bucket[0], bucket[1], bucket[2] = tokens, now, full_at
+            self._evict(now)
+        return allowed, 0.0 if allowed else (1 - tokens) / limit.refill_rate
+
+    def _evict(self, now: float):
+        # A couple of checks per call keeps eviction O(1) amortized
+        for _ in range(2):
+            if not self._buckets:
+                return
+            key, bucket = next(iter(self._buckets.items()))
+            if bucket[2] <= now or len(self._buckets) > self.max_keys:
+                del self._buckets[key]
+            else:
+                return
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBackend:
+    """Buckets in a shared SQLite file, updated atomically with one UPSERT per request"""
+
+    # Refill, then take a token only if one is available; no row comes back when denied
+    ACQUIRE_SQL = """
+        INSERT INTO buckets (key, tokens, updated, full_at) VALUES (:key, :capacity - 1, :now, :now + 1 / :rate)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = min(:capacity, tokens + (:now - updated) * :rate) - 1,
+            updated = :now,
+            full_at = :now + (:capacity - (min(:capacity, tokens + (:now - updated) * :rate) - 1)) / :rate
+        WHERE min(:capacity, tokens + (:now - updated) * :rate) >= 1
+        RETURNING tokens
+    """
+    EVICT_EVERY = 1000  # requests between idle-bucket sweeps
+
+    def __init__(self, path: str = RATE_LIMIT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_buckets_full_at ON buckets (full_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    async def acquire(self, key: str, limit: RateLimit, now: float = None):
+        # sqlite3 blocks, so run it on a worker thread
+        return await anyio.to_thread.run_sync(self.acquire_sync, key, limit, now)
+
+    def acquire_sync(self, key: str, limit: RateLimit, now: float = None):
+        now = time.time() if now is None else now
+        conn = self._connect()
+        params = {"key": key, "capacity": limit.capacity, "rate": limit.refill_rate, "now": now}
+        row = conn.execute(self.ACQUIRE_SQL, params).fetchone()
+        self._calls += 1
+        if self._calls % self.EVICT_EVERY == 0:
+            conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+        if row is not None:
+            return True, 0.0
+        tokens, updated = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_rate)
+        return False, max(0.0, (1 - tokens) / limit.refill_rate)
+
+
+class RedisBackend:
+    """Buckets in Redis (or any server speaking its protocol), updated atomically by a Lua script"""
+
+    ACQUIRE_LUA = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = capacity
+        if bucket[1] then
+            tokens = math.min(capacity, tonumber(bucket[1]) + (now - tonumber(bucket[2])) * rate)
+        end
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        -- idle buckets expire once they would be full again
+        redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, client=None):
+        if client is None:
+            # Optional dependency, only needed for this backend
+            import redis.asyncio as redis_asyncio
+            client = redis_asyncio.from_url(url)
+        self._client = client
+        self._script = client.register_script(self.ACQUIRE_LUA)
+
+    async def acquire(self, key: str, limit: RateLimit, now: float = None):
+        now = time.time() if now is None else now
+        allowed, tokens = await self._script(
+            keys=[f"ratelimit:{key}"], args=[limit.capacity, limit.refill_rate, now]
+        )
+        if allowed:
+            return True, 0.0
+        return False, max(0.0, (1 - float(tokens)) / limit.refill_rate)
+
+
+class ConcurrencyLimit:
+    """
+    At most `limit` open slots per key in this process, for long-lived requests (streams)
+    where counting connects would lock out a client that merely reconnects
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._open = {}  # key -> open slots
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> bool:
+        with self._lock:
+            if self._open.get(key, 0) >= self.limit:
+                return False
+            self._open[key] = self._open.get(key, 0) + 1
+            return True
+
+    def release(self, key: str):
+        with self._lock:
+            remaining = self._open.get(key, 0) - 1
+            if remaining > 0:
+                self._open[key] = remaining
+            else:
+                self._open.pop(key, None)
+
+
+def create_backend(name: str = RATE_LIMIT_BACKEND):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "redis":
+        return RedisBackend()
+    raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND '{name}' (use memory, sqlite or redis)")
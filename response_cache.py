@@ -0,0 +1,261 @@
+# response_cache.py
+"""
+Opt-in cache of persona replies to context-free questions.
+
+Many conversations open with near-identical questions ("best places in Goa
+in December"). For the personas listed in RESPONSE_CACHE_PERSONAS, the
+reply to a session's first message is cached and reused for later first
+messages that ask the same thing:
+
+- exact: same persona and same normalized text (case, accents, punctuation
+  and spacing ignored)
+- similar: the nearest cached question by cosine similarity of hashed
+  word/character n-gram vectors (a small in-process inverted index, no
+  external service) at or above RESPONSE_CACHE_SIMILARITY, provided both
+  questions mention the same topical words (allowing typos), so "Goa in
+  December" never answers "Goa in June"
+- greeting: first messages that is_greeting() recognizes share one cached
+  greeting per persona
+
+Later turns are never cached: their replies depend on the conversation.
+Entries expire RESPONSE_CACHE_TTL seconds after they were stored and are
+evicted least recently used beyond RESPONSE_CACHE_MAX_ENTRIES /
+RESPONSE_CACHE_MAX_BYTES. The cache is per process, like history_cache.
+"""
+import os
+import re
+import math
+import time
+import zlib
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+RESPONSE_CACHE_PERSONAS = {p for p in os.getenv("RESPONSE_CACHE_PERSONAS", "").split(",") if p}  # empty = off
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))  # seconds since stored
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.6"))
+
+VECTOR_BUCKETS = 1 << 20  # hashed feature space; collisions are rare at question length
+MAX_CANDIDATES = 200  # similar-match candidates scored per lookup
+GREETING_KEY = "<greeting>"
+ENTRY_OVERHEAD_BYTES = 400  # rough per-entry size of the vector, sets and bookkeeping
+
+# Words that carry phrasing rather than topic; questions may differ in these and still match
+FILLER_WORDS = set("""
+a an the and or but of to in on at for from with about into by as is are was were be been am
+i me my we our you your it its this that these those there here what which who whom how when where why
+can could would should will shall may might must do does did done please pls plz tell give show share
+suggest suggestions recommend recommendations some any few good best top great nice cool awesome
+list ideas idea options place places thing things want wanna need looking know let lets us ones
+visit visiting go going see during time
+""".split())
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accent-free words separated by single spaces"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"\w+", text))
+
+
+def _bucket(feature: str) -> int:
+    return zlib.crc32(feature.encode()) % VECTOR_BUCKETS
+
+
+def _trigrams(word: str) -> set:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+_FILLER_TRIGRAMS = [_trigrams(w) for w in FILLER_WORDS if len(w) >= 4]
+
+
+def topic_words(normalized: str) -> list:
+    """Words that carry the question's topic: not filler, nor a misspelt filler word"""
+    return [w for w in normalized.split()
+            if w.isdigit() or (len(w) > 1 and w not in FILLER_WORDS and not _near_filler(w))]
+
+
+def _near_filler(word: str) -> bool:
+    if len(word) < 4:
+        return False
+    grams = _trigrams(word)
+    return any(len(grams & other) / len(grams | other) >= 0.35 for other in _FILLER_TRIGRAMS)
+
+
+def embed(words: list) -> Dict[int, float]:
+    """
+    Unit-length sparse vector of hashed features of the topical words: the words, adjacent
+    pairs (at half weight) and character trigrams (so typos and plurals land close together).
+    """
+    weights = {}
+    features = [(f"w:{w}", 1.0) for w in words] + [(f"b:{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+    features += [(f"c:{t}", 0.5) for w in words for t in _trigrams(w)]
+    for feature, weight in features:
+        bucket = _bucket(feature)
+        weights[bucket] = weights.get(bucket, 0.0) + weight
+    norm = math.sqrt(sum(v * v for v in weights.values())) or 1.0
+    return {bucket: v / norm for bucket, v in weights.items()}
+
+
+def cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(bucket, 0.0) for bucket, v in a.items())
+
+
+def _same_word(a: str, b: str) -> bool:
+    """Equal, or close enough to be a typo / plural of each other"""
+    if a == b:
+        return True
+    if a.isdigit() or b.isdigit():
+        return False
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb) >= 0.5
+
+
+def same_topic(a: frozenset, b: frozenset) -> bool:
+    """Every topical word of each question has a counterpart in the other"""
+    return all(any(_same_word(x, y) for y in b) for x in a) and all(any(_same_word(y, x) for x in a) for y in b)
+
+
+class _Entry:
+    __slots__ = ("persona", "key", "vector", "topics", "reply", "stored_at", "size")
+
+    def __init__(self, persona, key, reply):
+        self.persona = persona
+        self.key = key
+        words = topic_words(key) if key != GREETING_KEY else []
+        self.vector = embed(words)
+        self.topics = frozenset(words)
+        self.reply = reply
+        self.stored_at = time.monotonic()
+        self.size = ENTRY_OVERHEAD_BYTES + len(key) + len(reply) + 24 * len(self.vector)
+
+
+class ResponseCache:
+    """Per-persona exact + approximate reply cache with TTL and LRU size bounds"""
+
+    def __init__(self, personas=RESPONSE_CACHE_PERSONAS, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.personas = set(personas)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.similarity = similarity
+        self._entries = OrderedDict()  # (persona, key) -> _Entry, least recently used first
+        self._postings = {}  # (persona, word bucket) -> set of keys, for similar-match candidates
+        self._bytes = 0
+        self.hits = {"exact": 0, "similar": 0, "greeting": 0}
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def enabled(self, persona: str) -> bool:
+        return persona in self.personas
+
+    @staticmethod
+    def cache_key(message: str, greeting: bool) -> str:
+        return GREETING_KEY if greeting else normalize(message)
+
+    def get(self, persona: str, message: str, greeting: bool = False) -> Tuple[Optional[str], Optional[str]]:
+        """(reply, "exact" | "similar" | "greeting") for a first message, or (None, None)"""
+        if not self.enabled(persona):
+            return None, None
+        key = self.cache_key(message, greeting)
+        entry = self._live((persona, key))
+        if entry is not None:
+            kind = "greeting" if greeting else "exact"
+        elif not greeting and key:
+            entry = self._nearest(persona, key)
+            kind = "similar"
+        if entry is None:
+            self.misses += 1
+            return None, None
+        self._entries.move_to_end((persona, entry.key))
+        self.hits[kind] += 1
+        return entry.reply, kind
+
+    def put(self, persona: str, message: str, reply: str, greeting: bool = False):
+        """Remember the reply to a first message"""
+        key = self.cache_key(message, greeting)
+        if not self.enabled(persona) or not key or not reply.strip():
+            return
+        self._remove((persona, key))
+        entry = _Entry(persona, key, reply)
+        self._entries[(persona, key)] = entry
+        self._bytes += entry.size
+        for word in entry.topics:
+            self._postings.setdefault((persona, _bucket(word)), set()).add(key)
+        self.stores += 1
+        self._evict()
+
+    def stats(self) -> dict:
+        lookups = sum(self.hits.values()) + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": round(sum(self.hits.values()) / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _live(self, entry_key) -> Optional[_Entry]:
+        entry = self._entries.get(entry_key)
+        if entry is not None and time.monotonic() - entry.stored_at > self.ttl:
+            self._remove(entry_key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _nearest(self, persona: str, key: str) -> Optional[_Entry]:
+        words = topic_words(key)
+        if not words:
+            return None  # nothing but filler ("tell me some good ones"): no safe match
+        # Candidates share at least one topical word; rarer words first so common ones don't flood the list
+        postings = sorted((self._postings.get((persona, _bucket(word)), ()) for word in set(words)), key=len)
+        candidates = []
+        seen = set()
+        for posting in postings:
+            for candidate in posting:
+                if candidate not in seen:
+                    seen.add(candidate)
+                    candidates.append(candidate)
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+
+        vector, topics = embed(words), frozenset(words)
+        best, best_score = None, self.similarity
+        for candidate in candidates[:MAX_CANDIDATES]:
+            entry = self._live((persona, candidate))
+            if entry is None:
+                continue
+            score = cosine(vector, entry.vector)
+            if score >= best_score and same_topic(topics, entry.topics):
+                best, best_score = entry, score
+        return best
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        persona, key = entry_key
+        for word in entry.topics:
+            posting = self._postings.get((persona, _bucket(word)))
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[(persona, _bucket(word))]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
@@ -0,0 +1,187 @@
+# responses.py
+"""
+HTTP plumbing for the read endpoints polled by the frontend.
+
+- Validators: endpoints derive a weak ETag from a version they can read
+  without touching message rows (the session row's message count and last
+  message time, or the `sessions` change counter) and answer 304 Not
+  Modified when it matches If-None-Match. Responses carry
+  `Cache-Control: no-cache`, so browsers keep the body and revalidate.
+- JSON bodies are rendered with orjson (several times faster than json for
+  large histories).
+- CompressionMiddleware compresses complete responses above
+  COMPRESS_MIN_BYTES with brotli (when the optional `brotli` package is
+  installed) or gzip; streamed responses such as SSE pass through untouched.
+"""
+import os
+import gzip
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Optional
+
+import anyio
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+from database import IST
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # 4-5 is the usual speed/size spot for dynamic bodies
+THREAD_COMPRESS_BYTES = 256 * 1024
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+def make_etag(*parts) -> str:
+    """Weak validator (compressed and identity bodies share it) from version components"""
+    return 'W/"' + "-".join(
+        str(int(part.timestamp() * 1000)) if isinstance(part, datetime) else str(part) for part in parts
+    ) + '"'
+
+
+def _validator_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        if last_modified.tzinfo is None:
+            last_modified = IST.localize(last_modified)
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """
+    304 response if the client's If-None-Match already names `etag`, else None.
+    If-Modified-Since alone is not trusted: its one-second precision would hide
+    messages written within the same second as the client's copy.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    tags = {_opaque(tag.strip()) for tag in header.split(",")}
+    if "*" in tags or _opaque(etag) in tags:
+        return Response(status_code=304, headers=_validator_headers(etag, last_modified))
+    return None
+
+
+def versioned_json(content, etag: str, last_modified: Optional[datetime] = None) -> FastJSONResponse:
+    return FastJSONResponse(content, headers=_validator_headers(etag, last_modified))
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def accepted_encodings(header: str) -> set:
+    """Codings an Accept-Encoding header allows ("gzip;q=0" refuses gzip)"""
+    accepted = set()
+    for token in header.lower().split(","):
+        coding, _, params = token.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0 and coding.strip():
+            accepted.add(coding.strip())
+    if "*" in accepted:
+        accepted.update(("gzip", "br"))
+    return accepted
+
+
+def _with_vary(headers: list) -> list:
+    """Response headers with Accept-Encoding added to Vary"""
+    vary = [value.decode("latin-1") for name, value in headers if name == b"vary"]
+    fields = [field.strip() for value in vary for field in value.split(",") if field.strip()]
+    if "accept-encoding" not in {field.lower() for field in fields}:
+        fields.append("Accept-Encoding")
+    return [(name, value) for name, value in headers if name != b"vary"] + [(b"vary", ", ".join(fields).encode())]
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing single-chunk responses (brotli if available and accepted,
+    else gzip). Multi-chunk bodies (SSE, other streams) are passed through as they are.
+    Every single-chunk response carries Vary: Accept-Encoding, compressed or not, so shared
+    caches keep identity and encoded copies apart.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = set()
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = accepted_encodings(value.decode("latin-1"))
+                break
+        encoding = "br" if brotli is not None and "br" in accept else "gzip" if "gzip" in accept else None
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message  # held back until we know the body
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = start_message["headers"]
+            already_encoded = any(name == b"content-encoding" for name, _ in headers)
+            if message.get("more_body", False) or already_encoded:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            if encoding is None or len(body) < self.minimum_size:
+                start_message["headers"] = _with_vary(headers)
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) >= THREAD_COMPRESS_BYTES:
+                # Large bodies take milliseconds to compress; keep the event loop free meanwhile
+                compressed = await anyio.to_thread.run_sync(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            start_message["headers"] = _with_vary([
+                (name, value) for name, value in headers if name != b"content-length"
+            ] + [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+            ])
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
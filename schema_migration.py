@@ -0,0 +1,222 @@
+# schema_migration.py
+"""
+Online migration from the original schema to chat_sessions / chat_messages.
+
+The original schema keeps one `messages` table keyed by the session UUID
+string, with titles and rolling summaries stored as `[title]` and
+`[summary:N]` system rows (plus the derived `sessions` table). The copy runs
+in small id-ordered batches, each in its own short transaction, and records
+how far it got, so it can run against the live database while the previous
+release keeps serving:
+
+    python schema_migration.py [--batch 5000]    # repeatable and resumable
+
+The new release finishes the job when it starts (migrate_if_needed): it copies
+the tail written since the last run, applies the deletes and renames the old
+code made in the meantime, recomputes the session counters and renames
+`messages` to `messages_legacy` (drop it once you are happy).
+"""
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, inspect, select, update, delete, text, table, column, bindparam
+from sqlalchemy.orm import Session
+
+from database import (
+    Base, ChatMessage, ChatSession, SessionLocal, engine, PERSONA_CODES, ROLE_CODES, SHARD_COUNT, backfill_sessions,
+)
+
+LEGACY_TABLE = "messages"
+LEGACY_RENAMED = "messages_legacy"
+MIGRATION_NAME = "normalize-messages"
+MIGRATION_BATCH = 5000
+
+legacy_messages = table(
+    LEGACY_TABLE, column("id"), column("session_id"), column("role"), column("content"),
+    column("timestamp"), column("persona"),
+)
+
+# The original messages table, for reference and for seeding benchmarks
+LEGACY_MESSAGES_DDL = [
+    """CREATE TABLE messages (
+        id INTEGER NOT NULL PRIMARY KEY,
+        session_id VARCHAR NOT NULL,
+        role VARCHAR NOT NULL,
+        content VARCHAR NOT NULL,
+        timestamp DATETIME NOT NULL,
+        persona VARCHAR
+    )""",
+    "CREATE INDEX ix_messages_id ON messages (id)",
+    "CREATE INDEX ix_messages_session_id ON messages (session_id)",
+    "CREATE INDEX ix_messages_session_timestamp ON messages (session_id, timestamp)",
+]
+
+
+class MigrationState(Base):
+    """Progress of a resumable data migration (last legacy id copied)"""
+    __tablename__ = "schema_migrations"
+
+    name = Column(String, primary_key=True)
+    position = Column(Integer, nullable=False, default=0)
+
+
+def legacy_pending() -> bool:
+    return inspect(engine).has_table(LEGACY_TABLE)
+
+
+def _position(db: Session) -> int:
+    state = db.get(MigrationState, MIGRATION_NAME)
+    return state.position if state else 0
+
+
+def _parse_timestamp(value):
+    # SQLite hands the old DateTime column back as text
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _session_keys(db: Session, session_ids) -> dict:
+    """session_id -> key for the given sessions, creating rows for new ones"""
+    session_ids = list(session_ids)
+    keys = dict(db.execute(
+        select(ChatSession.session_id, ChatSession.key).where(ChatSession.session_id.in_(session_ids))
+    ).all())
+    missing = [sid for sid in session_ids if sid not in keys]
+    if missing:
+        db.execute(ChatSession.__table__.insert(), [
+            {"session_id": sid, "snippet": "", "message_count": 0, "user_message_count": 0, "summary_count": 0}
+            for sid in missing
+        ])
+        keys.update(db.execute(
+            select(ChatSession.session_id, ChatSession.key).where(ChatSession.session_id.in_(missing))
+        ).all())
+    return keys
+
+
+def _apply_system_rows(db: Session, rows):
+    """Move `[title]` / `[summary:N]` pseudo-messages onto their session rows (later rows win)"""
+    titles, summaries = {}, {}
+    for session_id, content in rows:
+        if content.startswith("[title]"):
+            titles[session_id] = content[len("[title]"):].strip()
+        elif content.startswith("[summary:"):
+            count, _, summary = content[len("[summary:"):].partition("]")
+            summaries[session_id] = (summary, int(count))
+    sessions = ChatSession.__table__
+    if titles:
+        db.execute(
+            update(sessions).where(sessions.c.session_id == bindparam("sid")).values(title=bindparam("new_title")),
+            [{"sid": sid, "new_title": title} for sid, title in titles.items()],
+        )
+    if summaries:
+        db.execute(
+            update(sessions).where(sessions.c.session_id == bindparam("sid"))
+            .values(summary=bindparam("new_summary"), summary_count=bindparam("new_count")),
+            [{"sid": sid, "new_summary": summary, "new_count": count} for sid, (summary, count) in summaries.items()],
+        )
+
+
+def copy_batch(db: Session, batch: int = MIGRATION_BATCH) -> int:
+    """Copy the next `batch` legacy rows in one transaction; returns how many were read"""
+    position = _position(db)
+    rows = db.execute(
+        select(legacy_messages).where(legacy_messages.c.id > position).order_by(legacy_messages.c.id).limit(batch)
+    ).all()
+    if not rows:
+        return 0
+
+    keys = _session_keys(db, {row.session_id for row in rows})
+    messages = [
+        {
+            "id": row.id,
+            "session_key": keys[row.session_id],
+            "role": row.role,
+            "content": row.content,
+            "timestamp": _parse_timestamp(row.timestamp),
+            "persona": row.persona if row.persona in PERSONA_CODES else None,
+        }
+        for row in rows if row.role in ROLE_CODES
+    ]
+    if messages:
+        db.execute(ChatMessage.__table__.insert(), messages)
+    _apply_system_rows(db, [(row.session_id, row.content) for row in rows if row.role == "system"])
+
+    db.merge(MigrationState(name=MIGRATION_NAME, position=rows[-1].id))
+    db.commit()
+    return len(rows)
+
+
+def copy_all(batch: int = MIGRATION_BATCH, pause: float = 0.0, verbose: bool = False) -> int:
+    """Copy batches until caught up with the legacy table; returns rows read"""
+    MigrationState.__table__.create(engine, checkfirst=True)
+    total = 0
+    while True:
+        with SessionLocal() as db:
+            copied = copy_batch(db, batch)
+        total += copied
+        if verbose and copied:
+            print(f"  copied {total} rows")
+        if copied < batch:
+            return total
+        if pause:
+            time.sleep(pause)  # leave the database to live traffic between batches
+
+
+def finalize(db: Session):
+    """
+    Reconcile changes the old release made to rows already copied, recompute the
+    session counters and retire the legacy tables. Run once nothing writes the old schema.
+    """
+    position = _position(db)
+    # Messages cleared or deleted since they were copied
+    db.execute(delete(ChatMessage).where(
+        ChatMessage.id <= position,
+        ChatMessage.id.not_in(select(legacy_messages.c.id))
+    ))
+    db.execute(delete(ChatSession).where(
+        ChatSession.session_id.not_in(select(legacy_messages.c.session_id))
+    ))
+    # Titles and summaries are updated in place, so re-apply the current ones
+    _apply_system_rows(db, db.execute(
+        select(legacy_messages.c.session_id, legacy_messages.c.content)
+        .where(legacy_messages.c.role == "system").order_by(legacy_messages.c.id)
+    ).all())
+    db.commit()
+    backfill_sessions(db)
+
+    if engine.dialect.name == "postgresql":
+        # Ids were copied explicitly, so move the sequence past them
+        db.execute(text("SELECT setval(pg_get_serial_sequence('chat_messages', 'id'), "
+                        "COALESCE((SELECT MAX(id) FROM chat_messages), 1))"))
+    db.execute(text(f"ALTER TABLE {LEGACY_TABLE} RENAME TO {LEGACY_RENAMED}"))
+    db.execute(text("DROP TABLE IF EXISTS sessions"))  # derived summary table of the old schema
+    db.execute(delete(MigrationState).where(MigrationState.name == MIGRATION_NAME))
+    db.commit()
+
+
+def migrate_if_needed():
+    """Finish (or run) the migration on startup when a legacy messages table is present"""
+    if not legacy_pending():
+        return
+    if SHARD_COUNT > 1:
+        # The legacy rows all land in shard 0, not where the ring places their sessions
+        raise RuntimeError("Migrate with SHARD_COUNT=1, then spread the sessions with shard_rebalance.py")
+    started = time.perf_counter()
+    copied = copy_all()
+    with SessionLocal() as db:
+        finalize(db)
+    print(f"Migrated to the normalized schema ({copied} legacy rows copied on startup, "
+          f"{time.perf_counter() - started:.1f}s); old rows kept in {LEGACY_RENAMED}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy legacy messages into the normalized schema")
+    parser.add_argument("--batch", type=int, default=MIGRATION_BATCH, help="rows per transaction")
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds between batches")
+    args = parser.parse_args()
+    if not legacy_pending():
+        print("Nothing to migrate")
+        sys.exit(0)
+    print(f"Copied {copy_all(args.batch, args.pause, verbose=True)} rows; "
+          "start the new release to finish the migration")
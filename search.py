@@ -0,0 +1,244 @@
+# search.py
+"""
+Full-text search over chat messages with SQLite FTS5.
+
+`chat_messages_fts` is a contentless FTS5 index (the text is not stored
+twice) kept in sync by insert/update/delete triggers. Besides the message
+text it indexes a `scope` column of tokens for the message's session,
+persona and role ("s42 p1 r2"), so filters are intersected inside FTS5
+instead of joining every match back to chat_messages.
+
+Only the page of matching ids comes out of the index; result fields are
+then loaded by primary key and snippets cut from the message text in
+Python (FTS5's snippet() re-reads every match of the query). bm25 ranking
+covers the newest SEARCH_RANK_WINDOW matches, which bounds the scoring and
+sorting for common words; rarer words are ranked over all their matches.
+
+With sharded storage every shard has its own index; a search over all
+sessions asks each shard for its first offset + limit matches and merges
+them by score (or time). bm25 weighs words by their frequency in each
+shard, which evens out once shards hold more than a few thousand messages.
+"""
+import os
+import re
+import html
+import time
+import unicodedata
+from typing import List, Optional
+
+from sqlalchemy import text, inspect, select
+from sqlalchemy.orm import Session
+
+from database import engine, shards, ChatMessage, ChatSession, PERSONA_CODES, ROLE_CODES
+
+FTS_TABLE = "chat_messages_fts"
+SNIPPET_TOKENS = 12  # words of context around the first match
+MAX_QUERY_TERMS = 16
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "5000"))  # newest matches considered by sort=rank
+SEARCH_MERGE_PAGES = 500  # index pages per merge step after bulk deletes
+
+SEARCH_SUPPORTED = engine.dialect.name == "sqlite"
+
+_SCOPE_SQL = "'s' || {row}.session_key || ' p' || coalesce({row}.persona, 0) || ' r' || {row}.role"
+
+_SETUP_SQL = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        content, scope, content='', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, content, scope) VALUES (new.id, new.content, {_SCOPE_SQL.format(row="new")});
+    END""",
+    # A contentless index deletes by re-tokenizing the original values
+    f"""CREATE TRIGGER chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, content, scope)
+        VALUES ('delete', old.id, old.content, {_SCOPE_SQL.format(row="old")});
+    END""",
+    f"""CREATE TRIGGER chat_messages_fts_update AFTER UPDATE OF content, session_key, persona, role ON chat_messages BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, content, scope)
+        VALUES ('delete', old.id, old.content, {_SCOPE_SQL.format(row="old")});
+        INSERT INTO {FTS_TABLE} (rowid, content, scope) VALUES (new.id, new.content, {_SCOPE_SQL.format(row="new")});
+    END""",
+    f"""INSERT INTO {FTS_TABLE} (rowid, content, scope)
+        SELECT id, content, {_SCOPE_SQL.format(row="chat_messages")} FROM chat_messages""",
+]
+
+# Newest matches first; FTS5 walks its doclists in rowid order and stops at the limit
+_RECENT_SQL = f"""
+    SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match
+    ORDER BY rowid DESC LIMIT :limit OFFSET :offset
+"""
+# bm25 over the newest :window matches (the scope column carries no relevance)
+_RANK_SQL = f"""
+    SELECT rowid, score FROM (
+        SELECT rowid, bm25({FTS_TABLE}, 1.0, 0.0) AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match
+        ORDER BY rowid DESC LIMIT :window
+    ) ORDER BY score, rowid DESC LIMIT :limit OFFSET :offset
+"""
+
+
+def ensure_search_index(engine=engine):
+    """Create the FTS index and its triggers if missing, indexing existing messages once"""
+    if not SEARCH_SUPPORTED or inspect(engine).has_table(FTS_TABLE):
+        return
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for statement in _SETUP_SQL:
+            conn.exec_driver_sql(statement)
+    print(f"Built the search index in {time.perf_counter() - started:.1f}s")
+
+
+def merge_search_index(pages: int = SEARCH_MERGE_PAGES, engine=engine) -> int:
+    """
+    Merge the index's segments in steps of about `pages` pages, each in its own transaction,
+    until there is nothing left to merge. A contentless index records deletes as extra
+    entries that searches wade through until merged, which matters after bulk deletes
+    (archive.py). Returns the number of steps.
+    """
+    if not SEARCH_SUPPORTED:
+        return 0
+    steps = 0
+    while True:
+        with engine.begin() as conn:
+            before = conn.exec_driver_sql("SELECT total_changes()").scalar()
+            # A negative page count merges segments of any level (an incremental 'optimize')
+            conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('merge', {-pages})")
+            done = conn.exec_driver_sql("SELECT total_changes()").scalar() - before <= 1
+        steps += 1
+        if done:
+            return steps
+
+
+def _fold(word: str) -> str:
+    """Case- and accent-insensitive form, as the unicode61 tokenizer sees it"""
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c)).casefold()
+
+
+def query_terms(query: str) -> List[str]:
+    """Words of a query; a trailing * (e.g. "itiner*") makes a word match as a prefix"""
+    return re.findall(r"\w+\*?", query)[:MAX_QUERY_TERMS]
+
+
+def build_match_query(query: str, scope: List[str] = ()) -> Optional[str]:
+    """
+    Turn free text into a safe FTS5 query: every word must match the message text and
+    every `scope` token the scope column. Returns None if there is nothing to search for.
+    Prefixes are opt-in: FTS5 merges every indexed word sharing a prefix into one list,
+    which costs as much as the matches are common.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return None
+    quoted = [f'"{term[:-1]}"*' if term.endswith("*") else f'"{term}"' for term in terms]
+    match = f"content: ({' '.join(quoted)})"
+    if scope:
+        match += f" AND scope: ({' '.join(scope)})"
+    return match
+
+
+def make_snippet(content: str, terms: List[str], size: int = SNIPPET_TOKENS) -> str:
+    """HTML-escaped excerpt of `content` around the first match, matches wrapped in <mark>"""
+    whole = {_fold(term) for term in terms if not term.endswith("*")}
+    prefixes = tuple(_fold(term[:-1]) for term in terms if term.endswith("*"))
+
+    def matches(token):
+        folded = _fold(token)
+        return folded in whole or bool(prefixes) and folded.startswith(prefixes)
+
+    tokens = list(re.finditer(r"\w+", content))
+    first = next((i for i, token in enumerate(tokens) if matches(token.group())), 0)
+    start = max(0, min(first - size // 4, len(tokens) - size))
+    window = tokens[start:start + size]
+    if not window:
+        return html.escape(content)
+
+    parts = ["…" if start > 0 else html.escape(content[:window[0].start()])]
+    position = window[0].start()
+    for token in window:
+        parts.append(html.escape(content[position:token.start()]))
+        word = html.escape(token.group())
+        parts.append(f"<mark>{word}</mark>" if matches(token.group()) else word)
+        position = token.end()
+    tail = content[position:]
+    parts.append("…" if start + size < len(tokens) else html.escape(tail))
+    return "".join(parts)
+
+
+def search_messages(db: Session, query: str, session_id: str = None, persona: str = None, role: str = None,
+                    sort: str = "rank", limit: int = 20, offset: int = 0):
+    """
+    Matches for `query`, optionally within one session / persona / role, best first
+    (sort="rank") or newest first (sort="recent"). Returns (results, has_more).
+    """
+    keyed, has_more = _search(db, query, session_id, persona, role, sort, limit, offset)
+    return [result for _, result in keyed], has_more
+
+
+def search_all_shards(query: str, persona: str = None, role: str = None, sort: str = "rank",
+                      limit: int = 20, offset: int = 0):
+    """search_messages over the sessions of every shard"""
+    if len(shards) == 1:
+        with shards[0].ReadSessionLocal() as db:
+            return search_messages(db, query, persona=persona, role=role, sort=sort, limit=limit, offset=offset)
+    found, has_more = [], False
+    for shard in shards:
+        with shard.ReadSessionLocal() as db:
+            keyed, more = _search(db, query, None, persona, role, sort, offset + limit, 0)
+        found += keyed
+        has_more = has_more or more
+    found.sort(key=lambda item: item[0])
+    has_more = has_more or len(found) > offset + limit
+    return [result for _, result in found[offset:offset + limit]], has_more
+
+
+def _search(db: Session, query: str, session_id, persona, role, sort, limit, offset):
+    """(results with their sort keys, has_more) of one database"""
+    scope = []
+    if session_id is not None:
+        key = db.scalar(select(ChatSession.key).where(ChatSession.session_id == session_id))
+        if key is None:
+            return [], False
+        scope.append(f"s{key}")
+    if persona is not None:
+        scope.append(f"p{PERSONA_CODES[persona]}")
+    if role is not None:
+        scope.append(f"r{ROLE_CODES[role]}")
+    match = build_match_query(query, scope)
+    if match is None:
+        return [], False
+
+    # One extra row to know whether another page exists
+    params = {"match": match, "limit": limit + 1, "offset": offset, "window": SEARCH_RANK_WINDOW}
+    hits = db.execute(text(_RANK_SQL if sort == "rank" else _RECENT_SQL), params).all()
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    if not hits:
+        return [], False
+    ids = [hit[0] for hit in hits]
+
+    rows = {
+        row.ChatMessage.id: row
+        for row in db.execute(
+            select(ChatMessage, ChatSession.session_id, ChatSession.title, ChatSession.fallback_title)
+            .join(ChatSession, ChatSession.key == ChatMessage.session_key)
+            .where(ChatMessage.id.in_(ids))
+        )
+    }
+    terms = query_terms(query)
+    results = []
+    for hit in hits:
+        row = rows.get(hit[0])
+        if row is None:  # deleted between the two queries
+            continue
+        message = row.ChatMessage
+        # Merge key across shards: best score, then newest (ids are only ordered within a shard)
+        newest = -message.timestamp.timestamp()
+        results.append(((hit.score, newest) if sort == "rank" else (newest,), {
+            "message_id": message.id,
+            "session_id": row.session_id,
+            "session_title": row.title or row.fallback_title or "New Chat",
+            "role": message.role,
+            "persona": message.persona,
+            "timestamp": message.timestamp.isoformat(),
+            "snippet": make_snippet(message.content, terms),
+        }))
+    return results, has_more
@@ -0,0 +1,172 @@
+# session_events.py
+"""
+Live session-list updates.
+
+Endpoints (and the title worker) publish a small event whenever a session
+changes, instead of clients re-fetching the whole list on a timer:
+
+    {"type": "created" | "message" | "renamed" | "titled" | "deleted",
+     "session_id": "...", "session": {changed fields of the /api/sessions row}}
+
+Field values are absolute (message_count, title, ...), so applying an event
+twice is harmless. Each process fans events out to its own subscribers (the
+/api/sessions/events streams); the broker carries them between processes.
+
+Brokers (SESSION_EVENTS_BACKEND):
+  memory - in-process only (default); with several workers, or TITLE_WORKER=external,
+           clients only see changes made by the worker they are connected to
+  redis  - Redis pub/sub channel (SESSION_EVENTS_REDIS_URL), shared by every worker
+           and the title worker
+"""
+import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+SESSION_EVENTS_BACKEND = os.getenv("SESSION_EVENTS_BACKEND", "memory")
+SESSION_EVENTS_REDIS_URL = os.getenv("SESSION_EVENTS_REDIS_URL", "redis://localhost:6379/0")
+SESSION_EVENTS_CHANNEL = os.getenv("SESSION_EVENTS_CHANNEL", "chat:session-events")
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SESSION_EVENTS_QUEUE_SIZE", "256"))  # events buffered per client
+
+
+class MemoryBroker:
+    """Delivers straight to this process's subscribers"""
+
+    def __init__(self):
+        self._deliver = None
+
+    async def start(self, deliver: Callable[[str], None]):
+        self._deliver = deliver
+
+    async def publish(self, data: str):
+        if self._deliver is not None:
+            self._deliver(data)
+
+    async def close(self):
+        self._deliver = None
+
+
+class RedisBroker:
+    """Publishes to a Redis channel; one listener per process hands messages to local subscribers"""
+
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, url: str = SESSION_EVENTS_REDIS_URL, channel: str = SESSION_EVENTS_CHANNEL, client=None):
+        if client is None:
+            # Optional dependency, only needed for this backend
+            import redis.asyncio as redis_asyncio
+            client = redis_asyncio.from_url(url)
+        self._client = client
+        self.channel = channel
+        self._task = None
+
+    async def start(self, deliver: Callable[[str], None]):
+        self._task = asyncio.create_task(self._listen(deliver))
+
+    async def _listen(self, deliver):
+        while True:
+            pubsub = self._client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        data = message["data"]
+                        deliver(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Events published while disconnected are lost; clients resync when they reconnect
+                print(f"Session events listener lost Redis ({e}); reconnecting")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+            finally:
+                await pubsub.aclose()
+
+    async def publish(self, data: str):
+        await self._client.publish(self.channel, data)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def create_broker(name: str = SESSION_EVENTS_BACKEND):
+    if name == "memory":
+        return MemoryBroker()
+    if name == "redis":
+        return RedisBroker()
+    raise RuntimeError(f"Unknown SESSION_EVENTS_BACKEND '{name}' (use memory or redis)")
+
+
+class Subscription:
+    """One client's queue of serialized events; None means it fell behind and must resync"""
+
+    def __init__(self, size: int = SUBSCRIBER_QUEUE_SIZE):
+        self._queue = asyncio.Queue(maxsize=size)
+
+    def push(self, data: Optional[str]) -> bool:
+        try:
+            self._queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            # Too far behind: drop the backlog rather than buffer without bound
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+            return False
+
+    async def get(self) -> Optional[str]:
+        return await self._queue.get()
+
+
+class SessionEvents:
+    """Publish session changes and fan them out to this process's subscribers"""
+
+    def __init__(self, broker=None):
+        self.broker = broker or create_broker()
+        self._subscribers = set()
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    async def start(self):
+        """Start receiving (needed only in processes that serve subscribers)"""
+        await self.broker.start(self._deliver)
+
+    async def close(self):
+        await self.broker.close()
+
+    async def publish(self, type: str, session_id: str, **fields):
+        """Best effort: a lost event only leaves clients stale until their next snapshot"""
+        event = {"type": type, "session_id": session_id, "session": fields}
+        try:
+            await self.broker.publish(json.dumps(event))
+            self.published += 1
+        except Exception as e:
+            print(f"ERROR publishing session event {type} for {session_id}: {e}")
+
+    def _deliver(self, data: str):
+        for subscription in list(self._subscribers):
+            if not subscription.push(data):
+                self._subscribers.discard(subscription)
+                self.dropped_subscribers += 1
+
+    @asynccontextmanager
+    async def subscribe(self):
+        subscription = Subscription()
+        self._subscribers.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+session_events = SessionEvents()
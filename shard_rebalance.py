@@ -0,0 +1,179 @@
+# shard_rebalance.py
+"""
+Move sessions between shard databases after changing the shard count.
+
+Sessions are placed by consistent hashing (hash_ring.py), so growing from N
+to N + 1 shards only moves the sessions the new shard takes over, and
+shrinking drains the removed shards into the rest. Run it with the API
+stopped, then start the API with the new SHARD_COUNT (or SHARD_URLS):
+
+    python shard_rebalance.py --from 2 --to 4 --dry-run
+    python shard_rebalance.py --from 2 --to 4 [--batch 100]
+
+Each batch copies the sessions (row, messages, pending title job) to their
+new shard in one transaction per target, replacing any copy left there by
+an interrupted run, and only then deletes them from the source; re-running
+after a crash picks up where it stopped. Moved messages get new ids on the
+target (message ids are per shard), so clients holding history cursors of a
+moved session reload it. Archived sessions move as their stub row; their
+blob is keyed by session id and stays where it is (archive.py).
+"""
+import os
+import sys
+import time
+import argparse
+from typing import Dict, List
+
+from sqlalchemy import select, column, table
+
+import database
+from database import (
+    DATABASE_URL, IS_SQLITE, ChatSession, TitleJob, Shard, create_schema, shard_url, forget_session,
+    bump_sessions_version,
+)
+from hash_ring import HashRing
+from search import ensure_search_index, merge_search_index
+
+REBALANCE_BATCH = 100  # sessions per copy/delete transaction
+
+# Stored column values (codes, epoch-ms timestamps), copied without the ORM conversions
+raw_sessions = table("chat_sessions", *(column(c.name) for c in ChatSession.__table__.columns))
+raw_messages = table(
+    "chat_messages", column("id"), column("session_key"), column("role"), column("content"),
+    column("timestamp"), column("persona"),
+)
+raw_title_jobs = table("title_jobs", *(column(c.name) for c in TitleJob.__table__.columns))
+SESSION_COPY_COLUMNS = [c for c in raw_sessions.columns if c.name != "key"]
+MESSAGE_COPY_COLUMNS = [raw_messages.c.role, raw_messages.c.content, raw_messages.c.timestamp, raw_messages.c.persona]
+
+
+def open_shards(count: int) -> List[Shard]:
+    """Shards 0..count-1, reusing the app's engines where it has them"""
+    if os.getenv("SHARD_URLS"):
+        if len(database.SHARD_URLS) < count:
+            sys.exit(f"SHARD_URLS lists {len(database.SHARD_URLS)} shards; list all {count}")
+        urls = database.SHARD_URLS[:count]
+    elif IS_SQLITE:
+        urls = [shard_url(DATABASE_URL, i) for i in range(count)]
+    else:
+        sys.exit("Set SHARD_URLS to the database URL of every shard")
+    known = {shard.url: shard for shard in database.shards}
+    result = []
+    for i, url in enumerate(urls):
+        shard = known.get(url)
+        if shard is None:
+            shard = Shard(i, url)
+            create_schema(shard)
+            ensure_search_index(shard.engine)
+        result.append(shard)
+    return result
+
+
+def _copy(target: Shard, sessions: list, messages: Dict[int, list], jobs: Dict[str, list]):
+    """Insert sessions with their messages and title jobs on `target`, replacing existing copies"""
+    with target.SessionLocal() as db:
+        for session in sessions:
+            session_id = session.session_id
+            forget_session(db, session_id)  # also drops its title jobs
+            key = db.execute(
+                raw_sessions.insert().values({c.name: getattr(session, c.name) for c in SESSION_COPY_COLUMNS})
+                .returning(raw_sessions.c.key)
+            ).scalar()
+            # New ids and the target's session key: both are per shard
+            rows = [dict(row._mapping, session_key=key) for row in messages.get(session.key, [])]
+            if rows:
+                db.execute(raw_messages.insert(), rows)
+            for job in jobs.get(session_id, []):
+                db.execute(raw_title_jobs.insert().values(dict(job._mapping)))
+        db.execute(bump_sessions_version())
+        db.commit()
+
+
+def move_batch(source: Shard, sessions: list, targets: Dict[str, Shard]) -> int:
+    """Move `sessions` (raw rows of `source`) to their targets; returns the number of messages moved"""
+    keys = [session.key for session in sessions]
+    session_ids = [session.session_id for session in sessions]
+    messages = {key: [] for key in keys}
+    with source.SessionLocal() as db:
+        for row in db.execute(
+            select(raw_messages.c.session_key, *MESSAGE_COPY_COLUMNS)
+            .where(raw_messages.c.session_key.in_(keys)).order_by(raw_messages.c.id)
+        ):
+            messages[row.session_key].append(row)
+        jobs = {}
+        for job in db.execute(select(raw_title_jobs).where(raw_title_jobs.c.session_id.in_(session_ids))):
+            jobs.setdefault(job.session_id, []).append(job)
+
+    by_target = {}
+    for session in sessions:
+        by_target.setdefault(targets[session.session_id], []).append(session)
+    for target, moving in by_target.items():
+        _copy(target, moving, messages, jobs)
+
+    # Copies are committed: only now leave the source
+    with source.SessionLocal() as db:
+        for session_id in session_ids:
+            forget_session(db, session_id)
+        db.commit()
+    return sum(len(rows) for rows in messages.values())
+
+
+def rebalance(old_count: int, new_count: int, batch: int = REBALANCE_BATCH, dry_run: bool = False) -> dict:
+    """Move every session of shards 0..old_count-1 that new_count shards place elsewhere"""
+    shards = open_shards(max(old_count, new_count))
+    ring = HashRing(new_count)
+    totals = {"checked": 0, "sessions": 0, "messages": 0}
+    moves = {}  # (from, to) -> sessions
+    for source in shards[:old_count]:
+        moved_from = 0
+        after_key = 0
+        while True:
+            with source.SessionLocal() as db:
+                page = db.execute(
+                    select(*raw_sessions.columns).where(raw_sessions.c.key > after_key)
+                    .order_by(raw_sessions.c.key).limit(batch)
+                ).all()
+            if not page:
+                break
+            after_key = page[-1].key
+            totals["checked"] += len(page)
+            targets = {}
+            for session in page:
+                owner = ring.shard_of(session.session_id)
+                if owner != source.index:
+                    targets[session.session_id] = shards[owner]
+                    moves[(source.index, owner)] = moves.get((source.index, owner), 0) + 1
+            moving = [session for session in page if session.session_id in targets]
+            if moving and not dry_run:
+                totals["messages"] += move_batch(source, moving, targets)
+            totals["sessions"] += len(moving)
+            moved_from += len(moving)
+        if moved_from and not dry_run:
+            merge_search_index(engine=source.engine)  # drop the moved messages' entries from the search index
+    totals["moves"] = {f"{a}->{b}": n for (a, b), n in sorted(moves.items())}
+    return totals
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="old_count", type=int, required=True, help="shard count the data is laid out for")
+    parser.add_argument("--to", dest="new_count", type=int, required=True, help="new shard count")
+    parser.add_argument("--batch", type=int, default=REBALANCE_BATCH, help="sessions per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="only count the sessions that would move")
+    args = parser.parse_args()
+    if args.old_count < 1 or args.new_count < 1:
+        sys.exit("Shard counts start at 1")
+
+    start = time.perf_counter()
+    totals = rebalance(args.old_count, args.new_count, args.batch, args.dry_run)
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"{verb} {totals['sessions']} of {totals['checked']} sessions ({totals['messages']} messages) "
+          f"in {time.perf_counter() - start:.1f}s: {totals['moves']}")
+    if not args.dry_run:
+        print(f"Start the API with SHARD_COUNT={args.new_count}")
+        if args.new_count < args.old_count:
+            print(f"Shards {args.new_count}..{args.old_count - 1} are now empty and can be removed")
+
+
+if __name__ == "__main__":
+    main_cli()
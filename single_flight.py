@@ -0,0 +1,165 @@
+# single_flight.py
+"""
+Duplicate suppression and per-session ordering for chat turns.
+
+Double-clicks and client retries send the same message again while the first
+Gemini call is still running. Each chat request claims a key (the client's
+Idempotency-Key, or the session + persona + message text); a claim that finds
+the key in flight waits for that turn and shares its result (or its failure:
+the leader has saved the user message by then, so running the turn again
+would store it twice), and one that finds a recently finished turn replays
+it. Nothing is saved or sent upstream twice. Results are replayed for
+IDEMPOTENCY_TTL seconds when the client sent a key, but only
+CHAT_DUPLICATE_WINDOW seconds for content keys, so sending "yes" again a
+minute later is a new message.
+
+SessionLocks runs the turns of one session one at a time, in arrival order,
+so a second message waits for the first reply instead of racing its history
+query and interleaving the saved rows.
+
+Both are per process: duplicates that land on different workers are not
+coalesced.
+"""
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "3600"))  # replay window for client-supplied keys
+CHAT_DUPLICATE_WINDOW = float(os.getenv("CHAT_DUPLICATE_WINDOW", "15"))  # replay window for identical messages
+SINGLE_FLIGHT_MAX_RESULTS = int(os.getenv("SINGLE_FLIGHT_MAX_RESULTS", "10000"))
+
+
+def chat_key(session_id: str, persona: str, message: str, idempotency_key: Optional[str] = None):
+    """(key, replay ttl) for a chat request"""
+    if idempotency_key:
+        return f"key:{session_id}:{idempotency_key}", IDEMPOTENCY_TTL
+    digest = hashlib.sha256(f"{persona}\0{message}".encode()).hexdigest()
+    return f"msg:{session_id}:{digest}", CHAT_DUPLICATE_WINDOW
+
+
+class FlightFailed(Exception):
+    """The leading request ended without a result or an error of its own (e.g. it was cancelled)"""
+
+
+class Flight:
+    """
+    One claim on a key: `result` is set for followers/replays; the leader sets it when done,
+    or sets `error` when it handles a failure itself, so waiting duplicates get that error
+    """
+
+    __slots__ = ("result", "shared", "error")
+
+    def __init__(self, result=None, shared: Optional[str] = None):
+        self.result = result
+        self.shared = shared  # None (leader), "coalesced" or "replayed"
+        self.error = None
+
+
+class SingleFlight:
+    """At most one turn per key in flight; recent results are replayed"""
+
+    def __init__(self, max_results: int = SINGLE_FLIGHT_MAX_RESULTS):
+        self.max_results = max_results
+        self._inflight = {}  # key -> future resolved with the leader's result, or its failure
+        self._results = OrderedDict()  # key -> (expires_at, result), oldest first
+        self.leaders = 0
+        self.coalesced = 0
+        self.replayed = 0
+
+    @asynccontextmanager
+    async def claim(self, key: str, ttl: float):
+        """
+        Yields a Flight. With `flight.result` already set, the work was done by another request;
+        otherwise this request leads: it does the work and stores the outcome in `flight.result`.
+        If the leader fails (no result), its waiting duplicates raise its error (FlightFailed if
+        it left none) instead of yielding.
+        """
+        result = self._recent(key)
+        if result is not None:
+            self.replayed += 1
+            yield Flight(result, "replayed")
+            return
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1  # counted whether the leader succeeds or fails
+            result = await asyncio.shield(future)
+            yield Flight(result, "coalesced")
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.leaders += 1
+        flight = Flight()
+        try:
+            yield flight
+        except Exception as e:
+            flight.error = flight.error or e
+            raise
+        finally:
+            del self._inflight[key]
+            if flight.result is not None:
+                self._store(key, ttl, flight.result)
+                future.set_result(flight.result)
+            else:
+                future.set_exception(flight.error or FlightFailed(key))
+                future.exception()  # mark it retrieved: no "never retrieved" warning when nobody waited
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "results": len(self._results),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+        }
+
+    def _recent(self, key: str):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._results[key]
+            return None
+        return entry[1]
+
+    def _store(self, key: str, ttl: float, result):
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        self._results.pop(key, None)
+        self._results[key] = (now + ttl, result)
+        # Drop expired entries from the old end, then enforce the size cap
+        while self._results:
+            oldest_key, (expires_at, _) = next(iter(self._results.items()))
+            if expires_at >= now and len(self._results) <= self.max_results:
+                break
+            del self._results[oldest_key]
+
+
+class SessionLocks:
+    """FIFO lock per session_id, dropped when no request holds or waits for it"""
+
+    def __init__(self):
+        self._locks = {}  # session_id -> [asyncio.Lock, holders + waiters]
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    @property
+    def active(self) -> int:
+        return len(self._locks)
@@ -0,0 +1,48 @@
+# tests/conftest.py
+"""
+Tests run the app modules against the local fake LLM (LLM_BACKEND=fake) and
+databases in a throwaway directory, so they never touch chat_history.db or
+the Gemini quota. Settings are read at import time, hence set here first.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_DATA_DIR = tempfile.mkdtemp(prefix="chatbot-tests-")
+os.environ.update(
+    LLM_BACKEND="fake",
+    TITLE_WORKER="external",
+    DATABASE_URL=f"sqlite:///{os.path.join(_DATA_DIR, 'chat_history.db')}",
+    ARCHIVE_DATABASE_URL=f"sqlite:///{os.path.join(_DATA_DIR, 'chat_archive.db')}",
+    RATE_LIMIT_REQUESTS=str(10 ** 9),
+    SESSION_RATE_LIMIT_REQUESTS=str(10 ** 9),
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """fake_llm with instant replies and no injected failures; tests turn knobs on with monkeypatch"""
+    import fake_llm
+    for name, value in {
+        "FAKE_LLM_LATENCY": 0.0,
+        "FAKE_LLM_TOKENS_PER_SEC": 1e9,
+        "FAKE_LLM_PREFILL_TOKENS_PER_SEC": 0.0,
+        "FAKE_LLM_CAPACITY": 0,
+        "FAKE_LLM_THROTTLE_RATE": 0.0,
+        "FAKE_LLM_ERROR_RATE": 0.0,
+        "FAKE_LLM_STALL_RATE": 0.0,
+    }.items():
+        monkeypatch.setattr(fake_llm, name, value)
+    monkeypatch.setattr(fake_llm._Load, "active", 0)
+    monkeypatch.setattr(fake_llm._Load, "throttled", 0)
+    return fake_llm
+
+
+@pytest.fixture(scope="session")
+def app():
+    """main, imported once for the test session"""
+    import main
+    return main
@@ -0,0 +1,179 @@
+# tests/test_llm_resilience.py
+import gc
+import asyncio
+
+import pytest
+
+import llm_resilience
+from llm_resilience import ResilientLLM, CircuitBreaker, LLMUnavailable, MIN_HEDGE_SAMPLES
+from llm_scheduler import LLMScheduler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "LLM_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(llm_resilience, "LLM_HEDGE_MIN_DELAY", 0.01)
+
+
+def resilient(**kwargs):
+    kwargs.setdefault("retries", 2)
+    kwargs.setdefault("hedge", False)
+    return ResilientLLM(scheduler=LLMScheduler(max_concurrency=8, initial_concurrency=8), **kwargs)
+
+
+def flaky(fake_llm, failures, prompts=None):
+    """Request factory whose first `failures` attempts get a 503 from the fake provider"""
+    model = fake_llm.FakeGenerativeModel()
+    attempts = []
+
+    def request():
+        attempts.append(1)
+        fail = len(attempts) <= failures
+        prompt = prompts[len(attempts) - 1] if prompts else "hello"
+        return model.generate_content_async(prompt) if not fail else unavailable(fake_llm)
+    return request, attempts
+
+
+async def unavailable(fake_llm):
+    raise fake_llm.FakeUnavailable()
+
+
+def test_retries_provider_errors_until_one_attempt_succeeds(fake_llm):
+    llm = resilient()
+    request, attempts = flaky(fake_llm, failures=2)
+    response = run(llm.call(request))
+    assert response.text.startswith("Fake reply")
+    assert len(attempts) == 3
+    assert llm.retried == 2
+
+
+def test_gives_up_after_the_retry_budget(fake_llm):
+    llm = resilient(retries=1)
+    request, attempts = flaky(fake_llm, failures=5)
+    with pytest.raises(fake_llm.FakeUnavailable):
+        run(llm.call(request))
+    assert len(attempts) == 2
+
+
+def test_does_not_retry_other_errors(fake_llm):
+    llm = resilient()
+    attempts = []
+
+    async def bad_request():
+        attempts.append(1)
+        raise ValueError("invalid argument")
+
+    with pytest.raises(ValueError):
+        run(llm.call(bad_request))
+    assert len(attempts) == 1
+
+
+def test_abandons_a_stalled_attempt_and_retries(fake_llm, monkeypatch):
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_STALL_RATE", 1.0)
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_STALL_SECONDS", 10)
+    llm = resilient(call_timeout=0.05, retries=1)
+    model = fake_llm.FakeGenerativeModel()
+    with pytest.raises(asyncio.TimeoutError):
+        run(llm.call(lambda: model.generate_content_async("hello")))
+    assert llm.timeouts == 2
+    assert fake_llm._Load.active == 0
+
+
+def test_hedge_wins_when_the_first_attempt_is_slow(fake_llm):
+    llm = resilient(hedge=True)
+    for _ in range(MIN_HEDGE_SAMPLES):
+        llm.latency.add("reply", 0.01)
+    # The fake takes the latency in a "[fake latency=... reply=...]" directive
+    request, attempts = flaky(fake_llm, failures=0, prompts=["[fake latency=5 reply=10]", "[fake latency=0 reply=10]"])
+    response = run(asyncio.wait_for(llm.call(request), 2))
+    assert response.text
+    assert len(attempts) == 2
+    assert (llm.hedges, llm.hedges_won) == (1, 1)
+    assert fake_llm._Load.active == 0  # the losing attempt was cancelled and gave its capacity back
+
+
+def test_no_hedge_without_latency_history(fake_llm):
+    llm = resilient(hedge=True)
+    request, attempts = flaky(fake_llm, failures=0)
+    run(llm.call(request))
+    assert llm.hedges == 0
+
+
+def test_stream_retries_before_the_first_chunk_and_releases_capacity(fake_llm):
+    llm = resilient()
+    model = fake_llm.FakeGenerativeModel()
+    attempts = []
+
+    def request():
+        attempts.append(1)
+        if len(attempts) == 1:
+            return unavailable(fake_llm)
+        return model.generate_content_async("stream me", stream=True)
+
+    async def consume():
+        async with llm.stream(request) as chunks:
+            return "".join([chunk.text async for chunk in chunks])
+
+    assert run(consume()).startswith("Fake reply")
+    assert len(attempts) == 2
+    assert fake_llm._Load.active == 0
+    assert llm.scheduler.in_flight == 0
+
+
+def test_unread_fake_stream_gives_its_capacity_back(fake_llm, monkeypatch):
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_CAPACITY", 1)
+    model = fake_llm.FakeGenerativeModel()
+
+    async def abandon_then_call():
+        stream = await model.generate_content_async("never read", stream=True)
+        del stream
+        gc.collect()
+        return await model.generate_content_async("next")
+
+    assert run(abandon_then_call()).text
+    assert fake_llm._Load.active == 0
+
+
+def test_breaker_opens_then_half_open_trial_decides(fake_llm, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    llm = resilient(retries=0, breaker=breaker)
+    model = fake_llm.FakeGenerativeModel()
+    call = lambda: llm.call(lambda: model.generate_content_async("hello"))
+
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_ERROR_RATE", 1.0)
+    for _ in range(2):
+        with pytest.raises(fake_llm.FakeUnavailable):
+            run(call())
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Open: fails fast without calling the provider
+    attempts = llm.attempts
+    with pytest.raises(LLMUnavailable):
+        run(call())
+    assert llm.attempts == attempts
+
+    # Half-open: a failed trial opens it again at once
+    run(asyncio.sleep(0.06))
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(fake_llm.FakeUnavailable):
+        run(call())
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opens == 2
+
+    # Half-open again: one trial at a time, and a successful one closes the breaker
+    run(asyncio.sleep(0.06))
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_ERROR_RATE", 0.0)
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_LATENCY", 0.05)
+
+    async def trial_and_second_call():
+        return await asyncio.gather(call(), call(), return_exceptions=True)
+
+    trial, second = run(trial_and_second_call())
+    assert trial.text
+    assert isinstance(second, LLMUnavailable)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
@@ -0,0 +1,103 @@
+# tests/test_llm_scheduler.py
+import asyncio
+
+import pytest
+
+from llm_scheduler import LLMScheduler, LLMOverloaded, INTERACTIVE, SUMMARY, BACKGROUND
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def call_fake(scheduler, model, priority=INTERACTIVE):
+    async with scheduler.slot(priority):
+        return await model.generate_content_async("hello")
+
+
+def test_throttling_caps_the_limit_below_the_calls_in_flight(fake_llm, monkeypatch):
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_CAPACITY", 3)
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_LATENCY", 0.05)
+    scheduler = LLMScheduler(max_concurrency=16, initial_concurrency=8)
+    model = fake_llm.FakeGenerativeModel()
+
+    async def burst():
+        return await asyncio.gather(*(call_fake(scheduler, model) for _ in range(8)), return_exceptions=True)
+
+    results = run(burst())
+    # The 4th call is refused; the limit drops to the 3 still running, so the rest queue instead of failing
+    assert [isinstance(r, fake_llm.FakeThrottled) for r in results] == [False] * 3 + [True] + [False] * 4
+    assert scheduler.throttled == 1
+    assert scheduler.decreases == 1
+    assert 3 <= scheduler.limit < 5  # then +1/limit for each of the 7 successes
+    assert scheduler.in_flight == 0
+
+
+def test_a_burst_of_throttles_backs_off_once(fake_llm, monkeypatch):
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_THROTTLE_RATE", 1.0)
+    scheduler = LLMScheduler(max_concurrency=16, initial_concurrency=16)
+    model = fake_llm.FakeGenerativeModel()
+
+    async def burst():
+        return await asyncio.gather(*(call_fake(scheduler, model) for _ in range(8)), return_exceptions=True)
+
+    results = run(burst())
+    assert all(isinstance(r, fake_llm.FakeThrottled) for r in results)
+    assert scheduler.throttled == 8
+    assert scheduler.decreases == 1  # one halving for the burst, not eight
+    assert scheduler.limit == 1  # each 429 still caps it below the calls then in flight
+
+
+def test_successes_raise_the_limit_additively(fake_llm):
+    scheduler = LLMScheduler(max_concurrency=4, initial_concurrency=2)
+    model = fake_llm.FakeGenerativeModel()
+
+    async def calls(n):
+        for _ in range(n):
+            await call_fake(scheduler, model)
+
+    run(calls(2))
+    assert scheduler.limit == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+    run(calls(50))
+    assert scheduler.limit == 4
+
+
+def test_waiting_calls_start_by_priority_then_arrival():
+    scheduler = LLMScheduler(max_concurrency=1, initial_concurrency=1)
+    order = []
+
+    async def waiter(name, priority):
+        async with scheduler.slot(priority):
+            order.append(name)
+
+    async def scenario():
+        async with scheduler.slot(INTERACTIVE):
+            tasks = []
+            for name, priority in [("title-1", BACKGROUND), ("summary", SUMMARY), ("chat-1", INTERACTIVE),
+                                   ("title-2", BACKGROUND), ("chat-2", INTERACTIVE)]:
+                tasks.append(asyncio.create_task(waiter(name, priority)))
+                await asyncio.sleep(0)
+            assert scheduler.queued == 5
+        await asyncio.gather(*tasks)
+
+    run(scenario())
+    assert order == ["chat-1", "chat-2", "summary", "title-1", "title-2"]
+
+
+def test_full_queue_and_queue_deadline_raise_overloaded():
+    scheduler = LLMScheduler(max_concurrency=1, initial_concurrency=1, queue_limit=1,
+                             queue_timeouts={INTERACTIVE: 0.05, SUMMARY: 0.05, BACKGROUND: 0.05})
+
+    async def scenario():
+        async with scheduler.slot():
+            waiting = asyncio.create_task(scheduler.slot().__aenter__())
+            await asyncio.sleep(0)
+            with pytest.raises(LLMOverloaded):
+                scheduler.check_admission()
+            with pytest.raises(LLMOverloaded):
+                await waiting
+
+    run(scenario())
+    assert scheduler.rejected == 1
+    assert scheduler.timed_out == 1
+    assert scheduler.in_flight == 0
@@ -0,0 +1,99 @@
+# tests/test_single_flight.py
+import asyncio
+
+import httpx
+import pytest
+
+from single_flight import SingleFlight, FlightFailed
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_duplicates_share_the_leaders_result():
+    flights = SingleFlight()
+    runs = []
+
+    async def request():
+        async with flights.claim("k", 10) as flight:
+            if flight.result is None:
+                runs.append(1)
+                await asyncio.sleep(0.01)
+                flight.result = "reply"
+        return flight.result, flight.shared
+
+    async def scenario():
+        first = await asyncio.gather(request(), request())
+        return first + [await request()]
+
+    assert run(scenario()) == [("reply", None), ("reply", "coalesced"), ("reply", "replayed")]
+    assert len(runs) == 1
+
+
+def test_duplicates_get_the_leaders_failure_without_rerunning():
+    flights = SingleFlight()
+    runs = []
+
+    async def request():
+        async with flights.claim("k", 10) as flight:
+            if flight.result is None:
+                runs.append(1)
+                await asyncio.sleep(0.01)
+                raise ValueError("upstream failed")
+        return flight.result
+
+    async def scenario():
+        return await asyncio.gather(request(), request(), request(), return_exceptions=True)
+
+    results = run(scenario())
+    assert [type(r) for r in results] == [ValueError] * 3
+    assert len(runs) == 1
+    assert flights.stats()["results"] == 0  # a failure is not replayed to later requests
+
+
+def test_cancelled_leader_fails_its_duplicates():
+    flights = SingleFlight()
+
+    async def request():
+        async with flights.claim("k", 10) as flight:
+            if flight.result is None:
+                await asyncio.sleep(10)
+        return flight.result
+
+    async def scenario():
+        leader = asyncio.create_task(request())
+        await asyncio.sleep(0)
+        duplicate = asyncio.create_task(request())
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(leader, duplicate, return_exceptions=True)
+
+    leader, duplicate = run(scenario())
+    assert isinstance(leader, asyncio.CancelledError)
+    assert isinstance(duplicate, FlightFailed)
+
+
+def test_failed_chat_turn_saves_the_user_message_once(app, fake_llm, monkeypatch):
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_LATENCY", 0.1)
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_ERROR_RATE", 1.0)
+    monkeypatch.setattr(app.resilient_llm, "retries", 0)
+    monkeypatch.setattr(app.resilient_llm, "breaker", type(app.resilient_llm.breaker)())
+    coalesced = app.chat_flights.coalesced
+    body = {"session_id": "single-flight-failure", "message": "Plan a weekend in Goa", "persona": "travel"}
+
+    async def scenario():
+        async with app.app.router.lifespan_context(app.app):
+            transport = httpx.ASGITransport(app=app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses = await asyncio.gather(client.post("/api/chat", json=body),
+                                                 client.post("/api/chat", json=body))
+                history = await client.get("/api/history", params={"session_id": body["session_id"]})
+        return responses, history
+
+    responses, history = run(scenario())
+    assert [r.status_code for r in responses] == [responses[0].status_code] * 2
+    assert responses[0].status_code >= 500
+    assert app.chat_flights.coalesced == coalesced + 1
+    messages = history.json()["messages"]
+    assert [(m["role"], m["content"]) for m in messages] == [("user", body["message"])]
@@ -0,0 +1,254 @@
+# title_worker.py
+"""
+Background title generation.
+
+/api/chat only enqueues a row in `title_jobs` (one per session, so repeated
+requests collapse into a single pending job); a worker picks due jobs up,
+asks Gemini for a title and stores it on the session row. Failed attempts
+are retried with exponential backoff, and the last attempt falls back to the
+first words of the conversation.
+
+By default the worker runs inside the API process (TITLE_WORKER=inprocess).
+Set TITLE_WORKER=external and run it on its own to scale titling separately:
+
+    python title_worker.py
+
+New titles are published as `titled` session events; an external worker
+needs SESSION_EVENTS_BACKEND=redis for clients to see them live.
+"""
+import os
+import time
+import random
+import asyncio
+from typing import List
+
+from sqlalchemy import select, update, delete, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import (
+    ChatMessage, ChatSession, TitleJob, session_key_of, bump_sessions_version, shards, shard_for,
+)
+from llm import model_registry
+from llm_scheduler import BACKGROUND
+from llm_resilience import resilient_llm
+from session_events import session_events
+from metrics import stage, report_error
+
+TITLE_WORKER_MODE = os.getenv("TITLE_WORKER", "inprocess")  # "inprocess" or "external"
+TITLE_MAX_ATTEMPTS = 3
+TITLE_RETRY_BASE_DELAY = 2.0  # seconds, doubled per attempt
+TITLE_LEASE_SECONDS = 60  # a crashed worker's job becomes claimable again after this
+TITLE_POLL_INTERVAL = float(os.getenv("TITLE_POLL_INTERVAL", "1.0"))
+TITLE_WORKER_CONCURRENCY = int(os.getenv("TITLE_WORKER_CONCURRENCY", "4"))
+
+
+def is_greeting(message: str) -> bool:
+    """Check if message is just a greeting"""
+    greetings = [
+        "hi", "hello", "hey", "hii", "hiii", "hiiii", "helo", "helo",
+        "yo", "sup", "wassup", "whatsup", "namaste", "namaskar",
+        "good morning", "good afternoon", "good evening", "good night",
+        "gm", "gn", "morning", "evening"
+    ]
+    msg_lower = message.lower().strip().strip('!.,?')
+    return msg_lower in greetings or len(message.strip()) < 3
+
+def fallback_title(messages: List[ChatMessage]) -> str:
+    """Use the first non-greeting message as a title"""
+    for m in messages:
+        if m.role == "user" and not is_greeting(m.content):
+            words = m.content.split()[:5]
+            return " ".join(words) + ("..." if len(m.content.split()) > 5 else "")
+    return "New Chat"
+
+async def generate_title_from_conversation(messages: List[ChatMessage], raise_errors: bool = False) -> str:
+    """Generate a meaningful title from conversation context (first 3 messages)"""
+    try:
+        # Get first 3 user messages (skip greetings)
+        user_messages = [m.content for m in messages if m.role == "user" and not is_greeting(m.content)][:3]
+
+        if not user_messages:
+            return "New Chat"
+
+        # Combine messages for context
+        context = " | ".join(user_messages)
+
+        title_model = model_registry.plain()
+        prompt = f"""Based on this conversation context, generate a very short, meaningful title (max 4-5 words).
+Context: {context}
+
+Rules:
+- Be specific and descriptive
+- Use proper spelling (fix any typos in context)
+- Focus on the main topic/intent
+- Don't use greetings
+- Return ONLY the title, nothing else
+
+Title:"""
+        # Titles yield to interactive chat for upstream capacity; failed jobs are retried by the worker
+        with stage("title"):
+            response = await resilient_llm.call(lambda: title_model.generate_content_async(prompt), BACKGROUND, retries=0)
+        title = response.text.strip().strip('"').strip("'").strip('.')
+        # Limit to 50 chars
+        return title[:50] if len(title) > 50 else title
+    except Exception:
+        if raise_errors:
+            raise
+        return fallback_title(messages)
+
+def enqueue_title_job(db: Session, session_id: str):
+    """
+    Request a (re)title for a session. Added to the caller's transaction; a job that is
+    already pending is bumped to run now instead of being duplicated.
+    """
+    now = time.time()
+    bump = (
+        update(TitleJob)
+        .where(TitleJob.session_id == session_id)
+        .values(version=TitleJob.version + 1, attempts=0, next_attempt_at=now)
+    )
+    if db.execute(bump).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.add(TitleJob(session_id=session_id, version=1, attempts=0, next_attempt_at=now))
+    except IntegrityError:
+        # Another request inserted it first; just bump that one
+        db.execute(bump)
+
+async def set_session_title(db: AsyncSession, session_id: str, title: str) -> bool:
+    """Store a generated title on the session row (no-op if the session was deleted meanwhile)"""
+    result = await db.execute(update(ChatSession).where(ChatSession.session_id == session_id).values(title=title))
+    if not result.rowcount:
+        return False
+    await db.execute(bump_sessions_version())
+    return True
+
+
+class TitleWorker:
+    """Polls `title_jobs` and generates titles; safe to run in several processes at once"""
+
+    def __init__(self, poll_interval: float = TITLE_POLL_INTERVAL, concurrency: int = TITLE_WORKER_CONCURRENCY):
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._first_shard = 0
+
+    def notify(self):
+        """Wake the worker early (used when the API enqueues a job in-process)"""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    async def run(self):
+        while not self._stopping:
+            try:
+                processed = await self.run_once()
+            except Exception:
+                report_error("title worker")
+                processed = 0
+            if processed:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def run_once(self) -> int:
+        """Claim and process one batch of due jobs; returns how many were claimed"""
+        claimed = []
+        # Shards take turns going first, so a backlog on one does not starve the others
+        for i in range(len(shards)):
+            if len(claimed) >= self.concurrency:
+                break
+            shard = shards[(self._first_shard + i) % len(shards)]
+            claimed += await self._claim(shard.AsyncSessionLocal, self.concurrency - len(claimed))
+        self._first_shard = (self._first_shard + 1) % len(shards)
+        if claimed:
+            await asyncio.gather(*(self._process(*job) for job in claimed))
+        return len(claimed)
+
+    async def _claim(self, session_factory, limit: int):
+        now = time.time()
+        claimed = []
+        async with session_factory() as db:
+            due = (await db.execute(
+                select(TitleJob.session_id, TitleJob.version, TitleJob.attempts)
+                .where(
+                    TitleJob.next_attempt_at <= now,
+                    or_(TitleJob.leased_until.is_(None), TitleJob.leased_until < now)
+                )
+                .order_by(TitleJob.next_attempt_at.asc())
+                .limit(limit)
+            )).all()
+            for session_id, version, attempts in due:
+                # Conditional update so only one worker wins each job
+                result = await db.execute(
+                    update(TitleJob)
+                    .where(
+                        TitleJob.session_id == session_id,
+                        TitleJob.version == version,
+                        or_(TitleJob.leased_until.is_(None), TitleJob.leased_until < now)
+                    )
+                    .values(leased_until=now + TITLE_LEASE_SECONDS)
+                )
+                if result.rowcount:
+                    claimed.append((session_id, version, attempts))
+            await db.commit()
+        return claimed
+
+    async def _process(self, session_id: str, version: int, attempts: int):
+        shard = shard_for(session_id)
+        # Read on the read pool and write afterwards, so the writer connection is not held during the LLM call
+        async with shard.AsyncReadSessionLocal() as db:
+            messages = (await db.scalars(
+                select(ChatMessage).where(
+                    ChatMessage.session_key == session_key_of(session_id)
+                ).order_by(ChatMessage.id.asc())
+            )).all()
+
+        if not messages:
+            # Session was cleared or deleted in the meantime
+            async with shard.AsyncSessionLocal() as db:
+                await db.execute(delete(TitleJob).where(TitleJob.session_id == session_id))
+                await db.commit()
+            return
+
+        last_attempt = attempts + 1 >= TITLE_MAX_ATTEMPTS
+        try:
+            title = await generate_title_from_conversation(messages, raise_errors=not last_attempt)
+        except Exception as e:
+            delay = TITLE_RETRY_BASE_DELAY * (2 ** attempts) * random.uniform(0.5, 1.5)
+            print(f"Title generation failed for {session_id} (attempt {attempts + 1}): {e}")
+            async with shard.AsyncSessionLocal() as db:
+                await db.execute(
+                    update(TitleJob)
+                    .where(TitleJob.session_id == session_id)
+                    .values(attempts=TitleJob.attempts + 1, next_attempt_at=time.time() + delay, leased_until=None)
+                )
+                await db.commit()
+            return
+
+        async with shard.AsyncSessionLocal() as db:
+            titled = await set_session_title(db, session_id, title)
+            done = await db.execute(
+                delete(TitleJob).where(TitleJob.session_id == session_id, TitleJob.version == version)
+            )
+            if not done.rowcount:
+                # Re-requested while we were working (e.g. 3rd message arrived); run again
+                await db.execute(
+                    update(TitleJob).where(TitleJob.session_id == session_id).values(leased_until=None)
+                )
+            await db.commit()
+        if titled:
+            await session_events.publish("titled", session_id, title=title)
+
+if __name__ == "__main__":
+    print(f"Title worker started (poll every {TITLE_POLL_INTERVAL}s, {TITLE_WORKER_CONCURRENCY} at a time)")
+    asyncio.run(TitleWorker().run())
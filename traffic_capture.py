@@ -0,0 +1,143 @@
+# traffic_capture.py
+"""
+Opt-in capture of request shapes for offline replay (benchmarks/replay.py).
+
+With TRAFFIC_CAPTURE=/path/traffic.jsonl, CaptureMiddleware appends one JSON
+line per finished request:
+
+    {"t": 1760690000.123, "m": "POST", "ep": "/api/chat", "st": 200, "ms": 812.4,
+     "s": "3f9c0a1b2d4e", "p": "travel", "len": 42, "d": 7, "llm": 790.1, "out": 512}
+
+  t    arrival time (epoch seconds)      ep/m/st/ms  route template, method, status, duration
+  s    session id, keyed-hashed           p           persona
+  len  message length (chars)             d           session depth (messages incl. this one)
+  llm  upstream LLM time (ms)             out         reply length (chars)
+  c    reply came from the response cache w           search query word count
+
+Nothing a user typed is stored: only lengths and counts, and session ids are
+HMAC-SHA256 hashed with TRAFFIC_CAPTURE_SALT (random per process when unset;
+set the same salt on every worker so a session keeps one hash across them).
+TRAFFIC_CAPTURE_SAMPLE keeps that fraction of sessions (whole sessions, so
+depths stay consistent); requests without a session are always kept.
+
+Lines are buffered and appended with one write per flush (on the first
+request CAPTURE_FLUSH_SECONDS after the last one, and at shutdown), so
+workers can share a file.
+"""
+import os
+import hmac
+import time
+import hashlib
+from contextvars import ContextVar
+from typing import Optional
+
+import orjson
+
+TRAFFIC_CAPTURE = os.getenv("TRAFFIC_CAPTURE", "")  # output file; empty = off
+TRAFFIC_CAPTURE_SALT = os.getenv("TRAFFIC_CAPTURE_SALT", "").encode() or os.urandom(16)
+TRAFFIC_CAPTURE_SAMPLE = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE", "1.0"))
+CAPTURE_FLUSH_SECONDS = 1.0
+CAPTURE_FLUSH_BYTES = 64 * 1024
+
+_record: ContextVar[Optional[dict]] = ContextVar("capture_record", default=None)
+
+
+def session_hash(session_id: str) -> str:
+    return hmac.new(TRAFFIC_CAPTURE_SALT, session_id.encode(), hashlib.sha256).hexdigest()[:12]
+
+
+def annotate(session_id: Optional[str] = None, **fields):
+    """Add shape fields to the current request's capture record (no-op when capture is off)"""
+    record = _record.get()
+    if record is None:
+        return
+    if session_id is not None:
+        record["s"] = session_hash(session_id)
+    record.update((k, v) for k, v in fields.items() if v is not None)
+
+
+class upstream_timer:
+    """Adds the block's duration to the record's `llm` milliseconds"""
+
+    __slots__ = ("start",)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        record = _record.get()
+        if record is not None:
+            record["llm"] = round(record.get("llm", 0) + (time.perf_counter() - self.start) * 1000, 1)
+
+
+class TrafficLog:
+    """Append-only JSON-lines file written in whole-line batches"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._lines = []
+        self._size = 0
+        self._flushed_at = time.monotonic()
+        self.records = 0
+
+    def append(self, record: dict):
+        line = orjson.dumps(record) + b"\n"
+        self._lines.append(line)
+        self._size += len(line)
+        self.records += 1
+        if self._size >= CAPTURE_FLUSH_BYTES or time.monotonic() - self._flushed_at >= CAPTURE_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            os.write(self._fd, b"".join(self._lines))  # one O_APPEND write: lines never interleave
+            self._lines, self._size = [], 0
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        self.flush()
+        os.close(self._fd)
+
+
+def _sampled(record: dict) -> bool:
+    if TRAFFIC_CAPTURE_SAMPLE >= 1.0 or "s" not in record:
+        return True
+    return int(record["s"][:8], 16) / 0xFFFFFFFF < TRAFFIC_CAPTURE_SAMPLE
+
+
+class CaptureMiddleware:
+    """ASGI middleware writing one capture record per HTTP request to `log`"""
+
+    def __init__(self, app, log: TrafficLog):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        record = {"t": round(time.time(), 3), "m": scope["method"]}
+        token = _record.set(record)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _record.reset(token)
+            route = scope.get("route")
+            record["ep"] = getattr(route, "path", None) or "unmatched"
+            record["st"] = status
+            record["ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if _sampled(record):
+                self.log.append(record)
+
+
+traffic_log = TrafficLog(TRAFFIC_CAPTURE) if TRAFFIC_CAPTURE else None